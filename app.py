@@ -44,10 +44,12 @@ api_stack = ApiStack(
                         delete_artist_handler=lambda_stack.delete_artist_handler,
                         get_albums_by_artist_handler=lambda_stack.get_albums_by_artist_handler,
                         get_songs_by_artist_handler=lambda_stack.get_songs_by_artist_handler,
+                        get_job_handler=lambda_stack.get_job_handler,
                         subscribe_handler=lambda_stack.subscribe_handler,
                         unsubscribe_handler=lambda_stack.unsubscribe_handler,
                         get_user_subscriptions_handler=lambda_stack.get_user_subscriptions_handler,
                         toggle_notifications_handler=lambda_stack.toggle_notifications_handler,
+                        get_feed_handler=lambda_stack.get_feed_handler,
                         login_handler=lambda_stack.login_handler,
                         refresh_handler=lambda_stack.refresh_handler,
                         register_handler=lambda_stack.register_handler,
@@ -1,13 +1,15 @@
 import json
-import boto3
 import os
 import uuid
 from datetime import datetime
 
-# Initialize AWS services
-dynamodb = boto3.resource('dynamodb')
-lambda_client = boto3.client('lambda')
-table = dynamodb.Table(os.environ['TABLE_NAME'])
+from common import clients
+from common.auth import is_admin
+from common.cache import get_metadata, invalidate_metadata
+from common.dynamo import transact_write, TransactionCancelled
+from common.sharding import shard_for
+from common.responses import json_response, error_response, parse_json_body
+from common.stage_cache import catalog_paths, refresh
 
 def handler(event, context):
     """
@@ -16,76 +18,27 @@ def handler(event, context):
     """
     try:
         # Verify user is admin
-        authorizer = event.get('requestContext', {}).get('authorizer', {})
-        groups = authorizer.get('claims', {}).get('cognito:groups', [])
-        
-        if isinstance(groups, str):
-            groups = [groups]
-        
-        if 'admin' not in groups:
-            return {
-                'statusCode': 403,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Only admins can create albums'
-                })
-            }
+        if not is_admin(event):
+            return error_response(403, 'Only admins can create albums')
         
         # Parse request body
         try:
-            body = json.loads(event.get('body', '{}'))
-        except json.JSONDecodeError:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Invalid JSON in request body'
-                })
-            }
+            body = parse_json_body(event)
+        except ValueError:
+            return error_response(400, 'Invalid JSON in request body')
         
         # Validate required fields
         required_fields = ['title', 'artist_id']
         for field in required_fields:
             if field not in body or not body[field]:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'message': f'Missing required field: {field}'
-                    })
-                }
+                return error_response(400, f'Missing required field: {field}')
         
-        # Verify artist exists
+        # Verify artist exists (popular artists come from the METADATA cache)
         artist_id = body['artist_id']
-        artist_response = table.get_item(
-            Key={
-                'pk': f'ARTIST#{artist_id}',
-                'sk': 'METADATA'
-            }
-        )
+        artist = get_metadata('ARTIST', artist_id)
         
-        if 'Item' not in artist_response:
-            return {
-                'statusCode': 404,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Artist not found'
-                })
-            }
-        
-        artist = artist_response['Item']
+        if artist is None:
+            return error_response(404, 'Artist not found')
         
         # Generate album ID
         album_id = str(uuid.uuid4())
@@ -96,9 +49,11 @@ def handler(event, context):
             'pk': f'ALBUM#{album_id}',
             'sk': 'METADATA',
             'entity_type': 'ALBUM',
+            'entity_shard': shard_for('ALBUM', album_id),
             'album_id': album_id,
             'title': body['title'],
             'artist_id': artist_id,
+            'artist_albums': artist_id,  # Sparse key for artist-albums-index
             'artist_name': artist['name'],
             'release_date': body.get('release_date', ''),
             'genre': body.get('genre', ''),
@@ -109,28 +64,30 @@ def handler(event, context):
             'updated_at': timestamp
         }
         
-        # Save album to DynamoDB
-        table.put_item(Item=album_item)
-        
-        # Increment artist's total_albums counter
-        table.update_item(
-            Key={
-                'pk': f'ARTIST#{artist_id}',
-                'sk': 'METADATA'
-            },
-            UpdateExpression='SET total_albums = if_not_exists(total_albums, :zero) + :inc, updated_at = :updated_at',
-            ExpressionAttributeValues={
-                ':zero': 0,
-                ':inc': 1,
-                ':updated_at': timestamp
-            }
-        )
+        # Save album, checking in the same transaction that the artist still
+        # exists (the cached copy may predate a delete). The artist's
+        # total_albums counter is maintained from the table stream
+        # (streams/counters.py).
+        try:
+            transact_write([
+                {'Put': {'Item': album_item, 'ConditionExpression': 'attribute_not_exists(pk)'}},
+                {'ConditionCheck': {'Key': {'pk': f'ARTIST#{artist_id}', 'sk': 'METADATA'}, 'ConditionExpression': 'attribute_exists(pk)'}}
+            ], token=album_id)
+        except TransactionCancelled as e:
+            if e.failed(1):
+                invalidate_metadata('ARTIST', artist_id)
+                return error_response(404, 'Artist not found')
+            raise
+        invalidate_metadata('ALBUM', album_id)
+        refresh(catalog_paths('ALBUM', album_item))
         
         # Trigger email notifications to subscribers (asynchronous)
         try:
             notification_payload = {
                 'event_type': 'album_created',
                 'artist_id': artist_id,
+                'content_id': album_id,
+                'created_at': album_item['created_at'],
                 'content_title': body['title'],
                 'content_details': {
                     'release_date': body.get('release_date', 'Now'),
@@ -140,7 +97,7 @@ def handler(event, context):
             }
             
             # Invoke send_notifications Lambda asynchronously
-            lambda_client.invoke(
+            clients.lambda_client().invoke(
                 FunctionName=os.environ.get('SEND_NOTIFICATIONS_FUNCTION', 'send-notifications'),
                 InvocationType='Event',  # Asynchronous invocation
                 Payload=json.dumps(notification_payload)
@@ -149,28 +106,11 @@ def handler(event, context):
         except Exception as e:
             print(f"Warning: Failed to trigger notifications: {str(e)}")
         
-        return {
-            'statusCode': 201,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Album created successfully',
-                'album': json.loads(json.dumps(album_item, default=str))
-            })
-        }
+        return json_response(201, {
+            'message': 'Album created successfully',
+            'album': album_item
+        })
     
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Error creating album',
-                'error': str(e)
-            })
-        }
+        return error_response(500, 'Error creating album', error=str(e))
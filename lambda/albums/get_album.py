@@ -1,10 +1,8 @@
-import json
-import boto3
-import os
-
-# Initialize DynamoDB
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table(os.environ['TABLE_NAME'])
+from common import conditional
+from common.cache import get_metadata
+from common.projection import Projection, InvalidFields
+from common.responses import json_response, error_response
+from common.stage_cache import bypass_requested
 
 def handler(event, context):
     """
@@ -16,76 +14,37 @@ def handler(event, context):
         album_id = event['pathParameters']['albumId']
         
         if not album_id:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Album ID is required'
-                })
-            }
+            return error_response(400, 'Album ID is required')
+        
+        # Attributes selected with ?fields= or ?view=
+        try:
+            projection = Projection.from_event(event, 'ALBUM')
+        except InvalidFields as e:
+            return error_response(400, str(e))
         
-        # Query DynamoDB for the album
-        response = table.get_item(
-            Key={
-                'pk': f'ALBUM#{album_id}',
-                'sk': 'METADATA'
-            }
-        )
+        # Popular albums are served from the container's METADATA cache,
+        # unless the request refreshes the stage cache
+        item = get_metadata('ALBUM', album_id, refresh=bypass_requested(event))
         
-        if 'Item' not in response:
-            return {
-                'statusCode': 404,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Album not found'
-                })
-            }
+        if item is None:
+            return error_response(404, 'Album not found')
         
-        album = response['Item']
+        # Clients that already hold this version get an empty 304
+        etag = conditional.item_etag(item, projection)
+        not_modified = conditional.check(event, 'get_album', etag)
+        if not_modified:
+            return not_modified
         
-        # Convert to proper JSON format
-        album_dict = json.loads(json.dumps(album, default=str))
+        album = projection.select(item)
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Album retrieved successfully',
-                'album': album_dict
-            })
-        }
+        return json_response(200, {
+            'message': 'Album retrieved successfully',
+            'album': album
+        }, headers=conditional.cache_headers(etag))
     
     except KeyError:
-        return {
-            'statusCode': 400,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Album ID is required in path parameters'
-            })
-        }
+        return error_response(400, 'Album ID is required in path parameters')
     
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Error retrieving album',
-                'error': str(e)
-            })
-        }
+        return error_response(500, 'Error retrieving album', error=str(e))
@@ -1,106 +1,67 @@
-import json
-import boto3
-import os
-
-# Initialize DynamoDB
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table(os.environ['TABLE_NAME'])
+from common import clients, conditional, cursor
+from common.cache import get_metadata
+from common.cursor import InvalidCursor
+from common.pagination import parse_pagination, query_page
+from common.projection import Projection, InvalidFields
+from common.responses import error_response
 
 def handler(event, context):
     """
-    Get all songs in an album by album ID.
+    Get the tracklist of an album by album ID.
     Path parameter: albumId
+    Query parameters: limit, last_key (for pagination)
+    Uses the album-index GSI and keeps reading until the page is full.
     """
     try:
         # Get album ID from path parameters
         album_id = event['pathParameters']['albumId']
         
         if not album_id:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Album ID is required'
-                })
-            }
+            return error_response(400, 'Album ID is required')
         
-        # First, verify the album exists
-        album_response = table.get_item(
-            Key={
-                'pk': f'ALBUM#{album_id}',
-                'sk': 'METADATA'
-            }
-        )
+        scope = f'album_songs:{album_id}'
+        try:
+            limit, exclusive_start_key = parse_pagination(event, scope)
+            projection = Projection.from_event(event, 'SONG')
+        except InvalidCursor:
+            return error_response(400, 'Invalid pagination cursor')
+        except InvalidFields as e:
+            return error_response(400, str(e))
+        table = clients.table()
         
-        if 'Item' not in album_response:
-            return {
-                'statusCode': 404,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Album not found'
-                })
-            }
+        # First, verify the album exists (popular ones come from the METADATA cache)
+        album = get_metadata('ALBUM', album_id)
         
-        album = album_response['Item']
+        if album is None:
+            return error_response(404, 'Album not found')
         
-        # Query for all songs with this album ID
-        scan_params = {
-            'FilterExpression': 'album = :album_id',
+        # Query the album-index GSI. The album item itself shares the partition
+        # with its songs, so it is filtered out and the page is refilled until
+        # `limit` songs are collected or the partition is exhausted.
+        query_params = {
+            'IndexName': 'album-index',
+            'KeyConditionExpression': 'album_id = :album_id',
+            'FilterExpression': 'entity_type = :entity_type',
             'ExpressionAttributeValues': {
-                ':album_id': album_id
+                ':album_id': album_id,
+                ':entity_type': 'SONG'
             }
         }
         
-        response = table.scan(**scan_params)
+        query_params = projection.apply(query_params)
+        songs, last_key = query_page(table, query_params, limit, exclusive_start_key)
         
-        # Convert Decimal to float for JSON serialization
-        items = []
-        for item in response.get('Items', []):
-            item_dict = json.loads(json.dumps(item, default=str))
-            items.append(item_dict)
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Album songs retrieved successfully',
-                'album': json.loads(json.dumps(album, default=str)),
-                'songs_count': len(items),
-                'songs': items
-            })
-        }
+        return conditional.page_response(event, 'get_album_songs', {
+            'message': 'Album songs retrieved successfully',
+            'album': album,
+            'songs_count': len(songs),
+            'songs': songs,
+            'last_key': cursor.encode(last_key, scope)  # For pagination
+        })
     
     except KeyError:
-        return {
-            'statusCode': 400,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Album ID is required in path parameters'
-            })
-        }
+        return error_response(400, 'Album ID is required in path parameters')
     
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Error retrieving album songs',
-                'error': str(e)
-            })
-        }
+        return error_response(500, 'Error retrieving album songs', error=str(e))
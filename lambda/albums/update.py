@@ -1,11 +1,10 @@
-import json
-import boto3
-import os
 from datetime import datetime
 
-# Initialize DynamoDB
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table(os.environ['TABLE_NAME'])
+from common import clients
+from common.auth import is_admin
+from common.cache import invalidate_metadata
+from common.responses import json_response, error_response, parse_json_body
+from common.stage_cache import catalog_paths, refresh
 
 def handler(event, context):
     """
@@ -18,61 +17,19 @@ def handler(event, context):
         album_id = event['pathParameters']['albumId']
         
         if not album_id:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Album ID is required'
-                })
-            }
+            return error_response(400, 'Album ID is required')
         
         # Verify user is admin
-        authorizer = event.get('requestContext', {}).get('authorizer', {})
-        
-        # Try to get groups from different possible locations
-        groups = []
-        
-        # First try from claims (standard Cognito)
-        if 'claims' in authorizer:
-            groups = authorizer.get('claims', {}).get('cognito:groups', [])
-        
-        # If not found, check if groups are at top level
-        if not groups and 'cognito:groups' in authorizer:
-            groups = authorizer.get('cognito:groups', [])
-        
-        # Handle case where groups is a string instead of list
-        if isinstance(groups, str):
-            groups = [groups]
-        
-        if 'admin' not in groups:
-            return {
-                'statusCode': 403,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Only admins can update albums'
-                })
-            }
+        if not is_admin(event):
+            return error_response(403, 'Only admins can update albums')
         
         # Parse request body
         try:
-            body = json.loads(event.get('body', '{}'))
-        except json.JSONDecodeError:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Invalid JSON in request body'
-                })
-            }
+            body = parse_json_body(event)
+        except ValueError:
+            return error_response(400, 'Invalid JSON in request body')
+        
+        table = clients.table()
         
         # Verify album exists
         response = table.get_item(
@@ -83,16 +40,7 @@ def handler(event, context):
         )
         
         if 'Item' not in response:
-            return {
-                'statusCode': 404,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Album not found'
-                })
-            }
+            return error_response(404, 'Album not found')
         
         # Build update expression
         update_attrs = {}
@@ -107,16 +55,7 @@ def handler(event, context):
                 expression_parts.append(f'{field} = :{field}')
         
         if not expression_parts:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': f'No valid fields to update. Allowed fields: {", ".join(allowed_fields)}'
-                })
-            }
+            return error_response(400, f'No valid fields to update. Allowed fields: {", ".join(allowed_fields)}')
         
         # Add updated_at timestamp
         update_attrs[':updated_at'] = datetime.utcnow().isoformat()
@@ -135,43 +74,20 @@ def handler(event, context):
             ReturnValues='ALL_NEW'
         )
         
-        updated_album = response['Attributes']
-        album_dict = json.loads(json.dumps(updated_album, default=str))
+        album = response['Attributes']
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Album updated successfully',
-                'album': album_dict
-            })
-        }
+        # Drop the cached copies and refresh the stage cache so readers see the change
+        invalidate_metadata('ALBUM', album_id)
+        refresh(catalog_paths('ALBUM', album))
+        
+        return json_response(200, {
+            'message': 'Album updated successfully',
+            'album': album
+        })
     
     except KeyError:
-        return {
-            'statusCode': 400,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Album ID is required in path parameters'
-            })
-        }
+        return error_response(400, 'Album ID is required in path parameters')
     
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Error updating album',
-                'error': str(e)
-            })
-        }
+        return error_response(500, 'Error updating album', error=str(e))
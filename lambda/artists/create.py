@@ -1,12 +1,12 @@
-import json
-import boto3
-import os
 import uuid
 from datetime import datetime
 
-# Initialize DynamoDB
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table(os.environ['TABLE_NAME'])
+from common import clients
+from common.auth import is_admin
+from common.cache import invalidate_metadata
+from common.sharding import shard_for
+from common.responses import json_response, error_response, parse_json_body
+from common.stage_cache import catalog_paths, refresh
 
 def handler(event, context):
     """
@@ -15,64 +15,20 @@ def handler(event, context):
     """
     try:
         # Verify user is admin
-        authorizer = event.get('requestContext', {}).get('authorizer', {})
-        
-        # Try to get groups from different possible locations
-        groups = []
-        
-        # First try from claims (standard Cognito)
-        if 'claims' in authorizer:
-            groups = authorizer.get('claims', {}).get('cognito:groups', [])
-        
-        # If not found, check if groups are at top level
-        if not groups and 'cognito:groups' in authorizer:
-            groups = authorizer.get('cognito:groups', [])
-        
-        # Handle case where groups is a string instead of list
-        if isinstance(groups, str):
-            groups = [groups]
-        
-        if 'admin' not in groups:
-            return {
-                'statusCode': 403,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Only admins can create artists'
-                })
-            }
+        if not is_admin(event):
+            return error_response(403, 'Only admins can create artists')
         
         # Parse request body
         try:
-            body = json.loads(event.get('body', '{}'))
-        except json.JSONDecodeError:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Invalid JSON in request body'
-                })
-            }
+            body = parse_json_body(event)
+        except ValueError:
+            return error_response(400, 'Invalid JSON in request body')
         
         # Validate required fields
         required_fields = ['name']
         for field in required_fields:
             if field not in body or not body[field]:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'message': f'Missing required field: {field}'
-                    })
-                }
+                return error_response(400, f'Missing required field: {field}')
         
         # Generate artist ID
         artist_id = str(uuid.uuid4())
@@ -83,6 +39,7 @@ def handler(event, context):
             'pk': f'ARTIST#{artist_id}',
             'sk': 'METADATA',
             'entity_type': 'ARTIST',
+            'entity_shard': shard_for('ARTIST', artist_id),
             'artist_id': artist_id,
             'name': body['name'],
             'biography': body.get('biography', ''),
@@ -95,31 +52,16 @@ def handler(event, context):
             'updated_at': timestamp
         }
         
-        # Save to DynamoDB
-        table.put_item(Item=artist_item)
+        # Save to DynamoDB, dropping any cached "not found" for the ID
+        clients.table().put_item(Item=artist_item)
+        invalidate_metadata('ARTIST', artist_id)
+        refresh(catalog_paths('ARTIST', artist_item))
         
-        return {
-            'statusCode': 201,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Artist created successfully',
-                'artist': json.loads(json.dumps(artist_item, default=str))
-            })
-        }
+        return json_response(201, {
+            'message': 'Artist created successfully',
+            'artist': artist_item
+        })
     
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Error creating artist',
-                'error': str(e)
-            })
-        }
+        return error_response(500, 'Error creating artist', error=str(e))
@@ -1,10 +1,8 @@
-import json
-import boto3
-import os
-
-# Initialize DynamoDB
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table(os.environ['TABLE_NAME'])
+from common import conditional
+from common.cache import get_metadata
+from common.projection import Projection, InvalidFields
+from common.responses import json_response, error_response
+from common.stage_cache import bypass_requested
 
 def handler(event, context):
     """
@@ -12,64 +10,37 @@ def handler(event, context):
     """
     try:
         # Get artist ID from path parameters
-        artist_id = event.get('pathParameters', {}).get('artistId')
+        artist_id = (event.get('pathParameters') or {}).get('artistId')
         
         if not artist_id:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Missing artist ID'
-                })
-            }
+            return error_response(400, 'Missing artist ID')
+        
+        # Attributes selected with ?fields= or ?view=
+        try:
+            projection = Projection.from_event(event, 'ARTIST')
+        except InvalidFields as e:
+            return error_response(400, str(e))
+        
+        # Popular artists are served from the container's METADATA cache,
+        # unless the request refreshes the stage cache
+        item = get_metadata('ARTIST', artist_id, refresh=bypass_requested(event))
         
-        # Get artist from DynamoDB
-        response = table.get_item(
-            Key={
-                'pk': f'ARTIST#{artist_id}',
-                'sk': 'METADATA'
-            }
-        )
+        if item is None:
+            return error_response(404, 'Artist not found')
         
-        if 'Item' not in response:
-            return {
-                'statusCode': 404,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Artist not found'
-                })
-            }
+        # Clients that already hold this version get an empty 304
+        etag = conditional.item_etag(item, projection)
+        not_modified = conditional.check(event, 'get_artist', etag)
+        if not_modified:
+            return not_modified
         
-        artist = json.loads(json.dumps(response['Item'], default=str))
+        artist = projection.select(item)
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Artist retrieved successfully',
-                'artist': artist
-            })
-        }
+        return json_response(200, {
+            'message': 'Artist retrieved successfully',
+            'artist': artist
+        }, headers=conditional.cache_headers(etag))
     
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Error retrieving artist',
-                'error': str(e)
-            })
-        }
+        return error_response(500, 'Error retrieving artist', error=str(e))
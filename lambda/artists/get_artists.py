@@ -1,103 +1,42 @@
-import json
-import boto3
-import os
-
-# Initialize DynamoDB
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table(os.environ['TABLE_NAME'])
+from common import conditional, cursor, wire
+from common.cursor import InvalidCursor
+from common.pagination import parse_pagination
+from common.projection import Projection, InvalidFields
+from common.sharding import listing_index_key, listing_scope, query_sharded
+from common.responses import error_response
 
 def handler(event, context):
     """
-    Get all artists from the database using GSI.
+    Get all artists from the database using the sharded entity GSI.
     Returns a paginated list of artists.
     """
     try:
-        # Get query parameters for pagination
-        limit = 20  # Default limit
-        exclusive_start_key = None
-        
-        if event.get('queryStringParameters'):
-            params = event['queryStringParameters']
-            if params and params.get('limit'):
-                try:
-                    limit = int(params['limit'])
-                    if limit > 100:
-                        limit = 100  # Max limit of 100
-                except ValueError:
-                    pass
-            
-            if params and params.get('last_key'):
-                try:
-                    exclusive_start_key = json.loads(params['last_key'])
-                except json.JSONDecodeError:
-                    pass
-        
-        # Query using GSI to get all artists efficiently
-        query_params = {
-            'IndexName': 'entity-type-index',
-            'KeyConditionExpression': 'entity_type = :entity_type',
-            'ExpressionAttributeValues': {
-                ':entity_type': 'ARTIST'
-            },
-            'Limit': limit,
-            'ScanIndexForward': False  # Sort by created_at descending (newest first)
-        }
-        
-        if exclusive_start_key:
-            query_params['ExclusiveStartKey'] = exclusive_start_key
-        
-        response = table.query(**query_params)
-        
-        # Convert Decimal to float for JSON serialization
-        items = []
-        for item in response.get('Items', []):
-            item_dict = json.loads(json.dumps(item, default=str))
-            items.append(item_dict)
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Artists retrieved successfully',
-                'count': len(items),
-                'artists': items,
-                'last_key': response.get('LastEvaluatedKey')  # For pagination
-            })
-        }
-        
-        # Convert Decimal to float for JSON serialization
-        items = []
-        for item in response.get('Items', []):
-            item_dict = json.loads(json.dumps(item, default=str))
-            items.append(item_dict)
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Artists retrieved successfully',
-                'count': len(items),
-                'artists': items,
-                'last_key': response.get('LastEvaluatedKey')  # For pagination
-            })
-        }
+        scope = listing_scope('artists')
+        try:
+            limit, exclusive_start_key = parse_pagination(event, scope)
+            projection = Projection.from_event(event, 'ARTIST', required=listing_index_key())
+        except InvalidCursor:
+            return error_response(400, 'Invalid pagination cursor')
+        except InvalidFields as e:
+            return error_response(400, str(e))
+        
+        # Scatter-gather across the listing index shards, newest first
+        items, last_key = query_sharded('ARTIST', limit, exclusive_start_key, projection=projection)
+        projection.strip(items)
+        
+        if wire.enabled():
+            # Fast path: render wire-format items without deserializing them
+            artists = wire.render_items(items)
+        else:
+            artists = [wire.from_wire(item) for item in items]
+        
+        return conditional.page_response(event, 'get_artists', {
+            'message': 'Artists retrieved successfully',
+            'count': len(items),
+            'artists': artists,
+            'last_key': cursor.encode(last_key, scope)  # For pagination
+        })
     
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Error retrieving artists',
-                'error': str(e)
-            })
-        }
+        return error_response(500, 'Error retrieving artists', error=str(e))
@@ -1,10 +1,9 @@
-import json
-import boto3
-import os
-
-# Initialize DynamoDB
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table(os.environ['TABLE_NAME'])
+from common import clients, conditional, cursor, discography
+from common.cache import get_metadata
+from common.cursor import InvalidCursor
+from common.pagination import parse_pagination, query_page, report_page, ReadBudget
+from common.projection import Projection, InvalidFields
+from common.responses import error_response
 
 def handler(event, context):
     """
@@ -13,108 +12,52 @@ def handler(event, context):
     """
     try:
         # Get artist ID from path parameters
-        artist_id = event.get('pathParameters', {}).get('artistId')
+        artist_id = (event.get('pathParameters') or {}).get('artistId')
         
         if not artist_id:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Missing artist ID'
-                })
-            }
-        
-        # Verify artist exists
-        artist_response = table.get_item(
-            Key={
-                'pk': f'ARTIST#{artist_id}',
-                'sk': 'METADATA'
-            }
+            return error_response(400, 'Missing artist ID')
+        
+        # Validate the cursor before any read
+        scope = discography.scope('artist_songs', artist_id)
+        try:
+            limit, exclusive_start_key = parse_pagination(event, scope)
+            projection = Projection.from_event(event, 'SONG', required=discography.key_attributes() or ())
+        except InvalidCursor:
+            return error_response(400, 'Invalid pagination cursor')
+        except InvalidFields as e:
+            return error_response(400, str(e))
+        
+        table = clients.table()
+        
+        # Verify artist exists (popular ones come from the METADATA cache)
+        if get_metadata('ARTIST', artist_id) is None:
+            return error_response(404, 'Artist not found')
+        
+        # Query songs by artist: the sparse artist-songs-index once it is
+        # backfilled, otherwise artist-id-index filtered to songs
+        query_params = discography.query('SONG', artist_id)
+        
+        query_params = projection.apply(query_params)
+        budget = ReadBudget.from_env()
+        items, last_key = query_page(
+            table,
+            query_params,
+            limit,
+            exclusive_start_key,
+            budget=budget,
+            key_attributes=discography.key_attributes()
         )
-        
-        if 'Item' not in artist_response:
-            return {
-                'statusCode': 404,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Artist not found'
-                })
-            }
-        
-        # Get query parameters for pagination
-        limit = 20  # Default limit
-        exclusive_start_key = None
-        
-        if event.get('queryStringParameters'):
-            params = event['queryStringParameters']
-            if params and params.get('limit'):
-                try:
-                    limit = int(params['limit'])
-                    if limit > 100:
-                        limit = 100  # Max limit of 100
-                except ValueError:
-                    pass
-            
-            if params and params.get('last_key'):
-                try:
-                    exclusive_start_key = json.loads(params['last_key'])
-                except json.JSONDecodeError:
-                    pass
-        
-        # Query songs by artist using GSI for efficient filtering
-        query_params = {
-            'IndexName': 'artist-id-index',
-            'KeyConditionExpression': 'artist_id = :artist_id',
-            'FilterExpression': 'begins_with(pk, :song_prefix)',
-            'ExpressionAttributeValues': {
-                ':artist_id': artist_id,
-                ':song_prefix': 'SONG#'
-            },
-            'Limit': limit
-        }
-        
-        if exclusive_start_key:
-            query_params['ExclusiveStartKey'] = exclusive_start_key
-        
-        response = table.query(**query_params)
-        
-        # Convert Decimal to float for JSON serialization
-        items = []
-        for item in response.get('Items', []):
-            item_dict = json.loads(json.dumps(item, default=str))
-            items.append(item_dict)
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Songs retrieved successfully',
-                'artist_id': artist_id,
-                'count': len(items),
-                'songs': items,
-                'last_key': response.get('LastEvaluatedKey')  # For pagination
-            })
-        }
+        projection.strip(items)
+        report_page('get_songs_by_artist', limit, items, last_key, budget)
+        
+        return conditional.page_response(event, 'get_songs_by_artist', {
+            'message': 'Songs retrieved successfully',
+            'artist_id': artist_id,
+            'count': len(items),
+            'songs': items,
+            'last_key': cursor.encode(last_key, scope)  # For pagination
+        })
     
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Error retrieving songs',
-                'error': str(e)
-            })
-        }
+        return error_response(500, 'Error retrieving songs', error=str(e))
@@ -1,77 +1,36 @@
-import json
-import boto3
-import os
 from datetime import datetime
 
-# Initialize DynamoDB
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table(os.environ['TABLE_NAME'])
+from common import clients
+from common.auth import is_admin
+from common.cache import invalidate_metadata
+from common.responses import json_response, error_response, parse_json_body
+from common.stage_cache import catalog_paths, refresh
 
 def handler(event, context):
     """
     Update an artist's metadata.
     Requires admin authorization (checked by API Gateway authorizer).
+    A new name reaches the artist_name copies on songs, albums and
+    subscriptions through the table stream (streams/renames.py).
     """
     try:
         # Verify user is admin
-        authorizer = event.get('requestContext', {}).get('authorizer', {})
-        
-        # Try to get groups from different possible locations
-        groups = []
-        
-        # First try from claims (standard Cognito)
-        if 'claims' in authorizer:
-            groups = authorizer.get('claims', {}).get('cognito:groups', [])
-        
-        # If not found, check if groups are at top level
-        if not groups and 'cognito:groups' in authorizer:
-            groups = authorizer.get('cognito:groups', [])
-        
-        # Handle case where groups is a string instead of list
-        if isinstance(groups, str):
-            groups = [groups]
-        
-        if 'admin' not in groups:
-            return {
-                'statusCode': 403,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Only admins can update artists'
-                })
-            }
+        if not is_admin(event):
+            return error_response(403, 'Only admins can update artists')
         
         # Get artist ID from path parameters
-        artist_id = event.get('pathParameters', {}).get('artistId')
+        artist_id = (event.get('pathParameters') or {}).get('artistId')
         
         if not artist_id:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Missing artist ID'
-                })
-            }
+            return error_response(400, 'Missing artist ID')
         
         # Parse request body
         try:
-            body = json.loads(event.get('body', '{}'))
-        except json.JSONDecodeError:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Invalid JSON in request body'
-                })
-            }
+            body = parse_json_body(event)
+        except ValueError:
+            return error_response(400, 'Invalid JSON in request body')
+        
+        table = clients.table()
         
         # Check if artist exists
         response = table.get_item(
@@ -82,21 +41,12 @@ def handler(event, context):
         )
         
         if 'Item' not in response:
-            return {
-                'statusCode': 404,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Artist not found'
-                })
-            }
+            return error_response(404, 'Artist not found')
         
-        artist = response['Item']
-        
-        # Build update expression
+        # Build update expression. Attribute names are aliased because
+        # `name` is a DynamoDB reserved word.
         update_expression_parts = []
+        expression_attribute_names = {}
         expression_attribute_values = {}
         
         # Updateable fields
@@ -104,24 +54,17 @@ def handler(event, context):
         
         for field in updateable_fields:
             if field in body:
-                update_expression_parts.append(f'{field} = :{field}')
+                update_expression_parts.append(f'#{field} = :{field}')
+                expression_attribute_names[f'#{field}'] = field
                 expression_attribute_values[f':{field}'] = body[field]
         
         if not update_expression_parts:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'No valid fields to update'
-                })
-            }
+            return error_response(400, 'No valid fields to update')
         
         # Add updated_at
         timestamp = datetime.utcnow().isoformat()
-        update_expression_parts.append('updated_at = :updated_at')
+        update_expression_parts.append('#updated_at = :updated_at')
+        expression_attribute_names['#updated_at'] = 'updated_at'
         expression_attribute_values[':updated_at'] = timestamp
         
         # Update the item
@@ -133,34 +76,22 @@ def handler(event, context):
                 'sk': 'METADATA'
             },
             UpdateExpression=update_expression,
+            ExpressionAttributeNames=expression_attribute_names,
             ExpressionAttributeValues=expression_attribute_values,
             ReturnValues='ALL_NEW'
         )
         
-        updated_artist = json.loads(json.dumps(update_response['Attributes'], default=str))
+        updated_artist = update_response['Attributes']
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Artist updated successfully',
-                'artist': updated_artist
-            })
-        }
+        # Drop the cached copies and refresh the stage cache so readers see the change
+        invalidate_metadata('ARTIST', artist_id)
+        refresh(catalog_paths('ARTIST', updated_artist))
+        
+        return json_response(200, {
+            'message': 'Artist updated successfully',
+            'artist': updated_artist
+        })
     
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Error updating artist',
-                'error': str(e)
-            })
-        }
+        return error_response(500, 'Error updating artist', error=str(e))
@@ -0,0 +1,13 @@
+from common.stage_cache import refresh_now
+
+def handler(event, context):
+    """
+    Refresh the API stage cache entries of the paths written by a catalog
+    writer (see common/stage_cache.py). Invoked asynchronously with
+    {'paths': [...]}, so the signed GETs through the stage do not add to
+    the write request. Failures are logged; the entries then expire with
+    their TTL.
+    """
+    paths = event.get('paths') or []
+    refresh_now(paths)
+    return {'refreshed': len(paths)}
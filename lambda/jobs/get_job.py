@@ -0,0 +1,33 @@
+from common import jobs
+from common.auth import is_admin
+from common.responses import json_response, error_response
+
+def handler(event, context):
+    """
+    Get the status and progress of a background job (e.g. an album or artist deletion).
+    Requires admin authorization (checked by API Gateway authorizer).
+    Path parameter: jobId
+    """
+    try:
+        # Verify user is admin
+        if not is_admin(event):
+            return error_response(403, 'Only admins can view jobs')
+        
+        job_id = (event.get('pathParameters') or {}).get('jobId')
+        
+        if not job_id:
+            return error_response(400, 'Missing job ID')
+        
+        job = jobs.get(job_id)
+        
+        if job is None:
+            return error_response(404, 'Job not found')
+        
+        return json_response(200, {
+            'message': 'Job retrieved successfully',
+            'job': jobs.describe(job)
+        })
+    
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return error_response(500, 'Error retrieving job', error=str(e))
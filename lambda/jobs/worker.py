@@ -0,0 +1,177 @@
+import os
+import uuid
+
+from common import clients, discography, jobs
+from common.cache import invalidate_keys
+from common.cascade import CHILD_ATTRIBUTES, CascadeDelete, album_songs_query
+from common.messaging import get_queue, message_bodies
+from common.stage_cache import catalog_paths, refresh
+
+# Items read per chunk. Each chunk is saved to the job before the next one starts.
+SONG_CHUNK_SIZE = 200
+ALBUM_CHUNK_SIZE = 10
+
+# Hand the job over to a fresh invocation below this much remaining time
+CONTINUATION_MARGIN_MS = 60000
+
+# Lease of a running worker, longer than the function timeout
+LEASE_SECONDS = 360
+
+# Failed runs before a job is marked failed, and the delay before a retry
+MAX_ATTEMPTS = 3
+RETRY_DELAY_SECONDS = 30
+
+PHASES = {
+    'delete_album': ('songs', 'parent'),
+    'delete_artist': ('songs', 'albums', 'parent')
+}
+
+TARGET_PREFIXES = {
+    'delete_album': 'ALBUM',
+    'delete_artist': 'ARTIST'
+}
+
+def handler(event, context):
+    """
+    Process deletion jobs from the jobs queue (SQS, batch size 1).
+    Message format: {"job_id": "..."}
+    
+    The worker takes the job's lease, then deletes the target's children in
+    chunks of one index page each, saving the phase, the page's
+    LastEvaluatedKey and the progress counters after every chunk. When the
+    invocation runs low on time it releases the lease and queues the job
+    again, so any job size completes without hitting the function timeout.
+    A crashed run leaves the last saved checkpoint; SQS redelivers its
+    message once the lease has expired and the job resumes from there.
+    """
+    for message in message_bodies(event):
+        run(message['job_id'], context)
+
+def run(job_id, context=None):
+    """Work on a job until it finishes, fails or must be handed over."""
+    job = jobs.get(job_id)
+    if job is None or job['status'] in jobs.FINISHED:
+        print(f"Job {job_id} is finished or missing, dropping message")
+        return
+    
+    owner = getattr(context, 'aws_request_id', None) or str(uuid.uuid4())
+    try:
+        job = jobs.acquire(job, owner, LEASE_SECONDS)
+    except jobs.StaleJob:
+        print(f"Job {job_id} is leased by another worker, dropping message")
+        return
+    
+    try:
+        while job['status'] == jobs.RUNNING:
+            if _remaining_ms(context) < CONTINUATION_MARGIN_MS:
+                job = jobs.advance(job, owner, release=True)
+                get_queue().send({'job_id': job_id})
+                print(f"Job {job_id} continues in a new invocation at phase {job['phase']}")
+                return
+            job = step(job, owner)
+        print(f"Job {job_id} {job['status']}: {jobs.describe(job)['progress']}")
+    
+    except jobs.StaleJob:
+        print(f"Job {job_id} lost its lease, stopping")
+    
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        attempts = job.get('attempts', 0) + 1
+        if attempts >= MAX_ATTEMPTS:
+            job = jobs.advance(job, owner, errors=[str(e)], attempts=attempts, status=jobs.FAILED)
+            jobs.release_target(job, _target_key(job))
+            print(f"Job {job_id} failed after {attempts} attempts")
+        else:
+            # Resume from the last checkpoint after a delay
+            jobs.advance(job, owner, errors=[str(e)], attempts=attempts, release=True)
+            get_queue().send({'job_id': job_id}, delay_seconds=RETRY_DELAY_SECONDS * attempts)
+
+def step(job, owner):
+    """Process one chunk of the job's current phase and save it."""
+    phases = PHASES[job['job_type']]
+    phase = job.get('phase') or phases[0]
+    if phase == 'parent':
+        return _delete_parent(job, owner)
+    
+    if phase == 'songs':
+        cascade, last_key = _delete_songs_chunk(job)
+    else:
+        cascade, last_key = _delete_albums_chunk(job)
+    
+    changes = {'phase': phase, 'checkpoint': last_key}
+    if last_key is None:
+        changes['phase'] = phases[phases.index(phase) + 1]
+    return jobs.advance(job, owner, counters=_progress(cascade), errors=_object_errors(cascade), **changes)
+
+def _target_key(job):
+    return {
+        'pk': f"{TARGET_PREFIXES[job['job_type']]}#{job['target_id']}",
+        'sk': 'METADATA'
+    }
+
+def _remaining_ms(context):
+    if context is None:
+        return float('inf')
+    return context.get_remaining_time_in_millis()
+
+def _query_chunk(job, query_params, limit):
+    """One page of `query_params` from the job's checkpoint: (items, last_key)."""
+    params = dict(query_params, Limit=limit, ProjectionExpression=CHILD_ATTRIBUTES)
+    # A checkpoint saved on the other artist index (the stack switched to the
+    # sparse ones meanwhile) restarts the phase; deleted items are not found again
+    partition_key = query_params['KeyConditionExpression'].split(' ', 1)[0]
+    if job.get('checkpoint') and partition_key in job['checkpoint']:
+        params['ExclusiveStartKey'] = job['checkpoint']
+    response = clients.table().query(**params)
+    return response.get('Items', []), response.get('LastEvaluatedKey')
+
+def _delete_songs_chunk(job):
+    """Delete a page of the album's songs, or of the artist's songs."""
+    target_id = job['target_id']
+    cascade = CascadeDelete()
+    
+    if job['job_type'] == 'delete_album':
+        songs, last_key = _query_chunk(job, album_songs_query(target_id), SONG_CHUNK_SIZE)
+    else:
+        songs, last_key = _query_chunk(job, discography.query('SONG', target_id), SONG_CHUNK_SIZE)
+    
+    cascade.add(songs)
+    cascade.run()
+    return cascade, last_key
+
+def _delete_albums_chunk(job):
+    """Delete a page of the artist's albums with all songs still on them."""
+    albums, last_key = _query_chunk(job, discography.query('ALBUM', job['target_id']), ALBUM_CHUNK_SIZE)
+    
+    cascade = CascadeDelete()
+    for album in albums:
+        cascade.collect_album(album['album_id'])
+    cascade.add(albums)
+    cascade.run()
+    return cascade, last_key
+
+def _delete_parent(job, owner):
+    """
+    Delete the album or artist itself and finish the job. Counters on the
+    artist follow from the table stream (streams/counters.py), which also
+    invalidates the cached songs and albums deleted on the way.
+    """
+    target_key = _target_key(job)
+    response = clients.table().delete_item(Key=target_key, ReturnValues='ALL_OLD')
+    invalidate_keys([target_key['pk']])
+    deleted = 1 if 'Attributes' in response else 0
+    if deleted:
+        refresh(catalog_paths(target_key['pk'].split('#', 1)[0], response['Attributes']))
+    return jobs.advance(job, owner, counters={'items_deleted': deleted}, status=jobs.SUCCEEDED, checkpoint=None)
+
+def _progress(cascade):
+    return {
+        'items_deleted': cascade.deleted_items,
+        'objects_deleted': cascade.deleted_objects,
+        'objects_failed': len(cascade.failed_objects),
+        'songs_deleted': cascade.count('SONG')
+    }
+
+def _object_errors(cascade):
+    bucket = cascade.bucket_name or os.environ.get('BUCKET_NAME', '')
+    return [f'Could not delete s3://{bucket}/{key}' for key in cascade.failed_objects]
@@ -0,0 +1,4 @@
+"""
+Shared runtime for the music streaming Lambda handlers.
+Shipped as a Lambda layer and importable as `common` from every function.
+"""
@@ -0,0 +1,36 @@
+"""
+Helpers for reading Cognito authorizer claims from API Gateway events.
+"""
+import re
+
+
+def get_claims(event):
+    """Return the Cognito claims of the caller, or an empty dict."""
+    authorizer = (event.get('requestContext') or {}).get('authorizer') or {}
+    return authorizer.get('claims') or {}
+
+
+def get_groups(event):
+    """
+    Return the caller's Cognito groups as a list.
+    Groups are looked up in the claims first and at the authorizer top level
+    second. API Gateway may pass them as a string such as "admin" or
+    "[admin, editors]", which is split into a list.
+    """
+    authorizer = (event.get('requestContext') or {}).get('authorizer') or {}
+    groups = get_claims(event).get('cognito:groups') or authorizer.get('cognito:groups') or []
+    
+    if isinstance(groups, str):
+        groups = [group for group in re.split(r'[\s,\[\]]+', groups) if group]
+    
+    return list(groups)
+
+
+def is_admin(event):
+    """True if the caller belongs to the 'admin' Cognito group."""
+    return 'admin' in get_groups(event)
+
+
+def get_user_id(event):
+    """The caller's Cognito user ID ('sub' claim)."""
+    return get_claims(event).get('sub')
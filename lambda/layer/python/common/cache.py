@@ -0,0 +1,394 @@
+"""
+Cache for catalog METADATA items (artists, albums, songs), in two tiers.
+A small number of popular artists account for most reads, so a bounded LRU
+cache in the Lambda container answers them without a round trip. Entries
+expire after a TTL, so changes made by other containers show up within
+METADATA_CACHE_TTL_SECONDS. Missing items are cached for a shorter time
+(negative caching), so repeated 404s do not reach the table either.
+
+Container caches start empty with every cold container. When
+CATALOG_CACHE_URL names a shared store (common/kvstore.py: a Redis-protocol
+server, or local:// in tests), container misses are looked up there before
+the table. Write handlers and the table stream consumers invalidate the
+items they change in both tiers, and concurrent misses on a key are
+coalesced so that one container refills it while the others wait.
+
+Configuration (environment):
+    METADATA_CACHE_ENABLED                 default true
+    METADATA_CACHE_MAX_ENTRIES             default 2000
+    METADATA_CACHE_MAX_BYTES               default 16 MiB (estimated item sizes)
+    METADATA_CACHE_TTL_SECONDS             default 30
+    METADATA_CACHE_NEGATIVE_TTL_SECONDS    default 5
+    CATALOG_CACHE_URL                      default unset (no shared tier)
+    CATALOG_CACHE_TTL_SECONDS              default 300
+    CATALOG_CACHE_NEGATIVE_TTL_SECONDS     default 30
+
+Hit, miss and eviction counts are published as CloudWatch metrics (EMF)
+at most once per STATS_INTERVAL_SECONDS.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from common import clients, kvstore, metrics, wire
+from common.dynamo import batch_get
+from common.kvstore import StoreError
+
+STATS_INTERVAL_SECONDS = 60
+
+BATCH_GET_SIZE = 100
+
+# Shared tier (CATALOG_CACHE_URL). Writes invalidate its entries, so they
+# can live longer than the container cache's.
+SHARED_TTL_MS = int(os.environ.get('CATALOG_CACHE_TTL_SECONDS', 300)) * 1000
+SHARED_NEGATIVE_TTL_MS = int(os.environ.get('CATALOG_CACHE_NEGATIVE_TTL_SECONDS', 30)) * 1000
+
+# Refill locks outlive a table read; waiters give up well before that
+SHARED_LOCK_TTL_MS = 2000
+SHARED_LOCK_WAIT_MS = 300
+SHARED_POLL_MS = 15
+
+# Seconds to skip the shared tier after it failed
+SHARED_RETRY_SECONDS = 30
+
+_NEGATIVE = '-'
+
+# Marker stored for items known not to exist
+_MISSING = object()
+
+
+def _sizeof(value):
+    """Rough in-memory size of an item, counting nested containers."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_sizeof(key) + _sizeof(element) for key, element in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_sizeof(element) for element in value)
+    return size
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with per-entry expiry, bounded by entry count and
+    by estimated memory. `get` returns (found, value); a value stored with
+    put_missing() is found as None.
+    """
+    
+    def __init__(self, max_entries=2000, max_bytes=16 * 1024 * 1024, ttl_seconds=30.0, negative_ttl_seconds=5.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.clock = clock
+        self.bytes = 0
+        self.stats = dict.fromkeys(('hits', 'negative_hits', 'misses', 'evictions', 'expirations'), 0)
+        self._entries = OrderedDict()  # key -> (expires_at, value, size)
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return False, None
+            expires_at, value, size = entry
+            if expires_at <= self.clock():
+                self._remove(key)
+                self.stats['expirations'] += 1
+                self.stats['misses'] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            if value is _MISSING:
+                self.stats['negative_hits'] += 1
+                return True, None
+            self.stats['hits'] += 1
+            return True, value
+    
+    def put(self, key, value):
+        self._store(key, value, self.ttl_seconds, _sizeof(key) + _sizeof(value))
+    
+    def put_missing(self, key):
+        self._store(key, _MISSING, self.negative_ttl_seconds, _sizeof(key))
+    
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+    
+    def _store(self, key, value, ttl_seconds, size):
+        if ttl_seconds <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self.clock() + ttl_seconds, value, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats['evictions'] += 1
+    
+    def _remove(self, key):
+        self.bytes -= self._entries.pop(key)[2]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+_last_flush = [time.monotonic(), {}]
+_store_down_until = [0.0]
+_shared_stats = dict.fromkeys(('shared_hits', 'shared_misses', 'refills', 'coalesced'), 0)
+
+
+def enabled():
+    """True unless METADATA_CACHE_ENABLED is set to a false value."""
+    return os.environ.get('METADATA_CACHE_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+
+
+def metadata_cache():
+    """The container-wide cache of METADATA items, built from the environment on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LRUCache(
+                    max_entries=int(os.environ.get('METADATA_CACHE_MAX_ENTRIES', 2000)),
+                    max_bytes=int(os.environ.get('METADATA_CACHE_MAX_BYTES', 16 * 1024 * 1024)),
+                    ttl_seconds=float(os.environ.get('METADATA_CACHE_TTL_SECONDS', 30)),
+                    negative_ttl_seconds=float(os.environ.get('METADATA_CACHE_NEGATIVE_TTL_SECONDS', 5))
+                )
+    return _cache
+
+
+def get_metadata(entity_type, entity_id, refresh=False):
+    """
+    The METADATA item of an artist, album or song, or None if it does not
+    exist. The caller gets its own copy and may modify it. With `refresh`,
+    this container's copy is skipped (e.g. for a stage cache refresh, which
+    must not store an outdated item).
+    """
+    pk = f'{entity_type}#{entity_id}'
+    if refresh and _cache is not None:
+        _cache.invalidate(pk)
+    return get_metadata_many([(entity_type, entity_id)])[pk]
+
+
+def get_metadata_many(entities):
+    """
+    METADATA items for a list of (entity_type, entity_id), as {pk: item or
+    None}. Each item is looked up in the container cache, then in the shared
+    tier, and only then read from the table (one BatchGetItem call per 100
+    keys).
+    """
+    pks = list(dict.fromkeys(f'{entity_type}#{entity_id}' for entity_type, entity_id in entities))
+    results = {}
+    
+    cache = metadata_cache() if enabled() else None
+    misses = []
+    for pk in pks:
+        found, item = cache.get(pk) if cache is not None else (False, None)
+        if found:
+            results[pk] = item
+        else:
+            misses.append(pk)
+    
+    if misses:
+        loaded = _load_shared(misses)
+        for pk in misses:
+            item = loaded[pk]
+            if cache is not None:
+                if item is None:
+                    cache.put_missing(pk)
+                else:
+                    cache.put(pk, item)
+            results[pk] = item
+    
+    if cache is not None:
+        _flush_stats(cache)
+    return {pk: dict(item) if item is not None else None for pk, item in results.items()}
+
+
+def invalidate_metadata(entity_type, entity_id):
+    """
+    Drop an item from the caches after writing it: from this container's
+    cache and from the shared tier, so other containers refill it from the
+    table.
+    """
+    invalidate_keys([f'{entity_type}#{entity_id}'])
+
+
+def invalidate_keys(pks):
+    """invalidate_metadata for a list of partition keys (e.g. from a table stream)."""
+    if _cache is not None:
+        for pk in pks:
+            _cache.invalidate(pk)
+    store = _shared_store()
+    if store is None or not pks:
+        return
+    keys = []
+    for pk in pks:
+        # Deleting the lock as well stops a refill in flight from publishing
+        # the item it read before this write
+        keys += [shared_key(pk), lock_key(pk)]
+    try:
+        store.delete(keys)
+    except StoreError as e:
+        _store_failed(e)
+
+
+def shared_key(pk):
+    """Key of an item in the shared tier; the {hash tag} keeps it in its lock's slot."""
+    return f"{{{os.environ.get('TABLE_NAME', 'catalog')}:{pk}}}"
+
+
+def lock_key(pk):
+    return shared_key(pk) + ':lock'
+
+
+def _load_shared(pks):
+    """
+    Items from the shared tier, refilling the missing ones from the table.
+    Concurrent misses on one key are coalesced: the container that takes
+    the key's refill lock reads the table and publishes the item, and the
+    others wait up to SHARED_LOCK_WAIT_MS for it before reading the table
+    themselves.
+    """
+    store = _shared_store()
+    if store is None:
+        return _read_table(pks)
+    
+    try:
+        loaded = _decode_many(pks, store.get_many([shared_key(pk) for pk in pks]))
+        missing = [pk for pk in pks if pk not in loaded]
+        _shared_stats['shared_hits'] += len(loaded)
+        _shared_stats['shared_misses'] += len(missing)
+        if not missing:
+            return loaded
+        
+        token = uuid.uuid4().hex
+        owned = [pk for pk in missing if store.set(lock_key(pk), token, SHARED_LOCK_TTL_MS, only_if_absent=True)]
+        waiting = [pk for pk in missing if pk not in owned]
+    except StoreError as e:
+        _store_failed(e)
+        return _read_table(pks)
+    
+    if owned:
+        _shared_stats['refills'] += len(owned)
+        try:
+            items = _read_table(owned)
+        except Exception:
+            # Let the waiters read the table instead of waiting for the lock to expire
+            for pk in owned:
+                try:
+                    store.release(lock_key(pk), token)
+                except StoreError:
+                    break
+            raise
+        loaded.update(items)
+        try:
+            for pk in owned:
+                if items[pk] is None:
+                    store.publish(lock_key(pk), token, shared_key(pk), _NEGATIVE, SHARED_NEGATIVE_TTL_MS)
+                else:
+                    store.publish(lock_key(pk), token, shared_key(pk), _encode(items[pk]), SHARED_TTL_MS)
+        except StoreError as e:
+            _store_failed(e)
+    
+    deadline = time.monotonic() + SHARED_LOCK_WAIT_MS / 1000.0
+    while waiting and time.monotonic() < deadline:
+        time.sleep(SHARED_POLL_MS / 1000.0)
+        try:
+            found = _decode_many(waiting, store.get_many([shared_key(pk) for pk in waiting]))
+        except StoreError as e:
+            _store_failed(e)
+            break
+        loaded.update(found)
+        _shared_stats['coalesced'] += len(found)
+        waiting = [pk for pk in waiting if pk not in found]
+    if waiting:
+        # The refill lock holder is slow or gone; read the table directly
+        loaded.update(_read_table(waiting))
+    return loaded
+
+
+def _read_table(pks):
+    """{pk: item or None} for METADATA items read from the table."""
+    results = dict.fromkeys(pks)
+    for start in range(0, len(pks), BATCH_GET_SIZE):
+        keys = [{'pk': pk, 'sk': 'METADATA'} for pk in pks[start:start + BATCH_GET_SIZE]]
+        if len(keys) == 1:
+            item = clients.table().get_item(Key=keys[0]).get('Item')
+            found = [item] if item else []
+        else:
+            found = batch_get(keys)
+        for item in found:
+            results[item['pk']] = item
+    return results
+
+
+def _encode(item):
+    # DynamoDB JSON keeps numbers as Decimals and sets as sets
+    return json.dumps(wire.to_wire(item), separators=(',', ':'))
+
+
+def _decode_many(pks, values):
+    """Decode the shared tier's values; keys it does not hold are left out."""
+    loaded = {}
+    for pk, value in zip(pks, values):
+        if value is None:
+            continue
+        loaded[pk] = None if value == _NEGATIVE.encode() else wire.from_wire(json.loads(value))
+    return loaded
+
+
+def _shared_store():
+    if time.monotonic() < _store_down_until[0]:
+        return None
+    return kvstore.get_store()
+
+
+def _store_failed(error):
+    """Serve from the table alone for a while when the shared tier is unavailable."""
+    print(f"Warning: Shared cache unavailable: {str(error)}")
+    _store_down_until[0] = time.monotonic() + SHARED_RETRY_SECONDS
+
+
+def _flush_stats(cache):
+    now = time.monotonic()
+    if now - _last_flush[0] < STATS_INTERVAL_SECONDS:
+        return
+    with _cache_lock:
+        if now - _last_flush[0] < STATS_INTERVAL_SECONDS:
+            return
+        current = dict(cache.stats, **_shared_stats)
+        previous = _last_flush[1]
+        _last_flush[0], _last_flush[1] = now, current
+    deltas = {name: current[name] - previous.get(name, 0) for name in current}
+    lookups = deltas['hits'] + deltas['negative_hits'] + deltas['misses']
+    metrics.emit(
+        {
+            'MetadataCacheHits': deltas['hits'] + deltas['negative_hits'],
+            'MetadataCacheMisses': deltas['misses'],
+            'MetadataCacheEvictions': deltas['evictions'],
+            'MetadataCacheHitRate': round(100.0 * (lookups - deltas['misses']) / lookups, 1) if lookups else 0,
+            'MetadataCacheEntries': len(cache),
+            'MetadataCacheBytes': cache.bytes,
+            'SharedCacheHits': deltas['shared_hits'],
+            'SharedCacheMisses': deltas['shared_misses'],
+            'SharedCacheRefills': deltas['refills'],
+            'SharedCacheCoalesced': deltas['coalesced']
+        },
+        dimensions={'Cache': 'metadata', 'Function': os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local')},
+        units={'MetadataCacheHitRate': 'Percent', 'MetadataCacheBytes': 'Bytes'}
+    )
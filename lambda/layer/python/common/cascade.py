@@ -0,0 +1,137 @@
+"""
+Cascade deletes for albums and artists.
+Child items are collected from fully paginated index queries, then deleted
+with BatchWriteItem (25 keys per call) and their audio files with S3
+DeleteObjects (1000 keys per call), with the batches running concurrently.
+The parent item is deleted last, so a failed cascade can simply be retried.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from common import clients, discography
+from common.dynamo import batch_write, query_all
+
+WRITE_BATCH_SIZE = 25
+S3_BATCH_SIZE = 1000
+MAX_WORKERS = 8
+
+# Attributes read from each child item
+CHILD_ATTRIBUTES = 'pk, sk, entity_type, album_id, s3_key'
+
+_CHILD_PROJECTION = {
+    'ProjectionExpression': CHILD_ATTRIBUTES
+}
+
+
+def album_songs_query(album_id):
+    """Query parameters for the songs of an album (album-index)."""
+    return {
+        'IndexName': 'album-index',
+        'KeyConditionExpression': 'album_id = :album_id',
+        'FilterExpression': 'entity_type = :song',
+        'ExpressionAttributeValues': {
+            ':album_id': album_id,
+            ':song': 'SONG'
+        }
+    }
+
+
+def _chunks(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class CascadeDelete:
+    """Collects the items and audio files of a cascade, then deletes them in batches."""
+    
+    def __init__(self, bucket_name=None, max_workers=MAX_WORKERS):
+        self.bucket_name = bucket_name or os.environ.get('BUCKET_NAME')
+        self.max_workers = max_workers
+        self.items = {}
+        self.deleted_items = 0
+        self.deleted_objects = 0
+        self.failed_objects = []
+        self._lock = threading.Lock()
+    
+    def collect(self, query_params):
+        """Add every item of a (paginated) index query. Returns the items found."""
+        return self.add(query_all(dict(query_params, **_CHILD_PROJECTION)))
+    
+    def add(self, items):
+        """Add items already read (with at least pk, sk and s3_key). Returns them as a list."""
+        items = list(items)
+        for item in items:
+            self.items.setdefault(item['pk'], item)
+        return items
+    
+    def collect_album(self, album_id):
+        """Add all songs of an album (album-index)."""
+        return self.collect(album_songs_query(album_id))
+    
+    def collect_artist(self, artist_id):
+        """Add all albums of an artist, their songs and the artist's other songs."""
+        albums = self.collect(discography.query('ALBUM', artist_id))
+        self.collect(discography.query('SONG', artist_id))
+        
+        # Tracklists are independent queries, run them side by side
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            tracklists = pool.map(
+                lambda album_id: list(query_all(dict(album_songs_query(album_id), **_CHILD_PROJECTION))),
+                [album['album_id'] for album in albums]
+            )
+            for tracklist in tracklists:
+                self.add(tracklist)
+    
+    def count(self, entity_type):
+        """Number of collected items of `entity_type`."""
+        return sum(1 for item in self.items.values() if item.get('entity_type') == entity_type)
+    
+    def run(self):
+        """
+        Delete the collected items and their audio files concurrently.
+        DynamoDB failures are raised; S3 failures are logged and recorded in
+        `failed_objects`, as an orphaned file does not break the catalog.
+        """
+        keys = [{'pk': item['pk'], 'sk': item['sk']} for item in self.items.values()]
+        s3_keys = [item['s3_key'] for item in self.items.values() if item.get('s3_key')]
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            write_batches = [
+                pool.submit(self._delete_items, batch)
+                for batch in _chunks(keys, WRITE_BATCH_SIZE)
+            ]
+            object_batches = [
+                pool.submit(self._delete_objects, batch)
+                for batch in _chunks(s3_keys, S3_BATCH_SIZE)
+            ]
+            for future in object_batches:
+                try:
+                    future.result()
+                except Exception as s3_error:
+                    print(f"Warning: Error deleting S3 objects: {str(s3_error)}")
+            for future in write_batches:
+                future.result()
+        
+        print(f"Cascade deleted {self.deleted_items} items and {self.deleted_objects} objects")
+        return self
+    
+    def _delete_items(self, keys):
+        batch_write([{'DeleteRequest': {'Key': key}} for key in keys])
+        with self._lock:
+            self.deleted_items += len(keys)
+    
+    def _delete_objects(self, s3_keys):
+        response = clients.s3().delete_objects(
+            Bucket=self.bucket_name,
+            Delete={
+                'Objects': [{'Key': key} for key in s3_keys],
+                'Quiet': True
+            }
+        )
+        errors = response.get('Errors', [])
+        for error in errors:
+            print(f"Warning: Error deleting S3 object {error.get('Key')}: {error.get('Message')}")
+        with self._lock:
+            self.failed_objects.extend(error.get('Key') for error in errors)
+            self.deleted_objects += len(s3_keys) - len(errors)
@@ -0,0 +1,73 @@
+"""
+Lazily constructed AWS clients and DynamoDB tables.
+Clients are built on first use and reused for the lifetime of the container,
+so handlers only pay for the services a request actually touches.
+"""
+import os
+import threading
+import boto3
+from botocore.config import Config
+
+# Room for the thread pools that fan requests out (shard scatter-gather,
+# cascade deletes, stream fan-out); botocore's default pool holds 10
+MAX_POOL_CONNECTIONS = 50
+
+_config = Config(max_pool_connections=MAX_POOL_CONNECTIONS)
+
+_lock = threading.Lock()
+_clients = {}
+_resources = {}
+_tables = {}
+
+
+def client(service_name):
+    """Return a cached low-level client for the given AWS service."""
+    if service_name not in _clients:
+        with _lock:
+            if service_name not in _clients:
+                _clients[service_name] = boto3.client(service_name, config=_config)
+    return _clients[service_name]
+
+
+def resource(service_name):
+    """Return a cached service resource (e.g. 'dynamodb')."""
+    if service_name not in _resources:
+        with _lock:
+            if service_name not in _resources:
+                _resources[service_name] = boto3.resource(service_name, config=_config)
+    return _resources[service_name]
+
+
+def dynamodb_table(env_var):
+    """Return the cached DynamoDB Table whose name is stored in `env_var`."""
+    if env_var not in _tables:
+        table_resource = resource('dynamodb').Table(os.environ[env_var])
+        with _lock:
+            _tables.setdefault(env_var, table_resource)
+    return _tables[env_var]
+
+
+def table():
+    """The catalog table (artists, albums and songs)."""
+    return dynamodb_table('TABLE_NAME')
+
+
+def subscriptions_table():
+    """The user subscriptions table."""
+    return dynamodb_table('SUBSCRIPTIONS_TABLE_NAME')
+
+
+def s3():
+    return client('s3')
+
+
+def lambda_client():
+    return client('lambda')
+
+
+def ses():
+    return client('ses')
+
+
+def cognito():
+    return client('cognito-idp')
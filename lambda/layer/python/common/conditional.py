@@ -0,0 +1,105 @@
+"""
+Conditional GETs (ETag / If-None-Match) for the catalog read endpoints.
+Polling clients send back the ETag of the response they hold and get an
+empty 304 Not Modified while it is still current, which saves the body's
+serialization and transfer.
+
+Single items get a strong ETag from their key and updated_at, without
+serializing anything. Attributes that are rewritten without touching
+updated_at (counters and artist_name copies maintained from the table
+stream, the deletion marker) and the requested projection are part of the
+tag as well. List pages are tagged with a hash of the rendered page.
+
+Each response is also counted as an EMF metric per endpoint: NotModified
+(a 304 was returned) and, for conditional requests only,
+NotModifiedRatio (100 or 0; its average is the 304 ratio).
+"""
+import hashlib
+import json
+
+from common import metrics
+from common.responses import JSON_HEADERS
+from common.serialization import dumps
+
+ITEM_MAX_AGE_SECONDS = 30
+LIST_MAX_AGE_SECONDS = 10
+
+DERIVED_ATTRIBUTES = ('total_songs', 'total_albums', 'artist_name', 'deletion_job')
+
+
+def item_etag(item, projection=None):
+    """Strong ETag of a whole METADATA item as rendered with `projection`."""
+    fields = projection.fields if projection is not None else None
+    tag = json.dumps(
+        [item['pk'], item.get('updated_at'), [item.get(name) for name in DERIVED_ATTRIBUTES], fields],
+        default=str,
+        separators=(',', ':')
+    )
+    return _quote(tag.encode())
+
+
+def cache_headers(etag, max_age=ITEM_MAX_AGE_SECONDS):
+    """Response headers for a tagged 200 (JSON) or 304 response."""
+    return dict(
+        JSON_HEADERS,
+        **{
+            'ETag': etag,
+            'Cache-Control': f'public, max-age={max_age}',
+            'Access-Control-Expose-Headers': 'ETag'
+        }
+    )
+
+
+def if_none_match(event):
+    """The entity tags of the If-None-Match header (weak tags compare equal)."""
+    headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    header = headers.get('if-none-match') or ''
+    return {tag.strip()[2:] if tag.strip().startswith('W/') else tag.strip() for tag in header.split(',') if tag.strip()}
+
+
+def check(event, endpoint, etag, max_age=ITEM_MAX_AGE_SECONDS):
+    """
+    A 304 response if the client already holds `etag`, else None.
+    Records the outcome in the endpoint's metrics either way.
+    """
+    tags = if_none_match(event)
+    matched = bool(tags) and (etag in tags or '*' in tags)
+    _record(endpoint, bool(tags), matched)
+    if not matched:
+        return None
+    headers = cache_headers(etag, max_age)
+    del headers['Content-Type']
+    return {
+        'statusCode': 304,
+        'headers': headers
+    }
+
+
+def page_response(event, endpoint, body, max_age=LIST_MAX_AGE_SECONDS):
+    """
+    A 200 JSON response for a list page, tagged with a hash of its body,
+    or a 304 if the client already holds that page.
+    """
+    text = dumps(body)
+    etag = _quote(text.encode())
+    not_modified = check(event, endpoint, etag, max_age)
+    if not_modified:
+        return not_modified
+    return {
+        'statusCode': 200,
+        'headers': cache_headers(etag, max_age),
+        'body': text
+    }
+
+
+def _quote(data):
+    return '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+
+
+def _record(endpoint, conditional, matched):
+    values = {'NotModified': 1 if matched else 0}
+    units = {}
+    if conditional:
+        values['NotModifiedRatio'] = 100 if matched else 0
+        units['NotModifiedRatio'] = 'Percent'
+    metrics.emit(values, dimensions={'Endpoint': endpoint}, units=units)
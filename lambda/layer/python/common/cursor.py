@@ -0,0 +1,311 @@
+"""
+Opaque pagination cursors.
+A cursor carries a LastEvaluatedKey (or a composite of several, e.g. the
+per-shard positions of a scatter-gather listing) to the client and back.
+It is packed into a compact binary form, signed with HMAC-SHA256 and
+base64url encoded:
+    
+    version (1 byte) | flags (1 byte) | payload | mac (16 bytes)
+
+The MAC covers the header, the payload and a scope string naming the
+endpoint and its path parameters, so a cursor is only valid for the
+listing that issued it. Tampered, truncated or foreign cursors are
+rejected with InvalidCursor before any read is made.
+
+The signing key is read from the Secrets Manager secret named by
+CURSOR_SECRET_ARN (see common/signing.py). Its AWSPREVIOUS version, if
+any, is also accepted for verification, so cursors survive a key
+rotation. Without CURSOR_SECRET_ARN (e.g. locally) the key comes from
+CURSOR_SECRET, and CURSOR_SECRET_PREVIOUS is accepted.
+"""
+import base64
+import hashlib
+import hmac
+import re
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from common import signing
+
+VERSION = 1
+
+MAC_SIZE = 16
+
+# Flag bits
+_COMPRESSED = 0x01
+
+# Payloads larger than this are deflated when that makes them smaller
+_COMPRESS_THRESHOLD = 96
+
+# Value tags
+_NONE = 0x00
+_STR = 0x01
+_WORD = 0x02        # one of _WORDS
+_UUID = 0x03        # canonical lowercase UUID
+_PREFIXED_UUID = 0x04  # e.g. SONG#<uuid>
+_PREFIXED_INT = 0x05   # e.g. SONG#7 (shard keys)
+_TIMESTAMP = 0x06   # datetime.isoformat() with microseconds
+_TIMESTAMP_S = 0x07  # datetime.isoformat() without microseconds
+_INT = 0x08
+_DICT = 0x09
+_LIST = 0x0A
+_TRUE = 0x0B
+_FALSE = 0x0C
+
+# Frequent key names and values. Append only: changing existing entries
+# requires a new VERSION.
+_WORDS = (
+    'pk', 'sk', 'METADATA', 'created_at', 'entity_type', 'entity_shard',
+    'artist_id', 'album_id', 'song_id', 'artist_songs', 'artist_albums',
+    'user_id', 'subscription_date', 'SONG', 'ALBUM', 'ARTIST'
+)
+_PREFIXES = ('SONG', 'ALBUM', 'ARTIST')
+
+_WORD_CODES = {word: code for code, word in enumerate(_WORDS)}
+_PREFIX_CODES = {prefix: code for code, prefix in enumerate(_PREFIXES)}
+_PREFIXED = re.compile(r'^([A-Z]+)#(.+)$')
+_EPOCH = datetime(1970, 1, 1)
+
+
+class InvalidCursor(ValueError):
+    """The cursor is malformed, was not issued by us or belongs to another listing."""
+
+
+def _keys():
+    """The signing key first, then a previous key still accepted for verification."""
+    keys = signing.keys('CURSOR_SECRET_ARN', 'CURSOR_SECRET')
+    if not keys:
+        raise KeyError('CURSOR_SECRET_ARN or CURSOR_SECRET must be set')
+    return keys
+
+
+def _mac(key, scope, signed):
+    return hmac.new(key, scope.encode('utf-8') + b'\x00' + signed, hashlib.sha256).digest()[:MAC_SIZE]
+
+
+def encode(value, scope):
+    """
+    Encode a LastEvaluatedKey or composite cursor as an opaque token for
+    `scope`. Returns None when `value` is None (no further pages).
+    """
+    if value is None:
+        return None
+    payload = bytearray()
+    _pack(value, payload)
+    payload = bytes(payload)
+    
+    flags = 0
+    if len(payload) > _COMPRESS_THRESHOLD:
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15)  # Raw deflate, no header or checksum
+        deflated = compressor.compress(payload) + compressor.flush()
+        if len(deflated) < len(payload):
+            payload = deflated
+            flags |= _COMPRESSED
+    
+    signed = bytes((VERSION, flags)) + payload
+    token = signed + _mac(_keys()[0], scope, signed)
+    return base64.urlsafe_b64encode(token).rstrip(b'=').decode('ascii')
+
+
+def decode(token, scope):
+    """
+    Verify and decode a token issued by encode() for the same `scope`.
+    Raises InvalidCursor for anything else.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+    except (ValueError, TypeError):
+        raise InvalidCursor('Cursor is not valid base64url')
+    
+    if len(raw) < 2 + MAC_SIZE:
+        raise InvalidCursor('Cursor is truncated')
+    signed, mac = raw[:-MAC_SIZE], raw[-MAC_SIZE:]
+    if not any(hmac.compare_digest(mac, _mac(key, scope, signed)) for key in _keys()):
+        raise InvalidCursor('Cursor signature does not match')
+    
+    version, flags, payload = signed[0], signed[1], signed[2:]
+    if version != VERSION:
+        raise InvalidCursor(f'Unsupported cursor version {version}')
+    
+    try:
+        if flags & _COMPRESSED:
+            payload = zlib.decompress(payload, -15)
+        value, offset = _unpack(payload, 0)
+    except (zlib.error, IndexError, ValueError, OverflowError):
+        raise InvalidCursor('Cursor payload is malformed')
+    if offset != len(payload):
+        raise InvalidCursor('Cursor payload is malformed')
+    return value
+
+
+def _pack_varint(number, out):
+    while True:
+        byte = number & 0x7F
+        number >>= 7
+        if number:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _unpack_varint(data, offset):
+    number = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        number |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return number, offset
+        shift += 7
+        if shift > 63:
+            raise ValueError('Varint too long')
+
+
+def _as_uuid(text):
+    """16 raw bytes if `text` is a canonical UUID string, else None."""
+    if len(text) != 36:
+        return None
+    try:
+        parsed = uuid.UUID(text)
+    except ValueError:
+        return None
+    return parsed.bytes if str(parsed) == text else None
+
+
+def _as_timestamp(text):
+    """(tag, microseconds since epoch) if `text` round-trips through isoformat(), else None."""
+    if len(text) not in (19, 26) or text[10:11] != 'T':
+        return None
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None or parsed.isoformat() != text:
+        return None
+    delta = parsed - _EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    if micros < 0:
+        return None
+    return (_TIMESTAMP if len(text) == 26 else _TIMESTAMP_S), micros
+
+
+def _pack_str(text, out):
+    if text in _WORD_CODES:
+        out += bytes((_WORD, _WORD_CODES[text]))
+        return
+    
+    uuid_bytes = _as_uuid(text)
+    if uuid_bytes:
+        out.append(_UUID)
+        out += uuid_bytes
+        return
+    
+    match = _PREFIXED.match(text)
+    if match and match.group(1) in _PREFIX_CODES:
+        prefix_code = _PREFIX_CODES[match.group(1)]
+        rest = match.group(2)
+        uuid_bytes = _as_uuid(rest)
+        if uuid_bytes:
+            out += bytes((_PREFIXED_UUID, prefix_code))
+            out += uuid_bytes
+            return
+        if rest.isdigit() and str(int(rest)) == rest:
+            out += bytes((_PREFIXED_INT, prefix_code))
+            _pack_varint(int(rest), out)
+            return
+    
+    timestamp = _as_timestamp(text)
+    if timestamp:
+        out.append(timestamp[0])
+        _pack_varint(timestamp[1], out)
+        return
+    
+    encoded = text.encode('utf-8')
+    out.append(_STR)
+    _pack_varint(len(encoded), out)
+    out += encoded
+
+
+def _pack(value, out):
+    if value is None:
+        out.append(_NONE)
+    elif value is True:
+        out.append(_TRUE)
+    elif value is False:
+        out.append(_FALSE)
+    elif isinstance(value, str):
+        _pack_str(value, out)
+    elif isinstance(value, (int, Decimal)) and value == int(value):
+        # Zigzag so small negative numbers stay short
+        number = int(value)
+        out.append(_INT)
+        _pack_varint((number << 1) if number >= 0 else ((-number << 1) - 1), out)
+    elif isinstance(value, dict):
+        out.append(_DICT)
+        _pack_varint(len(value), out)
+        for name, element in value.items():
+            _pack_str(name, out)
+            _pack(element, out)
+    elif isinstance(value, (list, tuple)):
+        out.append(_LIST)
+        _pack_varint(len(value), out)
+        for element in value:
+            _pack(element, out)
+    else:
+        raise TypeError(f'Cannot encode {type(value).__name__} in a cursor')
+
+
+def _unpack(data, offset):
+    tag = data[offset]
+    offset += 1
+    if tag == _NONE:
+        return None, offset
+    if tag == _TRUE:
+        return True, offset
+    if tag == _FALSE:
+        return False, offset
+    if tag == _STR:
+        length, offset = _unpack_varint(data, offset)
+        if offset + length > len(data):
+            raise ValueError('String runs past the payload')
+        return data[offset:offset + length].decode('utf-8'), offset + length
+    if tag == _WORD:
+        return _WORDS[data[offset]], offset + 1
+    if tag == _UUID:
+        return str(uuid.UUID(bytes=bytes(data[offset:offset + 16]))), offset + 16
+    if tag == _PREFIXED_UUID:
+        prefix = _PREFIXES[data[offset]]
+        return f'{prefix}#{uuid.UUID(bytes=bytes(data[offset + 1:offset + 17]))}', offset + 17
+    if tag == _PREFIXED_INT:
+        prefix = _PREFIXES[data[offset]]
+        number, offset = _unpack_varint(data, offset + 1)
+        return f'{prefix}#{number}', offset
+    if tag in (_TIMESTAMP, _TIMESTAMP_S):
+        micros, offset = _unpack_varint(data, offset)
+        parsed = _EPOCH + timedelta(microseconds=micros)
+        if tag == _TIMESTAMP and not parsed.microsecond:
+            raise ValueError('Timestamp tag mismatch')
+        return parsed.isoformat(), offset
+    if tag == _INT:
+        number, offset = _unpack_varint(data, offset)
+        return (number >> 1) if not number & 1 else -((number + 1) >> 1), offset
+    if tag == _DICT:
+        count, offset = _unpack_varint(data, offset)
+        value = {}
+        for _ in range(count):
+            name, offset = _unpack(data, offset)
+            if not isinstance(name, str):
+                raise ValueError('Dict key is not a string')
+            value[name], offset = _unpack(data, offset)
+        return value, offset
+    if tag == _LIST:
+        count, offset = _unpack_varint(data, offset)
+        value = []
+        for _ in range(count):
+            element, offset = _unpack(data, offset)
+            value.append(element)
+        return value, offset
+    raise ValueError(f'Unknown tag {tag}')
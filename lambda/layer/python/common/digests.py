@@ -0,0 +1,201 @@
+"""
+Release digests: an artist's release events coalesced over a time window.
+Uploading an album triggers one album_created and a song_created per
+track, and each would otherwise fan out to every subscriber on its own.
+Instead, send_notifications adds each event to the artist's open digest
+(pk DIGEST#<artist_id>, sk OPEN). The event that opens a digest schedules
+a "digest" message on the notifications queue, delayed by the window. When
+it arrives, a worker closes the digest into a single release (see
+common/notifications.py), so every subscriber gets one email per window:
+a lone event keeps its own template, and several are listed in the digest
+template. Events arriving after that open the next digest.
+
+The window is NOTIFICATION_DIGEST_SECONDS, at most the SQS delay limit;
+0 sends every event on its own.
+
+Events and queue messages are delivered at least once:
+- An event is added once per event ID; a retried event that opened the
+  digest schedules its message again.
+- The release is written and the open digest deleted in one transaction,
+  conditional on the digest's event count, so no event is lost to a
+  concurrent add and a redelivered message resumes the same release.
+"""
+import os
+import time
+import uuid
+
+from botocore.exceptions import ClientError
+
+from common import clients, notifications
+from common.dynamo import TransactionCancelled, transact_write
+from common.messaging import MAX_DELAY_SECONDS, get_queue
+
+WINDOW_ENV = 'NOTIFICATION_DIGEST_SECONDS'
+DEFAULT_WINDOW_SECONDS = 300
+
+DIGEST_EVENT_TYPE = 'release_digest'
+
+# SES template of digests with several releases: (environment variable, default name)
+DIGEST_TEMPLATE = ('DIGEST_TEMPLATE', 'music-streaming-release-digest')
+
+# Events a digest holds; later ones in the window are sent on their own
+MAX_EVENTS = 200
+
+# Releases listed in a digest email; the rest are counted
+MAX_LISTED_RELEASES = 25
+
+# An open digest older than its window by this much has lost its message
+SCHEDULE_GRACE_SECONDS = 300
+
+# Closing retries while events keep arriving
+MAX_CLOSE_ATTEMPTS = 5
+
+KINDS = {
+    'album_created': 'Album',
+    'song_created': 'Song'
+}
+
+
+def window_seconds():
+    """The digest window in seconds; 0 when digests are off."""
+    return max(0, min(int(os.environ.get(WINDOW_ENV, DEFAULT_WINDOW_SECONDS)), MAX_DELAY_SECONDS))
+
+
+def digest_key(artist_id):
+    return {
+        'pk': f'DIGEST#{artist_id}',
+        'sk': 'OPEN'
+    }
+
+
+def get(artist_id):
+    """The artist's open digest, or None. Reads are strongly consistent."""
+    response = clients.table().get_item(Key=digest_key(artist_id), ConsistentRead=True)
+    return response.get('Item')
+
+
+def add(artist_id, event_id, event, window=None):
+    """
+    Add `event` ({'event_type', 'content_title', 'template', 'template_data'}
+    and optionally 'feed_entry') to the artist's open digest, opening one if there is none. `event_id`
+    identifies the event across retries. Returns the digest, or None if
+    the digest is full and the event should be sent on its own.
+    """
+    window = window_seconds() if window is None else window
+    now = int(time.time())
+    try:
+        digest = clients.table().update_item(
+            Key=digest_key(artist_id),
+            UpdateExpression=(
+                'SET digest_id = if_not_exists(digest_id, :digest_id), artist_id = :artist_id,'
+                ' opened_by = if_not_exists(opened_by, :event_id), opened_at = if_not_exists(opened_at, :now),'
+                ' expires_at = :expires_at,'
+                ' events = list_append(if_not_exists(events, :empty), :event)'
+                ' ADD event_ids :event_ids, event_count :one'
+            ),
+            ConditionExpression='NOT contains(event_ids, :event_id) AND (attribute_not_exists(event_count) OR event_count < :max_events)',
+            ExpressionAttributeValues={
+                ':digest_id': str(uuid.uuid4()),
+                ':event_id': event_id,
+                ':artist_id': artist_id,
+                ':now': now,
+                ':expires_at': now + notifications.RELEASE_TTL_DAYS * 86400,
+                ':empty': [],
+                ':event': [event],
+                ':event_ids': {event_id},
+                ':one': 1,
+                ':max_events': MAX_EVENTS
+            },
+            ReturnValues='ALL_NEW'
+        )['Attributes']
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        digest = get(artist_id)
+        if digest is None or event_id not in digest.get('event_ids', ()):
+            print(f"Digest of artist {artist_id} is full, sending event {event_id} on its own")
+            return None
+        print(f"Event {event_id} is in the digest of artist {artist_id} already")
+    
+    if digest['opened_by'] == event_id or now - int(digest['opened_at']) > window + SCHEDULE_GRACE_SECONDS:
+        get_queue(notifications.QUEUE_ENV).send({
+            'release_id': digest['digest_id'],
+            'artist_id': artist_id,
+            'action': 'digest'
+        }, delay_seconds=window)
+    return digest
+
+
+def close(artist_id, digest_id):
+    """
+    Turn the open digest `digest_id` into a release and remove it, in one
+    transaction. Returns the release, which is already planned in part if
+    an earlier delivery closed the digest, or None if it no longer exists.
+    """
+    for _ in range(MAX_CLOSE_ATTEMPTS):
+        digest = get(artist_id)
+        if digest is None or digest['digest_id'] != digest_id:
+            # Closed by an earlier delivery of the message
+            return notifications.get(digest_id)
+        
+        event_type, template, template_data = content(digest['events'])
+        feed_entries = [event['feed_entry'] for event in digest['events'] if event.get('feed_entry')]
+        release = notifications.release_item(digest_id, artist_id, event_type, template, template_data, feed_entries)
+        try:
+            transact_write([
+                {'Put': {
+                    'Item': release,
+                    'ConditionExpression': 'attribute_not_exists(pk)'
+                }},
+                {'Delete': {
+                    'Key': digest_key(artist_id),
+                    'ConditionExpression': 'digest_id = :digest_id AND event_count = :event_count',
+                    'ExpressionAttributeValues': {
+                        ':digest_id': digest_id,
+                        ':event_count': digest['event_count']
+                    }
+                }}
+            ])
+        except TransactionCancelled as e:
+            if not e.failed(1):
+                raise
+            # An event was added meanwhile; close with it
+            continue
+        print(f"Digest {digest_id} of artist {artist_id} closed with {len(digest['events'])} events")
+        return release
+    raise RuntimeError(f"Digest {digest_id} of artist {artist_id} kept changing while closing")
+
+
+def content(events):
+    """
+    The event type, SES template and template data of the release for a
+    digest's `events`. A single event is sent as it is.
+    """
+    if len(events) == 1:
+        event = events[0]
+        return event['event_type'], event['template'], event['template_data']
+    
+    # Albums first, then songs in the order they were released
+    ordered = sorted(events, key=lambda event: event['event_type'] != 'album_created')
+    first = ordered[0]['template_data']
+    releases = []
+    for event in ordered[:MAX_LISTED_RELEASES]:
+        release = {
+            'kind': KINDS.get(event['event_type'], 'Release'),
+            'content_title': event['content_title']
+        }
+        if event['event_type'] == 'song_created' and event['template_data'].get('album_title'):
+            release['album_title'] = event['template_data']['album_title']
+        releases.append(release)
+    
+    variable, default_name = DIGEST_TEMPLATE
+    template_data = {
+        'event_title': 'Releases',
+        'artist_name': first['artist_name'],
+        'app_url': first['app_url'],
+        'release_count': str(len(events)),
+        'releases': releases
+    }
+    if len(events) > MAX_LISTED_RELEASES:
+        template_data['more_releases'] = str(len(events) - MAX_LISTED_RELEASES)
+    return DIGEST_EVENT_TYPE, os.environ.get(variable, default_name), template_data
@@ -0,0 +1,62 @@
+"""
+Index queries for an artist's songs and albums.
+The sparse artist-songs-index and artist-albums-index hold only the songs
+or only the albums of an artist, so every item read is returned. Items
+created before those indexes lack their keys until
+maintenance/backfill_index_keys has run, so the indexes are only read once
+the stack sets SPARSE_ARTIST_INDEXES (see DatabaseStack's
+catalog_index_stage). Until then the same items are read from
+artist-id-index, where they share the partition with the artist's other
+items and are filtered on their pk prefix.
+"""
+import os
+
+SPARSE_ENV = 'SPARSE_ARTIST_INDEXES'
+
+# Table and artist-id-index key attributes, used to build continuation keys
+ARTIST_INDEX_KEY = ('pk', 'sk', 'artist_id', 'created_at')
+
+SPARSE_INDEXES = {
+    'SONG': ('artist-songs-index', 'artist_songs'),
+    'ALBUM': ('artist-albums-index', 'artist_albums')
+}
+
+
+def sparse():
+    """True once the sparse indexes are backfilled and read."""
+    return os.environ.get(SPARSE_ENV) == 'true'
+
+
+def query(entity_type, artist_id):
+    """Query parameters for the artist's items of `entity_type` (SONG or ALBUM)."""
+    if sparse():
+        index_name, key = SPARSE_INDEXES[entity_type]
+        return {
+            'IndexName': index_name,
+            'KeyConditionExpression': f'{key} = :artist_id',
+            'ExpressionAttributeValues': {
+                ':artist_id': artist_id
+            }
+        }
+    return {
+        'IndexName': 'artist-id-index',
+        'KeyConditionExpression': 'artist_id = :artist_id',
+        'FilterExpression': 'begins_with(pk, :prefix)',
+        'ExpressionAttributeValues': {
+            ':artist_id': artist_id,
+            ':prefix': f'{entity_type}#'
+        }
+    }
+
+
+def key_attributes():
+    """
+    Key attributes for query_page: None on the sparse indexes, which need
+    no filter, else those of artist-id-index for page-filling reads.
+    """
+    return None if sparse() else ARTIST_INDEX_KEY
+
+
+def scope(name, artist_id):
+    """Cursor scope of a discography listing; cursors do not carry over between the indexes."""
+    return f'{name}:{artist_id}' if sparse() else f'{name}:{artist_id}:artist-id-index'
@@ -0,0 +1,122 @@
+"""
+Multi-item DynamoDB operations on the catalog table.
+These use the table's resource client, so keys, items and expression values
+are plain Python values, as with the Table API.
+"""
+import os
+import random
+import time
+
+from botocore.exceptions import ClientError
+
+from common import clients
+
+# Retries for UnprocessedKeys / UnprocessedItems, with jittered exponential backoff
+MAX_ATTEMPTS = 8
+BACKOFF_BASE_S = 0.025
+BACKOFF_CAP_S = 1.0
+
+
+class TransactionCancelled(Exception):
+    """
+    A TransactWriteItems call was cancelled. `reasons` holds one code per
+    action, in order ('None' for actions that did not cause the failure).
+    """
+    
+    def __init__(self, reasons, message=''):
+        super().__init__(message or ', '.join(reasons))
+        self.reasons = reasons
+    
+    def failed(self, index):
+        """True if action `index` failed its condition check."""
+        return index < len(self.reasons) and self.reasons[index] == 'ConditionalCheckFailed'
+
+
+def _table_name(table_name):
+    return table_name or os.environ['TABLE_NAME']
+
+
+def backoff(attempt):
+    """Sleep before retry `attempt` (1-based) with full jitter."""
+    time.sleep(random.uniform(0, min(BACKOFF_CAP_S, BACKOFF_BASE_S * (2 ** attempt))))
+
+
+def batch_get(keys, table_name=None, projection=None):
+    """
+    Fetch up to 100 items by key in one BatchGetItem call, retrying
+    unprocessed keys. Returns the items found, in no particular order.
+    `projection` is an optional common.projection.Projection.
+    """
+    request = {'Keys': list(keys)}
+    if projection is not None:
+        request = projection.apply(request)
+    name = _table_name(table_name)
+    request_items = {name: request}
+    found = []
+    
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        response = clients.resource('dynamodb').meta.client.batch_get_item(RequestItems=request_items)
+        found.extend(response.get('Responses', {}).get(name, []))
+        request_items = response.get('UnprocessedKeys') or {}
+        if not request_items:
+            return found
+        backoff(attempt)
+    raise RuntimeError(f'BatchGetItem left {len(request_items[name]["Keys"])} keys unprocessed')
+
+
+def batch_write(requests, table_name=None):
+    """
+    Run up to 25 write requests ({'DeleteRequest': {'Key': ...}} or
+    {'PutRequest': {'Item': ...}}) in one BatchWriteItem call, retrying
+    unprocessed items. Raises RuntimeError if items remain unprocessed.
+    """
+    name = _table_name(table_name)
+    request_items = {name: list(requests)}
+    
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        response = clients.resource('dynamodb').meta.client.batch_write_item(RequestItems=request_items)
+        request_items = response.get('UnprocessedItems') or {}
+        if not request_items:
+            return
+        backoff(attempt)
+    raise RuntimeError(f'BatchWriteItem left {len(request_items[name])} items unprocessed')
+
+
+def query_all(query_params, table_name=None):
+    """
+    Yield every item matching `query_params`, following LastEvaluatedKey
+    across pages. Safe to call from worker threads.
+    """
+    params = dict(query_params, TableName=_table_name(table_name))
+    while True:
+        response = clients.resource('dynamodb').meta.client.query(**params)
+        yield from response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            return
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def transact_write(actions, table_name=None, token=None):
+    """
+    Run TransactWriteItems. Each action is a single-key dict such as
+    {'Put': {'Item': ...}} or {'Update': {'Key': ..., 'UpdateExpression': ...}};
+    TableName is filled in. `token` makes retries of the same request
+    idempotent. Raises TransactionCancelled when any condition fails.
+    """
+    name = _table_name(table_name)
+    transact_items = [
+        {operation: dict(params, TableName=params.get('TableName', name))}
+        for action in actions
+        for operation, params in action.items()
+    ]
+    params = {'TransactItems': transact_items}
+    if token:
+        params['ClientRequestToken'] = token
+    
+    try:
+        clients.resource('dynamodb').meta.client.transact_write_items(**params)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'TransactionCanceledException':
+            raise
+        reasons = [reason.get('Code', 'None') for reason in e.response.get('CancellationReasons', [])]
+        raise TransactionCancelled(reasons, e.response['Error'].get('Message', ''))
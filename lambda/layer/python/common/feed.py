@@ -0,0 +1,265 @@
+"""
+"New releases" feed of the artists a user follows, built push/pull.
+Releases of most artists are pushed: the notification workers that send a
+release's chunks also write a feed entry per song or album into each
+recipient's item collection (pk FEED#<user_id>, sk <created_at>#<content_id>),
+so reading a feed is one query. Artists with more than PUSH_MAX_SHARDS
+subscriber shards would cost millions of writes per release, so their
+releases are not pushed; they are listed in the PULL_ARTISTS item, and
+readers merge their songs and albums in from the catalog's artist-id-index
+instead. Followed artists the user muted are pulled as well, as their
+subscriptions are not in the notification audience.
+
+A page k-way merges the pushed entries and the pulled artists on
+(created_at, content_id), newest first. The feed covers FEED_DAYS
+(pushed entries expire through the table's TTL) and at most
+MAX_FEED_ENTRIES entries; pages after that are empty. Unsubscribing
+deletes the artist's pushed entries from the user's feed; entries that
+remain (e.g. pushed while the unsubscribe ran) are skipped on read.
+"""
+import heapq
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from common import clients
+from common.dynamo import batch_write, query_all
+from common.pagination import query_page
+
+# Artists with more subscriber shards are pulled on read
+PUSH_MAX_SHARDS = 2
+
+FEED_DAYS = 30
+MAX_FEED_ENTRIES = 200
+
+# Pulled artists per page: large artists first, then the most recently followed muted ones
+MAX_PULL_ARTISTS = 10
+
+# Readers may use a PULL_ARTISTS set this old
+PULL_ARTISTS_CACHE_SECONDS = 300
+
+BATCH_WRITE_SIZE = 25
+
+# Table and artist-id-index key attributes
+PULL_KEY_ATTRIBUTES = ('pk', 'sk', 'artist_id', 'created_at')
+
+# Upper bound on pushed entries evaluated by one query
+MAX_PUSHED_PER_QUERY = 1000
+
+_pull_artists = []
+
+
+def feed_key(user_id, entry):
+    return {
+        'pk': f'FEED#{user_id}',
+        'sk': f"{entry['created_at']}#{entry['content_id']}"
+    }
+
+
+def pull_artists_key():
+    return {
+        'pk': 'FEED',
+        'sk': 'PULL_ARTISTS'
+    }
+
+
+def entry(content_type, content_id, title, artist_id, artist_name, created_at):
+    """A feed entry for a released song or album."""
+    return {
+        'content_type': content_type,
+        'content_id': content_id,
+        'title': title,
+        'artist_id': artist_id,
+        'artist_name': artist_name,
+        'created_at': created_at
+    }
+
+
+def pushed(shard_count):
+    """True if releases of an artist with `shard_count` subscriber shards are pushed."""
+    return shard_count <= PUSH_MAX_SHARDS
+
+
+def push(user_ids, entries):
+    """
+    Write `entries` into the feeds of `user_ids`. Writes are idempotent, so
+    a redelivered chunk only rewrites them. Returns the number written.
+    """
+    expires_at = int(time.time()) + FEED_DAYS * 86400
+    requests = [
+        # The entry is kept as a map: top-level artist_id and created_at
+        # would put feed items in the catalog's artist-id-index
+        {'PutRequest': {'Item': {**feed_key(user_id, item), 'entry': item, 'expires_at': expires_at}}}
+        for user_id in user_ids
+        for item in entries
+    ]
+    for start in range(0, len(requests), BATCH_WRITE_SIZE):
+        batch_write(requests[start:start + BATCH_WRITE_SIZE])
+    return len(requests)
+
+
+def remove_artist(user_id, artist_id):
+    """
+    Delete the artist's pushed entries from the user's feed, e.g. after
+    unsubscribing. Returns the number deleted.
+    """
+    query_params = {
+        'KeyConditionExpression': 'pk = :pk',
+        'FilterExpression': '#entry.artist_id = :artist_id',
+        'ProjectionExpression': 'pk, sk',
+        'ExpressionAttributeNames': {'#entry': 'entry'},
+        'ExpressionAttributeValues': {':pk': f'FEED#{user_id}', ':artist_id': artist_id}
+    }
+    requests = [{'DeleteRequest': {'Key': key}} for key in query_all(query_params)]
+    for start in range(0, len(requests), BATCH_WRITE_SIZE):
+        batch_write(requests[start:start + BATCH_WRITE_SIZE])
+    return len(requests)
+
+
+def add_pull_artist(artist_id):
+    """List an artist whose releases are no longer pushed."""
+    clients.table().update_item(
+        Key=pull_artists_key(),
+        UpdateExpression='ADD artists :artist',
+        ExpressionAttributeValues={':artist': {artist_id}}
+    )
+
+
+def pull_artists():
+    """The artists read on pull, cached for PULL_ARTISTS_CACHE_SECONDS."""
+    if not _pull_artists or _pull_artists[1] < time.monotonic():
+        item = clients.table().get_item(Key=pull_artists_key()).get('Item') or {}
+        _pull_artists[:] = [set(item.get('artists', ())), time.monotonic() + PULL_ARTISTS_CACHE_SECONDS]
+    return _pull_artists[0]
+
+
+def page(user_id, limit, position=None):
+    """
+    One page of the user's feed after `position` (from a previous page).
+    Returns (entries, next_position); next_position is None on the last page.
+    """
+    position = position or {}
+    served = int(position.get('served', 0))
+    limit = min(limit, MAX_FEED_ENTRIES - served)
+    if limit <= 0:
+        return [], None
+    before = (position['created_at'], position['content_id']) if position.get('created_at') else None
+    since = (datetime.utcnow() - timedelta(days=FEED_DAYS)).isoformat()
+    
+    followed = _followed(user_id)
+    large = pull_artists()
+    pulled = sorted(
+        (artist_id for artist_id, subscription in followed.items()
+         if artist_id in large or not subscription.get('notification_enabled', True)),
+        key=lambda artist_id: (artist_id in large, followed[artist_id].get('subscription_date', '')),
+        reverse=True
+    )[:MAX_PULL_ARTISTS]
+    
+    sources = [lambda: _read_pushed(user_id, limit, before, since, followed)]
+    sources += [lambda artist_id=artist_id: _read_pulled(artist_id, limit, before, since) for artist_id in pulled]
+    with ThreadPoolExecutor(max_workers=len(sources)) as pool:
+        results = list(pool.map(lambda read: read(), sources))
+    
+    # Newest first; entries both pushed and pulled are dropped. Every source
+    # returns `limit` entries unless it has no more, so the page never passes
+    # an entry that was not read.
+    entries = []
+    seen = set()
+    more = any(has_more for _, has_more in results)
+    for item in heapq.merge(*(items for items, _ in results), key=_sort_key, reverse=True):
+        if item['content_id'] in seen:
+            continue
+        if len(entries) == limit:
+            more = True
+            break
+        seen.add(item['content_id'])
+        entries.append(item)
+    
+    if not more or not entries or served + len(entries) >= MAX_FEED_ENTRIES:
+        return entries, None
+    last = entries[-1]
+    return entries, {
+        'created_at': last['created_at'],
+        'content_id': last['content_id'],
+        'served': served + len(entries)
+    }
+
+
+def _sort_key(item):
+    return item['created_at'], item['content_id']
+
+
+def _followed(user_id):
+    query_params = {
+        'KeyConditionExpression': 'user_id = :user_id',
+        'ProjectionExpression': 'artist_id, notification_enabled, subscription_date',
+        'ExpressionAttributeValues': {':user_id': user_id}
+    }
+    # All of them: pushed entries are kept only for artists still followed
+    return {
+        subscription['artist_id']: subscription
+        for subscription in query_all(query_params, table_name=os.environ['SUBSCRIPTIONS_TABLE_NAME'])
+    }
+
+
+def _read_pushed(user_id, limit, before, since, followed):
+    """
+    Up to `limit` pushed entries of `followed` artists older than `before`,
+    newest first. Entries of other artists are skipped, and reads continue
+    until the page is filled or the feed is exhausted; they are sized from
+    the share of entries kept so far.
+    """
+    upper = f'{before[0]}#{before[1]}' if before else '~'
+    query_params = {
+        'KeyConditionExpression': 'pk = :pk AND sk BETWEEN :since AND :upper',
+        'ExpressionAttributeValues': {':pk': f'FEED#{user_id}', ':since': since, ':upper': upper},
+        'ScanIndexForward': False
+    }
+    items = []
+    read = 0
+    while True:
+        # One past the page, to tell whether there are more
+        remaining = limit + 1 - len(items)
+        selectivity = max(len(items), 1) / read if read else 1
+        query_params['Limit'] = min(MAX_PUSHED_PER_QUERY, max(remaining, math.ceil(remaining / selectivity)))
+        response = clients.table().query(**query_params)
+        read += len(response.get('Items', []))
+        items += [
+            item['entry'] for item in response.get('Items', [])
+            if item['entry']['artist_id'] in followed and (not before or _sort_key(item['entry']) < before)
+        ]
+        last_key = response.get('LastEvaluatedKey')
+        if len(items) > limit or not last_key:
+            return items[:limit], len(items) > limit
+        query_params['ExclusiveStartKey'] = last_key
+
+
+def _read_pulled(artist_id, limit, before, since):
+    """Up to `limit` songs and albums of the artist older than `before`, as entries, newest first."""
+    query_params = {
+        'IndexName': 'artist-id-index',
+        'KeyConditionExpression': 'artist_id = :artist_id AND created_at BETWEEN :since AND :upper',
+        'FilterExpression': 'sk = :metadata AND entity_type IN (:song, :album)',
+        'ProjectionExpression': 'pk, sk, entity_type, title, artist_id, artist_name, created_at',
+        'ExpressionAttributeValues': {
+            ':artist_id': artist_id,
+            ':since': since,
+            ':upper': before[0] if before else '~',
+            ':metadata': 'METADATA',
+            ':song': 'SONG',
+            ':album': 'ALBUM'
+        },
+        'ScanIndexForward': False
+    }
+    # The index also holds the artist's release records, so reads are sized
+    # from the filter's selectivity. Items sharing the cursor's created_at
+    # may be on either side of it.
+    items, last_key = query_page(clients.table(), query_params, limit + 1, key_attributes=PULL_KEY_ATTRIBUTES)
+    entries = [
+        entry(item['entity_type'], item['pk'].split('#', 1)[1], item['title'], item['artist_id'], item.get('artist_name', ''), item['created_at'])
+        for item in items
+    ]
+    entries = sorted((item for item in entries if not before or _sort_key(item) < before), key=_sort_key, reverse=True)
+    return entries[:limit], len(entries) > limit or bool(last_key)
@@ -0,0 +1,259 @@
+"""
+Background job records.
+A job is a catalog item (pk JOB#<id>, sk METADATA) holding its status, the
+phase and checkpoint of the worker, and progress counters. Workers hold a
+lease while they run and save each processed chunk with a conditional
+update on `seq`, so a duplicate queue message can neither run the same job
+twice at once nor record a chunk twice. Finished jobs expire after
+JOB_TTL_DAYS through the table's TTL attribute.
+"""
+import time
+import uuid
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+from common import clients
+from common.dynamo import TransactionCancelled, transact_write
+from common.messaging import get_queue
+from common.responses import JSON_HEADERS, json_response
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+FINISHED = (SUCCEEDED, FAILED)
+
+# Progress counters, all starting at zero
+COUNTERS = ('items_deleted', 'objects_deleted', 'objects_failed', 'songs_deleted')
+
+# Error messages kept on the job; error_count keeps counting past this
+MAX_ERRORS = 50
+
+JOB_TTL_DAYS = 7
+
+
+class StaleJob(Exception):
+    """The job moved on (another worker saved a chunk, or the lease was lost)."""
+
+
+def job_key(job_id):
+    return {
+        'pk': f'JOB#{job_id}',
+        'sk': 'METADATA'
+    }
+
+
+def new_job(job_type, target_id, created_by=None):
+    """Build the item of a queued job. It is not written."""
+    now = datetime.utcnow().isoformat()
+    job_id = str(uuid.uuid4())
+    job = {
+        **job_key(job_id),
+        'entity_type': 'JOB',
+        'job_id': job_id,
+        'job_type': job_type,
+        'target_id': target_id,
+        'status': QUEUED,
+        'phase': None,
+        'checkpoint': None,
+        'seq': 0,
+        'errors': [],
+        'error_count': 0,
+        'attempts': 0,
+        'created_at': now,
+        'updated_at': now
+    }
+    for counter in COUNTERS:
+        job[counter] = 0
+    if created_by:
+        job['created_by'] = created_by
+    return job
+
+
+def get(job_id):
+    """The job item, or None. Reads are strongly consistent."""
+    response = clients.table().get_item(Key=job_key(job_id), ConsistentRead=True)
+    return response.get('Item')
+
+
+def _update(job, sets=None, adds=None, removes=(), condition=None, values=None):
+    names = {}
+    expression_values = dict(values or {})
+    clauses = []
+    
+    def alias(name):
+        key = f'#n{len(names)}'
+        names[key] = name
+        return key
+    
+    set_parts = []
+    for name, value in (sets or {}).items():
+        key = alias(name)
+        expression_values[f':{key[1:]}'] = value
+        set_parts.append(f'{key} = :{key[1:]}')
+    if set_parts:
+        clauses.append('SET ' + ', '.join(set_parts))
+    
+    add_parts = []
+    for name, value in (adds or {}).items():
+        key = alias(name)
+        expression_values[f':{key[1:]}'] = value
+        add_parts.append(f'{key} :{key[1:]}')
+    if add_parts:
+        clauses.append('ADD ' + ', '.join(add_parts))
+    
+    if removes:
+        clauses.append('REMOVE ' + ', '.join(alias(name) for name in removes))
+    
+    names['#seq'] = 'seq'
+    params = {
+        'Key': job_key(job['job_id']),
+        'UpdateExpression': ' '.join(clauses),
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': expression_values,
+        'ReturnValues': 'ALL_NEW'
+    }
+    if condition:
+        params['ConditionExpression'] = condition
+    
+    try:
+        return clients.table().update_item(**params)['Attributes']
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            raise StaleJob(job['job_id'])
+        raise
+
+
+def acquire(job, owner, lease_seconds):
+    """
+    Take the job's lease for `owner` if it is free or expired and mark the
+    job running. Raises StaleJob if another worker holds it.
+    """
+    now = int(time.time())
+    return _update(
+        job,
+        sets={
+            'status': RUNNING,
+            'lease_owner': owner,
+            'lease_expires': now + lease_seconds,
+            'updated_at': datetime.utcnow().isoformat()
+        },
+        condition='#seq = :seq AND (attribute_not_exists(lease_expires) OR lease_expires < :now OR lease_owner = :owner)',
+        values={':seq': job['seq'], ':now': now, ':owner': owner}
+    )
+
+
+def advance(job, owner, counters=None, errors=(), release=False, **changes):
+    """
+    Save a processed chunk: SET `changes` (e.g. phase, checkpoint, status),
+    ADD `counters`, append `errors` and bump seq, provided the job is still
+    at job['seq'] and leased to `owner`. `release` frees the lease, e.g.
+    before handing the job to a new invocation. Returns the updated job.
+    """
+    sets = dict(changes, seq=job['seq'] + 1, updated_at=datetime.utcnow().isoformat())
+    adds = dict(counters or {})
+    removes = ['lease_owner', 'lease_expires'] if release else []
+    
+    if errors:
+        room = max(0, MAX_ERRORS - len(job.get('errors', [])))
+        if room:
+            sets['errors'] = list(job.get('errors', [])) + list(errors)[:room]
+        adds['error_count'] = len(errors)
+    
+    if changes.get('status') in FINISHED:
+        sets['finished_at'] = sets['updated_at']
+        sets['expires_at'] = int(time.time()) + JOB_TTL_DAYS * 86400
+        removes = ['lease_owner', 'lease_expires']
+    
+    return _update(
+        job,
+        sets=sets,
+        adds=adds,
+        removes=removes,
+        condition='#seq = :seq AND lease_owner = :owner',
+        values={':seq': job['seq'], ':owner': owner}
+    )
+
+
+def start_deletion(job_type, target_key, target_id, created_by=None):
+    """
+    Queue a job that deletes the item at `target_key` and everything under it.
+    The job is written together with a `deletion_job` marker on the target,
+    so a repeated request returns the job already under way instead of
+    starting a second one. Returns the job, or None if the target does not exist.
+    """
+    job = new_job(job_type, target_id, created_by)
+    try:
+        transact_write([
+            {'Put': {
+                'Item': job,
+                'ConditionExpression': 'attribute_not_exists(pk)'
+            }},
+            {'Update': {
+                'Key': target_key,
+                'UpdateExpression': 'SET deletion_job = :job_id',
+                'ConditionExpression': 'attribute_exists(pk) AND attribute_not_exists(deletion_job)',
+                'ExpressionAttributeValues': {':job_id': job['job_id']}
+            }}
+        ], token=job['job_id'])
+    except TransactionCancelled as e:
+        if not e.failed(1):
+            raise
+        target = clients.table().get_item(Key=target_key, ConsistentRead=True).get('Item')
+        if target is None:
+            return None
+        job = get(target['deletion_job'])
+        if job is None:
+            raise RuntimeError(f"Deletion job {target['deletion_job']} of {target_key['pk']} is missing")
+        if job['status'] != QUEUED:
+            return job
+        # Still queued: the first message may have been lost, send another.
+        # A duplicate is harmless as only the lease holder works on a job.
+    
+    get_queue().send({'job_id': job['job_id']})
+    return job
+
+
+def release_target(job, target_key):
+    """Clear the `deletion_job` marker of a failed job so the deletion can be requested again."""
+    try:
+        clients.table().update_item(
+            Key=target_key,
+            UpdateExpression='REMOVE deletion_job',
+            ConditionExpression='deletion_job = :job_id',
+            ExpressionAttributeValues={':job_id': job['job_id']}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+
+def describe(job):
+    """The API representation of a job."""
+    return {
+        'job_id': job['job_id'],
+        'job_type': job['job_type'],
+        'target_id': job['target_id'],
+        'status': job['status'],
+        'phase': job.get('phase'),
+        'progress': {counter: job.get(counter, 0) for counter in COUNTERS},
+        'errors': job.get('errors', []),
+        'error_count': job.get('error_count', 0),
+        'attempts': job.get('attempts', 0),
+        'created_at': job['created_at'],
+        'updated_at': job.get('updated_at'),
+        'finished_at': job.get('finished_at')
+    }
+
+
+def accepted(job, message):
+    """The 202 response for a queued job, pointing at its status endpoint."""
+    status_url = f"/jobs/{job['job_id']}"
+    return json_response(202, {
+        'message': message,
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'status_url': status_url
+    }, headers=dict(JSON_HEADERS, Location=status_url))
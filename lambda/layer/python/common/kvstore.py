@@ -0,0 +1,247 @@
+"""
+Shared key-value stores for the catalog cache tier (common/cache.py).
+CATALOG_CACHE_URL names the store: redis:// or rediss:// (TLS) for a
+single-shard server speaking the Redis protocol (ElastiCache or Valkey
+with cluster mode disabled, a local redis-server), with an optional
+password and database number (rediss://:password@host:6379/0). local:// selects an in-process
+MemoryStore that tests and local runs use in its place. When the variable
+is unset there is no shared tier.
+
+The Redis client is a minimal RESP implementation, so the layer needs no
+extra packages. It keeps one connection per container and reconnects once
+when the connection has gone away (e.g. after the container was frozen).
+It does not route keys to cluster slots or follow MOVED/ASK redirects, so
+cluster-mode endpoints are not supported: their redirects surface as
+StoreError, and the cache tier is then bypassed.
+"""
+import os
+import socket
+import ssl
+import threading
+import time
+from urllib.parse import unquote, urlparse
+
+LOCAL_SCHEME = 'local://'
+
+CONNECT_TIMEOUT_SECONDS = 0.5
+COMMAND_TIMEOUT_SECONDS = 0.25
+
+# Store `value` under KEYS[2] only while KEYS[1] (the refill lock) still
+# holds ARGV[1]; an invalidation in the meantime deletes the lock.
+_PUBLISH_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('SET', KEYS[2], ARGV[2], 'PX', ARGV[3])
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+return 0
+"""
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class StoreError(Exception):
+    """The shared store could not be reached or rejected a command."""
+
+
+class RedisStore:
+    """A Redis-protocol server addressed by URL."""
+    
+    def __init__(self, url, timeout=COMMAND_TIMEOUT_SECONDS):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.tls = parsed.scheme == 'rediss'
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.database = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._socket = None
+        self._reader = None
+        self._lock = threading.Lock()
+    
+    def get_many(self, keys):
+        """Values of `keys` (bytes, or None when absent), in order."""
+        return self._pipeline([('GET', key) for key in keys])
+    
+    def set(self, key, value, ttl_ms, only_if_absent=False):
+        """Store `value` for `ttl_ms`. Returns False if `only_if_absent` and the key exists."""
+        command = ['SET', key, value, 'PX', int(ttl_ms)]
+        if only_if_absent:
+            command.append('NX')
+        return self._pipeline([command])[0] is not None
+    
+    def publish(self, lock_key, token, key, value, ttl_ms):
+        """Store `value` if `lock_key` still holds `token`, and release the lock."""
+        return self._pipeline([('EVAL', _PUBLISH_SCRIPT, 2, lock_key, key, token, value, int(ttl_ms))])[0] == 1
+    
+    def release(self, lock_key, token):
+        """Delete `lock_key` if it still holds `token`."""
+        script = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end return 0"
+        self._pipeline([('EVAL', script, 1, lock_key, token)])
+    
+    def delete(self, keys):
+        """Delete `keys`, one pipelined DEL per key."""
+        if keys:
+            self._pipeline([('DEL', key) for key in keys])
+    
+    def close(self):
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+        self._socket = self._reader = None
+    
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=CONNECT_TIMEOUT_SECONDS)
+        if self.tls:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=self.host)
+        sock.settimeout(self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._socket, self._reader = sock, sock.makefile('rb')
+        
+        setup = []
+        if self.password:
+            setup.append(['AUTH', self.username, self.password] if self.username else ['AUTH', self.password])
+        if self.database:
+            setup.append(['SELECT', self.database])
+        if setup:
+            self._send(setup)
+            _raise_errors([self._read_reply() for _ in setup])
+    
+    def _pipeline(self, commands):
+        with self._lock:
+            for attempt in (1, 2):
+                fresh = self._socket is None
+                try:
+                    if fresh:
+                        self._connect()
+                    self._send(commands)
+                    return _raise_errors([self._read_reply() for _ in commands])
+                except (OSError, EOFError) as e:
+                    self.close()
+                    # A reused connection may have been dropped while idle
+                    if fresh or attempt == 2:
+                        raise StoreError(f'{self.host}:{self.port}: {str(e)}') from e
+    
+    def _send(self, commands):
+        payload = bytearray()
+        for command in commands:
+            payload += b'*%d\r\n' % len(command)
+            for argument in command:
+                if not isinstance(argument, bytes):
+                    argument = str(argument).encode()
+                payload += b'$%d\r\n%s\r\n' % (len(argument), argument)
+        self._socket.sendall(payload)
+    
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise EOFError('Connection closed by server')
+        kind, data = line[:1], line[1:-2]
+        if kind == b'+':
+            return data.decode()
+        if kind == b'-':
+            # Returned, not raised, so the rest of a pipeline is still read
+            return StoreError(data.decode())
+        if kind == b':':
+            return int(data)
+        if kind == b'$':
+            length = int(data)
+            if length < 0:
+                return None
+            value = self._reader.read(length + 2)
+            if len(value) != length + 2:
+                raise EOFError('Connection closed by server')
+            return value[:-2]
+        if kind == b'*':
+            length = int(data)
+            return None if length < 0 else [self._read_reply() for _ in range(length)]
+        raise StoreError(f'Unexpected reply: {line!r}')
+
+
+class MemoryStore:
+    """
+    In-process stand-in for a Redis server with the same operations, for
+    tests and local runs. `commands` counts the operations it served.
+    """
+    
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.commands = 0
+        self._values = {}  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+    
+    def get_many(self, keys):
+        with self._lock:
+            self.commands += len(keys)
+            return [self._get(key) for key in keys]
+    
+    def set(self, key, value, ttl_ms, only_if_absent=False):
+        with self._lock:
+            self.commands += 1
+            if only_if_absent and self._get(key) is not None:
+                return False
+            self._set(key, value, ttl_ms)
+            return True
+    
+    def publish(self, lock_key, token, key, value, ttl_ms):
+        with self._lock:
+            self.commands += 1
+            if self._get(lock_key) != _encode(token):
+                return False
+            self._set(key, value, ttl_ms)
+            self._values.pop(lock_key, None)
+            return True
+    
+    def release(self, lock_key, token):
+        with self._lock:
+            self.commands += 1
+            if self._get(lock_key) == _encode(token):
+                self._values.pop(lock_key, None)
+    
+    def delete(self, keys):
+        with self._lock:
+            self.commands += len(keys)
+            for key in keys:
+                self._values.pop(key, None)
+    
+    def close(self):
+        pass
+    
+    def _get(self, key):
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= self.clock():
+            del self._values[key]
+            return None
+        return entry[1]
+    
+    def _set(self, key, value, ttl_ms):
+        self._values[key] = (self.clock() + ttl_ms / 1000.0, _encode(value))
+
+
+def _raise_errors(replies):
+    for reply in replies:
+        if isinstance(reply, StoreError):
+            raise reply
+    return replies
+
+
+def _encode(value):
+    return value if isinstance(value, bytes) else str(value).encode()
+
+
+def get_store(env_var='CATALOG_CACHE_URL'):
+    """The store named by `env_var`, or None when it is unset."""
+    url = os.environ.get(env_var)
+    if not url:
+        return None
+    if url not in _stores:
+        with _stores_lock:
+            if url not in _stores:
+                _stores[url] = MemoryStore() if url.startswith(LOCAL_SCHEME) else RedisStore(url)
+    return _stores[url]
@@ -0,0 +1,291 @@
+"""
+Rate-limited, concurrent email sending through SES.
+A Mailer sends messages from a bounded thread pool. Every send first takes
+one token per recipient from a TokenBucket refilled at the account's SES
+send rate, so the pool never outruns the quota. Messages go out one per
+SendEmail call, or from a registered template with SendBulkTemplatedEmail,
+up to BULK_BATCH_SIZE recipients per call. Sends that are throttled or fail
+transiently are retried with jittered exponential backoff (for bulk sends,
+only the recipients that failed); other errors (e.g. a rejected address)
+fail the recipient straight away.
+
+The send rate is SES_MAX_SEND_RATE when set, otherwise MaxSendRate from
+GetSendQuota, read once per container.
+"""
+import json
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from common import clients
+
+# Sender threads: enough to keep SEND_LATENCY_S long calls at the send rate,
+# within the connection pool of common.clients
+MAX_WORKERS = 48
+SEND_LATENCY_S = 0.1
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_S = 0.1
+BACKOFF_CAP_S = 5.0
+
+# SES sandbox rate, used if GetSendQuota fails
+DEFAULT_SEND_RATE = 1.0
+
+# Failed recipients kept for the response; the count covers all of them
+MAX_REPORTED_FAILURES = 50
+
+# Destinations per SendBulkTemplatedEmail call, the SES maximum
+BULK_BATCH_SIZE = 50
+
+# Per-destination statuses of a bulk send that are worth another attempt
+RETRYABLE_STATUSES = ('TransientFailure', 'AccountThrottled', 'Failed')
+
+RETRYABLE_ERRORS = (
+    'Throttling',
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'ServiceUnavailable',
+    'InternalFailure',
+    'RequestTimeout'
+)
+
+_send_rate = []
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second on average, with bursts of up to
+    `capacity`. Thread-safe; acquire() reserves its tokens and blocks
+    until the bucket has earned them, so callers are served in order and
+    requests for more than `capacity` at once also keep to the rate.
+    """
+    
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+    
+    def acquire(self, tokens=1):
+        """Take `tokens`, waiting until the bucket has earned them."""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve the tokens now; callers behind this one wait for the debt
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate
+        if wait > 0:
+            self.sleep(wait)
+
+
+def send_rate():
+    """Messages per second this account may send."""
+    if not _send_rate:
+        configured = os.environ.get('SES_MAX_SEND_RATE')
+        if configured:
+            rate = float(configured)
+        else:
+            try:
+                rate = float(clients.ses().get_send_quota()['MaxSendRate'])
+            except Exception as e:
+                print(f"Warning: Could not read the SES send quota: {str(e)}")
+                return DEFAULT_SEND_RATE
+        _send_rate.append(rate)
+    return _send_rate[0]
+
+
+def _backoff(attempt):
+    time.sleep(random.uniform(0, min(BACKOFF_CAP_S, BACKOFF_BASE_S * (2 ** attempt))))
+
+
+def _retryable(error):
+    if not isinstance(error, ClientError):
+        return False
+    code = error.response.get('Error', {}).get('Code', '')
+    status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+    return code in RETRYABLE_ERRORS or status >= 500
+
+
+class Mailer:
+    """
+    Sends emails concurrently within the SES send rate and counts the
+    outcome in `sent`, `failed` and `retries`, and the SES calls made in
+    `calls`. `failed_recipients` keeps the
+    first MAX_REPORTED_FAILURES failed addresses; `retryable` holds all
+    recipients that were still throttled or failing transiently after the
+    last attempt, which are worth sending to again later. Mailers may share
+    a `bucket` to pace them together. Past `deadline` (a time.monotonic()
+    value) nothing more is sent; those recipients are kept in `unsent`.
+    """
+    
+    def __init__(self, source=None, rate=None, max_workers=None, max_attempts=MAX_ATTEMPTS, ses=None, bucket=None, deadline=None):
+        self.source = source or os.environ.get('SES_SENDER_EMAIL', 'noreply@musicstreaming.local')
+        self.bucket = bucket or TokenBucket(rate or send_rate())
+        max_workers = max_workers or min(MAX_WORKERS, max(1, math.ceil(self.bucket.rate * SEND_LATENCY_S)))
+        self.max_attempts = max_attempts
+        self.sent = 0
+        self.calls = 0
+        self.failed = 0
+        self.retries = 0
+        self.failed_recipients = []
+        self.retryable = []
+        self.unsent = []
+        self.deadline = deadline
+        self._ses = ses
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+    
+    def send_all(self, recipients, subject, html):
+        """
+        Send the same message to each address in `recipients` (one email
+        per address) and wait for all of them.
+        """
+        list(self._pool.map(lambda recipient: self.send(recipient, subject, html), recipients))
+    
+    def send(self, recipient, subject, html):
+        """Send one email, retrying transient failures. Returns True if it was sent."""
+        ses = self._ses or clients.ses()
+        for attempt in range(1, self.max_attempts + 1):
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                with self._lock:
+                    self.unsent.append(recipient)
+                return False
+            self.bucket.acquire()
+            with self._lock:
+                self.calls += 1
+            try:
+                ses.send_email(
+                    Source=self.source,
+                    Destination={
+                        'ToAddresses': [recipient]
+                    },
+                    Message={
+                        'Subject': {
+                            'Data': subject,
+                            'Charset': 'UTF-8'
+                        },
+                        'Body': {
+                            'Html': {
+                                'Data': html,
+                                'Charset': 'UTF-8'
+                            }
+                        }
+                    }
+                )
+                with self._lock:
+                    self.sent += 1
+                return True
+            except Exception as e:
+                retryable = _retryable(e)
+                if attempt < self.max_attempts and retryable:
+                    with self._lock:
+                        self.retries += 1
+                    _backoff(attempt)
+                    continue
+                print(f"Failed to send email to {recipient}: {str(e)}")
+                self.fail(recipient, retryable)
+                return False
+    
+    def send_bulk(self, recipients, template, template_data, replacement_data=None):
+        """
+        Send the SES template `template` to each address in `recipients`
+        with SendBulkTemplatedEmail, BULK_BATCH_SIZE per call, and wait for
+        all of them. `template_data` fills the template for everyone;
+        `replacement_data(recipient)` returns the values that differ per
+        recipient.
+        """
+        default_data = json.dumps(template_data)
+        batches = [recipients[start:start + BULK_BATCH_SIZE] for start in range(0, len(recipients), BULK_BATCH_SIZE)]
+        list(self._pool.map(lambda batch: self._send_batch(batch, template, default_data, replacement_data), batches))
+    
+    def _send_batch(self, recipients, template, default_data, replacement_data):
+        ses = self._ses or clients.ses()
+        pending = list(recipients)
+        for attempt in range(1, self.max_attempts + 1):
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                with self._lock:
+                    self.unsent.extend(pending)
+                return
+            self.bucket.acquire(len(pending))
+            with self._lock:
+                self.calls += 1
+            try:
+                response = ses.send_bulk_templated_email(
+                    Source=self.source,
+                    Template=template,
+                    DefaultTemplateData=default_data,
+                    Destinations=[_destination(recipient, replacement_data) for recipient in pending]
+                )
+            except Exception as e:
+                retryable = _retryable(e)
+                if attempt < self.max_attempts and retryable:
+                    with self._lock:
+                        self.retries += 1
+                    _backoff(attempt)
+                    continue
+                print(f"Failed to send {len(pending)} emails: {str(e)}")
+                for recipient in pending:
+                    self.fail(recipient, retryable)
+                return
+            
+            # Statuses come back in the order of the destinations
+            retry = []
+            sent = 0
+            for recipient, status in zip(pending, response['Status']):
+                if status.get('Status') == 'Success':
+                    sent += 1
+                elif status.get('Status') in RETRYABLE_STATUSES:
+                    retry.append(recipient)
+                else:
+                    print(f"Failed to send email to {recipient}: {status.get('Status')} {status.get('Error', '')}")
+                    self.fail(recipient)
+            with self._lock:
+                self.sent += sent
+            if not retry:
+                return
+            pending = retry
+            if attempt < self.max_attempts:
+                with self._lock:
+                    self.retries += 1
+                _backoff(attempt)
+        for recipient in pending:
+            print(f"Failed to send email to {recipient}: still failing after {self.max_attempts} attempts")
+            self.fail(recipient, retryable=True)
+    
+    def fail(self, recipient, retryable=False):
+        """Count a recipient that could not be sent to."""
+        with self._lock:
+            self.failed += 1
+            if retryable:
+                self.retryable.append(recipient)
+            if len(self.failed_recipients) < MAX_REPORTED_FAILURES:
+                self.failed_recipients.append(recipient)
+    
+    def close(self):
+        self._pool.shutdown(wait=True)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _destination(recipient, replacement_data):
+    destination = {
+        'Destination': {
+            'ToAddresses': [recipient]
+        }
+    }
+    if replacement_data is not None:
+        destination['ReplacementTemplateData'] = json.dumps(replacement_data(recipient))
+    return destination
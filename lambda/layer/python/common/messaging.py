@@ -0,0 +1,136 @@
+"""
+Work queues for background jobs.
+Producers send JSON messages to the queue named by an environment variable
+(JOBS_QUEUE_URL by default), which in AWS holds an SQS queue URL. When the
+variable is unset or starts with local://, an in-process LocalQueue stands
+in for SQS: tests and local runs drain it into the consuming handler with
+SQS-shaped events, redelivering failed messages like a visibility timeout.
+"""
+import json
+import os
+import threading
+import uuid
+from collections import deque
+
+from common import clients
+from common.dynamo import MAX_ATTEMPTS, backoff
+
+LOCAL_SCHEME = 'local://'
+
+# SQS caps DelaySeconds at 15 minutes
+MAX_DELAY_SECONDS = 900
+
+# Messages per SendMessageBatch call
+SEND_BATCH_SIZE = 10
+
+_local_queues = {}
+_local_lock = threading.Lock()
+
+
+class SqsQueue:
+    """An SQS queue addressed by URL."""
+    
+    def __init__(self, url):
+        self.url = url
+    
+    def send(self, message, delay_seconds=0):
+        """Send `message` as a JSON body. Returns the message ID."""
+        params = {
+            'QueueUrl': self.url,
+            'MessageBody': json.dumps(message)
+        }
+        if delay_seconds:
+            params['DelaySeconds'] = min(int(delay_seconds), MAX_DELAY_SECONDS)
+        return clients.client('sqs').send_message(**params)['MessageId']
+    
+    def send_batch(self, messages):
+        """
+        Send `messages` as JSON bodies with SendMessageBatch, 10 per call,
+        retrying entries SQS did not accept. Raises RuntimeError if some
+        still fail.
+        """
+        messages = list(messages)
+        for start in range(0, len(messages), SEND_BATCH_SIZE):
+            entries = [
+                {'Id': str(index), 'MessageBody': json.dumps(message)}
+                for index, message in enumerate(messages[start:start + SEND_BATCH_SIZE])
+            ]
+            for attempt in range(1, MAX_ATTEMPTS + 1):
+                response = clients.client('sqs').send_message_batch(QueueUrl=self.url, Entries=entries)
+                failed = {entry['Id'] for entry in response.get('Failed', [])}
+                entries = [entry for entry in entries if entry['Id'] in failed]
+                if not entries:
+                    break
+                backoff(attempt)
+            else:
+                raise RuntimeError(f'SendMessageBatch left {len(entries)} messages unsent')
+
+
+class LocalQueue:
+    """
+    In-memory stand-in for an SQS queue. Delays are ignored; messages that
+    fail more than `max_receive_count` times move to `dead_letters`, as with
+    an SQS redrive policy.
+    """
+    
+    def __init__(self, name='local', max_receive_count=5):
+        self.name = name
+        self.max_receive_count = max_receive_count
+        self.messages = deque()
+        self.dead_letters = []
+        self.sent = 0
+    
+    def send(self, message, delay_seconds=0):
+        message_id = str(uuid.uuid4())
+        self.messages.append({
+            'messageId': message_id,
+            'body': json.dumps(message),
+            'attributes': {'ApproximateReceiveCount': '0'},
+            'eventSource': 'aws:sqs',
+            'eventSourceARN': f'arn:aws:sqs:local:000000000000:{self.name}'
+        })
+        self.sent += 1
+        return message_id
+    
+    def send_batch(self, messages):
+        for message in messages:
+            self.send(message)
+    
+    def drain(self, handler, context=None, max_deliveries=10000):
+        """
+        Deliver queued messages one at a time to the SQS-triggered `handler`,
+        including messages it sends while running, until the queue is empty.
+        Returns the number of deliveries.
+        """
+        deliveries = 0
+        while self.messages and deliveries < max_deliveries:
+            record = self.messages.popleft()
+            receive_count = int(record['attributes']['ApproximateReceiveCount']) + 1
+            record['attributes']['ApproximateReceiveCount'] = str(receive_count)
+            deliveries += 1
+            try:
+                handler({'Records': [record]}, context)
+            except Exception as e:
+                print(f"Warning: Local delivery of {record['messageId']} failed: {str(e)}")
+                if receive_count >= self.max_receive_count:
+                    self.dead_letters.append(record)
+                else:
+                    self.messages.append(record)
+        return deliveries
+
+
+def get_queue(env_var='JOBS_QUEUE_URL'):
+    """The queue whose URL is stored in `env_var` (a LocalQueue if unset or local://)."""
+    url = os.environ.get(env_var) or f'{LOCAL_SCHEME}{env_var.lower()}'
+    if not url.startswith(LOCAL_SCHEME):
+        return SqsQueue(url)
+    if url not in _local_queues:
+        with _local_lock:
+            _local_queues.setdefault(url, LocalQueue(url[len(LOCAL_SCHEME):]))
+    return _local_queues[url]
+
+
+def message_bodies(event):
+    """Yield the decoded JSON body of every record in an SQS event."""
+    for record in event.get('Records', []):
+        yield json.loads(record['body'])
@@ -0,0 +1,35 @@
+"""
+CloudWatch Embedded Metric Format (EMF) logging.
+A single JSON log line becomes both a searchable log event and a set of
+CloudWatch metrics, without any API calls from the handler.
+"""
+import json
+import time
+
+NAMESPACE = 'MusicStreaming'
+
+
+def emit(metrics, dimensions=None, properties=None, units=None, namespace=NAMESPACE):
+    """
+    Log `metrics` ({name: value}) as EMF.
+    `dimensions` are attached to every metric; `properties` are extra,
+    non-metric fields kept in the log event for searching.
+    """
+    dimensions = dimensions or {}
+    units = units or {}
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': namespace,
+                'Dimensions': [list(dimensions.keys())],
+                'Metrics': [
+                    {'Name': name, 'Unit': units.get(name, 'Count')} for name in metrics
+                ]
+            }]
+        },
+        **dimensions,
+        **(properties or {}),
+        **metrics
+    }
+    print(json.dumps(record, default=str))
@@ -0,0 +1,424 @@
+"""
+Release notifications fanned out over a queue.
+When an artist releases a song or album, a release record (pk
+RELEASE#<id>, sk METADATA) is created holding the SES template, its data
+for the release and the progress counters: by send_notifications, or by a
+worker closing the artist's digest of recent releases (common/digests.py).
+Planning then pages the artist's subscribers with notifications on from
+every shard of notify-artist-index in parallel (see common/sharding.py;
+artist-id-index, filtered, until the stack sets NOTIFY_ARTIST_INDEX)
+and queues them in chunks of RECIPIENTS_PER_CHUNK on the queue named by
+NOTIFICATIONS_QUEUE_URL. Workers send the chunks and add their counts to
+the release, which turns `completed` once every planned chunk is done.
+Releases of artists with few subscriber shards also carry the recipients'
+user IDs in their chunks, and workers push the release's feed entries to
+those users (see common/feed.py).
+
+Queue messages and async invocations are delivered at least once, so each
+step can be repeated safely:
+- The planner pins the shards to read in its checkpoint before the first
+  page, then saves the checkpoint (each shard's LastEvaluatedKey) with a
+  conditional update on `page`. A retried or continued planner resumes
+  from there, and as chunk IDs are derived from the page number, a page
+  queued twice yields the same chunks.
+- A worker claims a chunk (sk CHUNK#<chunk_id>) with a lease before
+  sending and marks it done in the same transaction that adds its counts
+  to the release, so a duplicate message is dropped rather than sent.
+Release and chunk items expire after RELEASE_TTL_DAYS.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+from common import clients, feed, sharding
+from common.dynamo import TransactionCancelled, transact_write
+from common.messaging import SEND_BATCH_SIZE, get_queue
+
+QUEUE_ENV = 'NOTIFICATIONS_QUEUE_URL'
+
+PLANNING = 'planning'
+SENDING = 'sending'
+COMPLETED = 'completed'
+
+RECIPIENTS_PER_CHUNK = 50
+
+# Progress counters, all starting at zero
+COUNTERS = ('subscribers', 'chunks_planned', 'chunks_done', 'emails_sent', 'emails_failed')
+
+# Concurrent SendMessageBatch calls while queueing a page
+ENQUEUE_WORKERS = 8
+
+# Concurrent subscriber shard queries while reading a page
+SHARD_READ_WORKERS = 16
+
+# Time left when the planner hands over to a queued continuation
+PLAN_MARGIN_MS = 30000
+
+# Longer than the worker timeout, so a running worker keeps its chunk
+CHUNK_LEASE_SECONDS = 300
+
+RELEASE_TTL_DAYS = 7
+
+
+class StaleRelease(Exception):
+    """Another planner saved the release's page first."""
+
+
+def release_key(release_id):
+    return {
+        'pk': f'RELEASE#{release_id}',
+        'sk': 'METADATA'
+    }
+
+
+def chunk_key(release_id, chunk_id):
+    return {
+        'pk': f'RELEASE#{release_id}',
+        'sk': f'CHUNK#{chunk_id}'
+    }
+
+
+def subscribers_query(shard, notify_index=True):
+    """
+    Query parameters for the subscriptions with notifications on in one
+    subscriber shard of an artist. notify-artist-index is sparse, so muted
+    subscriptions are not read. Otherwise (`notify_index` false, before the
+    index is backfilled) the shard is the artist ID, and the artist's
+    subscriptions are read from artist-id-index and filtered.
+    """
+    if notify_index:
+        return {
+            'IndexName': 'notify-artist-index',
+            'KeyConditionExpression': 'notify_artist = :shard',
+            'ProjectionExpression': 'user_id, user_email',
+            'ExpressionAttributeValues': {
+                ':shard': shard
+            }
+        }
+    return {
+        'IndexName': 'artist-id-index',
+        'KeyConditionExpression': 'artist_id = :shard',
+        'FilterExpression': 'attribute_not_exists(notification_enabled) OR notification_enabled = :enabled',
+        'ProjectionExpression': 'user_id, user_email',
+        'ExpressionAttributeValues': {
+            ':shard': shard,
+            ':enabled': True
+        }
+    }
+
+
+def _expires_at():
+    return int(time.time()) + RELEASE_TTL_DAYS * 86400
+
+
+def release_item(release_id, artist_id, event_type, template, template_data, feed_entries=None):
+    """
+    A new release record, before any subscriber is queued. `feed_entries`
+    are the songs and albums released, for the subscribers' feeds.
+    """
+    now = datetime.utcnow().isoformat()
+    release = {
+        **release_key(release_id),
+        'entity_type': 'RELEASE',
+        'release_id': release_id,
+        'artist_id': artist_id,
+        'event_type': event_type,
+        'template': template,
+        'template_data': template_data,
+        'status': PLANNING,
+        'page': 0,
+        'checkpoint': None,
+        'created_at': now,
+        'updated_at': now,
+        'expires_at': _expires_at()
+    }
+    if feed_entries:
+        release['feed_entries'] = feed_entries
+    for counter in COUNTERS:
+        release[counter] = 0
+    return release
+
+
+def start(release_id, artist_id, event_type, template, template_data, feed_entries=None):
+    """
+    Write the release record, or return the existing one if `release_id`
+    was started before (a retried invocation resumes it).
+    """
+    release = release_item(release_id, artist_id, event_type, template, template_data, feed_entries)
+    try:
+        clients.table().put_item(Item=release, ConditionExpression='attribute_not_exists(pk)')
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        print(f"Release {release_id} exists, resuming it")
+        return get(release_id)
+    return release
+
+
+def get(release_id):
+    """The release item, or None. Reads are strongly consistent."""
+    response = clients.table().get_item(Key=release_key(release_id), ConsistentRead=True)
+    return response.get('Item')
+
+
+def plan(release, context=None):
+    """
+    Queue the release's subscribers page by page from its checkpoint until
+    all of them are queued. When the invocation runs low on time, planning
+    continues from a message on the queue instead. Returns the release.
+    """
+    queue = get_queue(QUEUE_ENV)
+    try:
+        if release['status'] == PLANNING and not release.get('checkpoint'):
+            release = _pin_shards(release)
+        while release['status'] == PLANNING:
+            if context is not None and context.get_remaining_time_in_millis() < PLAN_MARGIN_MS:
+                queue.send({'release_id': release['release_id'], 'action': 'plan'})
+                print(f"Release {release['release_id']} continues planning from the queue at page {release['page']}")
+                return release
+            release = _plan_page(release, queue)
+    except StaleRelease:
+        print(f"Release {release['release_id']} is planned by another invocation, stopping")
+        return get(release['release_id'])
+    return release
+
+
+def _pin_shards(release):
+    """
+    Save the artist's current shards as the checkpoint of a release that
+    has not read any, so a retried first page reads the same shards.
+    Whether the release's feed entries are pushed is decided here as well;
+    those of artists with many shards are pulled by the readers instead.
+    The index read is pinned too (`notify_index`), so a release keeps
+    reading the index of its checkpoint when NOTIFY_ARTIST_INDEX is set.
+    """
+    count = sharding.subscriber_shard_count(release['artist_id'], consistent=True)
+    notify_index = sharding.notify_artist_index()
+    if notify_index:
+        checkpoint = {shard: None for shard in sharding.subscriber_shard_keys(release['artist_id'], count)}
+    else:
+        checkpoint = {release['artist_id']: None}
+    feed_push = bool(release.get('feed_entries')) and feed.pushed(count)
+    if release.get('feed_entries') and not feed_push:
+        feed.add_pull_artist(release['artist_id'])
+    try:
+        return clients.table().update_item(
+            Key=release_key(release['release_id']),
+            UpdateExpression='SET #checkpoint = :checkpoint, feed_push = :feed_push, notify_index = :notify_index',
+            ConditionExpression='#page = :first_page AND #status = :planning AND (attribute_not_exists(#checkpoint) OR attribute_type(#checkpoint, :null))',
+            ExpressionAttributeNames={'#page': 'page', '#checkpoint': 'checkpoint', '#status': 'status'},
+            ExpressionAttributeValues={
+                ':checkpoint': checkpoint,
+                ':feed_push': feed_push,
+                ':notify_index': notify_index,
+                ':first_page': 0,
+                ':planning': PLANNING,
+                ':null': 'NULL'
+            },
+            ReturnValues='ALL_NEW'
+        )['Attributes']
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return get(release['release_id'])
+        raise
+
+
+def _positions(release):
+    """Shard -> ExclusiveStartKey (None to start the shard) from the checkpoint."""
+    checkpoint = release['checkpoint']
+    if 'notify_artist' in checkpoint:
+        # A LastEvaluatedKey saved before subscriber shards
+        return {checkpoint['notify_artist']: checkpoint}
+    return checkpoint
+
+
+def _read_shard(shard, start_key, notify_index):
+    params = subscribers_query(shard, notify_index)
+    if start_key:
+        params['ExclusiveStartKey'] = start_key
+    response = clients.subscriptions_table().query(**params)
+    return response.get('Items', []), response.get('LastEvaluatedKey')
+
+
+def _plan_page(release, queue):
+    # One page of every shard that has more, read in parallel
+    positions = sorted(_positions(release).items())
+    with ThreadPoolExecutor(max_workers=min(SHARD_READ_WORKERS, len(positions))) as pool:
+        # Releases pinned before `notify_index` was recorded read notify-artist-index
+        pages = list(pool.map(lambda position: _read_shard(*position, release.get('notify_index', True)), positions))
+    subscriptions = [subscription for items, _ in pages for subscription in items]
+    last_key = {
+        shard: shard_last_key
+        for (shard, _), (_, shard_last_key) in zip(positions, pages)
+        if shard_last_key
+    } or None
+    
+    recipients = []
+    user_ids = []
+    missing = 0
+    for subscription in subscriptions:
+        if not subscription.get('user_email'):
+            print(f"No email found for user {subscription['user_id']}")
+            missing += 1
+        else:
+            recipients.append(subscription['user_email'])
+            user_ids.append(subscription['user_id'])
+    
+    page = int(release['page'])
+    chunks = [
+        {
+            'release_id': release['release_id'],
+            'chunk_id': f'{page}-{index}',
+            'recipients': recipients[start:start + RECIPIENTS_PER_CHUNK]
+        }
+        for index, start in enumerate(range(0, len(recipients), RECIPIENTS_PER_CHUNK))
+    ]
+    if release.get('feed_push'):
+        for chunk, start in zip(chunks, range(0, len(recipients), RECIPIENTS_PER_CHUNK)):
+            chunk['user_ids'] = user_ids[start:start + RECIPIENTS_PER_CHUNK]
+    groups = [chunks[start:start + SEND_BATCH_SIZE] for start in range(0, len(chunks), SEND_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=ENQUEUE_WORKERS) as pool:
+        list(pool.map(queue.send_batch, groups))
+    
+    try:
+        release = clients.table().update_item(
+            Key=release_key(release['release_id']),
+            UpdateExpression=(
+                'SET #page = :next_page, #checkpoint = :checkpoint, #status = :status, updated_at = :updated_at'
+                ' ADD subscribers :subscribers, emails_failed :missing, chunks_planned :chunks'
+            ),
+            ConditionExpression='#page = :page AND #status = :planning',
+            ExpressionAttributeNames={'#page': 'page', '#checkpoint': 'checkpoint', '#status': 'status'},
+            ExpressionAttributeValues={
+                ':page': page,
+                ':planning': PLANNING,
+                ':next_page': page + 1,
+                ':checkpoint': last_key,
+                ':status': PLANNING if last_key else SENDING,
+                ':updated_at': datetime.utcnow().isoformat(),
+                ':subscribers': len(subscriptions),
+                ':missing': missing,
+                ':chunks': len(chunks)
+            },
+            ReturnValues='ALL_NEW'
+        )['Attributes']
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            raise StaleRelease(release['release_id'])
+        raise
+    
+    if last_key is None:
+        print(f"Release {release['release_id']} queued {release['chunks_planned']} chunks for {release['subscribers']} subscribers")
+        sharding.grow_subscriber_shards(release['artist_id'], int(release['subscribers']))
+        return finish(release)
+    return release
+
+
+def claim_chunk(release_id, chunk_id, owner):
+    """
+    Lease a chunk to `owner` before sending it. False if the chunk is done
+    or leased by a worker that may still be running.
+    """
+    now = int(time.time())
+    try:
+        clients.table().update_item(
+            Key=chunk_key(release_id, chunk_id),
+            UpdateExpression='SET #status = :sending, lease_owner = :owner, lease_expires = :lease_expires, expires_at = :expires_at',
+            ConditionExpression='attribute_not_exists(pk) OR (#status <> :completed AND lease_expires < :now)',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={
+                ':sending': SENDING,
+                ':completed': COMPLETED,
+                ':owner': owner,
+                ':lease_expires': now + CHUNK_LEASE_SECONDS,
+                ':expires_at': _expires_at(),
+                ':now': now
+            }
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+
+def complete_chunk(release_id, chunk_id, owner, sent=0, failed=0, follow_ups=0):
+    """
+    Mark a leased chunk done and add its counts to the release in one
+    transaction. `follow_ups` counts chunks queued for recipients to retry.
+    Returns the release, or None if the lease was lost.
+    """
+    try:
+        transact_write([
+            {'Update': {
+                'Key': chunk_key(release_id, chunk_id),
+                'UpdateExpression': 'SET #status = :completed, sent = :sent, failed = :failed REMOVE lease_owner, lease_expires',
+                'ConditionExpression': 'lease_owner = :owner',
+                'ExpressionAttributeNames': {'#status': 'status'},
+                'ExpressionAttributeValues': {
+                    ':completed': COMPLETED,
+                    ':sent': sent,
+                    ':failed': failed,
+                    ':owner': owner
+                }
+            }},
+            {'Update': {
+                'Key': release_key(release_id),
+                'UpdateExpression': 'SET updated_at = :updated_at ADD chunks_done :one, chunks_planned :follow_ups, emails_sent :sent, emails_failed :failed',
+                'ExpressionAttributeValues': {
+                    ':updated_at': datetime.utcnow().isoformat(),
+                    ':one': 1,
+                    ':follow_ups': follow_ups,
+                    ':sent': sent,
+                    ':failed': failed
+                }
+            }}
+        ])
+    except TransactionCancelled as e:
+        if not e.failed(0):
+            raise
+        print(f"Chunk {chunk_id} of release {release_id} lost its lease")
+        return None
+    return finish(get(release_id))
+
+
+def finish(release):
+    """Mark the release completed if planning is over and every chunk is done."""
+    if release['status'] != SENDING or release['chunks_done'] < release['chunks_planned']:
+        return release
+    now = datetime.utcnow().isoformat()
+    try:
+        release = clients.table().update_item(
+            Key=release_key(release['release_id']),
+            UpdateExpression='SET #status = :completed, finished_at = :now, updated_at = :now',
+            ConditionExpression='#status = :sending AND chunks_done >= chunks_planned',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={
+                ':completed': COMPLETED,
+                ':sending': SENDING,
+                ':now': now
+            },
+            ReturnValues='ALL_NEW'
+        )['Attributes']
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        # Another worker completed it
+        return get(release['release_id'])
+    print(f"Release {release['release_id']} completed: {describe(release)['progress']}")
+    return release
+
+
+def describe(release):
+    """The progress of a release, for responses and logs."""
+    return {
+        'release_id': release['release_id'],
+        'artist_id': release['artist_id'],
+        'event_type': release['event_type'],
+        'status': release['status'],
+        'progress': {counter: release.get(counter, 0) for counter in COUNTERS},
+        'created_at': release['created_at'],
+        'finished_at': release.get('finished_at')
+    }
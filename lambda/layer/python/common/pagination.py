@@ -0,0 +1,146 @@
+"""
+Pagination helpers shared by the list endpoints.
+"""
+import math
+import os
+import time
+
+from common import cursor, metrics
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Upper bound on items evaluated by a single Query when over-fetching
+MAX_EVALUATED_PER_QUERY = 1000
+
+
+def parse_pagination(event, scope, default_limit=DEFAULT_LIMIT, max_limit=MAX_LIMIT):
+    """
+    Read `limit` and the `last_key` cursor from the query string.
+    Returns (limit, exclusive_start_key). An invalid limit falls back to the
+    default and is clamped to [1, max_limit]. A cursor that was not issued
+    for `scope` raises cursor.InvalidCursor.
+    """
+    limit = default_limit
+    exclusive_start_key = None
+    params = event.get('queryStringParameters') or {}
+    
+    if params.get('limit'):
+        try:
+            limit = min(max(int(params['limit']), 1), max_limit)
+        except ValueError:
+            pass
+    
+    if params.get('last_key'):
+        exclusive_start_key = cursor.decode(params['last_key'], scope)
+    
+    return limit, exclusive_start_key
+
+
+class ReadBudget:
+    """
+    Caps the read capacity and wall-clock time one page may spend.
+    Also records what the page cost, for logging.
+    """
+    
+    def __init__(self, capacity_units=None, time_ms=None):
+        self.capacity_units = capacity_units
+        self.time_ms = time_ms
+        self.queries = 0
+        self.scanned_count = 0
+        self.consumed_capacity = 0.0
+        self.stopped_by = None
+        self._started = time.monotonic()
+    
+    @classmethod
+    def from_env(cls):
+        """Budget configured with PAGE_RCU_BUDGET and PAGE_TIME_BUDGET_MS."""
+        return cls(
+            capacity_units=float(os.environ.get('PAGE_RCU_BUDGET', '50')),
+            time_ms=float(os.environ.get('PAGE_TIME_BUDGET_MS', '1000'))
+        )
+    
+    @property
+    def elapsed_ms(self):
+        return (time.monotonic() - self._started) * 1000
+    
+    def record(self, response):
+        self.queries += 1
+        self.scanned_count += response.get('ScannedCount', 0)
+        self.consumed_capacity += (response.get('ConsumedCapacity') or {}).get('CapacityUnits', 0)
+    
+    def exhausted(self):
+        if self.capacity_units is not None and self.consumed_capacity >= self.capacity_units:
+            self.stopped_by = 'capacity'
+        elif self.time_ms is not None and self.elapsed_ms >= self.time_ms:
+            self.stopped_by = 'time'
+        return self.stopped_by is not None
+
+
+def query_page(table, query_params, limit, exclusive_start_key=None, budget=None, key_attributes=None):
+    """
+    Run a (possibly filtered) query until `limit` items are collected, the
+    key range is exhausted or the optional `budget` runs out.
+    Without `key_attributes`, each request evaluates at most the number of
+    items still missing, so LastEvaluatedKey is an exact continuation point.
+    With `key_attributes` (the table and index key names), requests are
+    sized from the filter selectivity seen so far, and when a response
+    overshoots the page the cursor is rebuilt from the last item kept.
+    Returns (items, last_evaluated_key).
+    """
+    params = dict(query_params)
+    if budget is not None:
+        params['ReturnConsumedCapacity'] = 'TOTAL'
+    
+    items = []
+    last_evaluated_key = exclusive_start_key
+    returned = scanned = 0
+    
+    while True:
+        remaining = limit - len(items)
+        if key_attributes and scanned:
+            selectivity = max(returned, 1) / scanned
+            params['Limit'] = min(MAX_EVALUATED_PER_QUERY, max(remaining, math.ceil(remaining / selectivity)))
+        else:
+            params['Limit'] = remaining
+        if last_evaluated_key:
+            params['ExclusiveStartKey'] = last_evaluated_key
+        
+        response = table.query(**params)
+        page_items = response.get('Items', [])
+        returned += len(page_items)
+        scanned += response.get('ScannedCount', len(page_items))
+        last_evaluated_key = response.get('LastEvaluatedKey')
+        if budget is not None:
+            budget.record(response)
+        
+        if len(page_items) > remaining:
+            # Over-fetched: resume right after the last item returned
+            page_items = page_items[:remaining]
+            last_evaluated_key = {name: page_items[-1][name] for name in key_attributes}
+        items.extend(page_items)
+        
+        if not last_evaluated_key or len(items) >= limit:
+            return items, last_evaluated_key
+        if budget is not None and budget.exhausted():
+            return items, last_evaluated_key
+
+
+def report_page(endpoint, limit, items, last_evaluated_key, budget):
+    """Log page size, fill ratio and read cost of a page-filled query as metrics."""
+    if budget.stopped_by is None:
+        budget.stopped_by = 'full' if len(items) >= limit else 'end'
+    
+    metrics.emit(
+        {
+            'PageSize': len(items),
+            'PageFillPercent': round(100.0 * len(items) / limit, 1),
+            'QueriesPerPage': budget.queries,
+            'ScannedCount': budget.scanned_count,
+            'ConsumedReadCapacity': budget.consumed_capacity,
+            'PageLatency': round(budget.elapsed_ms, 1)
+        },
+        dimensions={'Endpoint': endpoint},
+        properties={'requested': limit, 'stopped_by': budget.stopped_by},
+        units={'PageFillPercent': 'Percent', 'PageLatency': 'Milliseconds'}
+    )
@@ -0,0 +1,94 @@
+"""
+Sparse fieldsets for read endpoints.
+Clients choose the attributes they need with `?fields=a,b,c` or a named
+`?view=` (`list` or `detail`). The selection is pushed down to DynamoDB as a
+ProjectionExpression with aliased attribute names, so unused attributes are
+neither transferred nor serialized. A projection lowers response size and
+CPU, not consumed read capacity.
+"""
+import re
+
+# Named views per entity type. `detail` (whole items) is always available.
+VIEWS = {
+    'SONG': {
+        'list': ('song_id', 'title', 'artist_id', 'artist_name', 'album_id', 'duration', 'genre', 'created_at')
+    },
+    'ALBUM': {
+        'list': ('album_id', 'title', 'artist_id', 'artist_name', 'release_date', 'genre', 'cover_image_url', 'total_songs', 'created_at')
+    },
+    'ARTIST': {
+        'list': ('artist_id', 'name', 'genre', 'country', 'profile_image_url', 'total_albums', 'total_songs', 'created_at')
+    }
+}
+
+DETAIL_VIEW = 'detail'
+
+MAX_FIELDS = 40
+
+_ATTRIBUTE_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]{0,63}$')
+
+
+class InvalidFields(ValueError):
+    """The `fields` or `view` query parameter cannot be served."""
+
+
+class Projection:
+    """
+    The attributes selected for a response, or all of them when `fields` is
+    None. `required` attributes (e.g. keys needed to build a cursor) are
+    read as well and removed again by strip().
+    """
+    
+    def __init__(self, fields=None, required=()):
+        self.fields = tuple(fields) if fields is not None else None
+        if self.fields is None:
+            self.extra = ()
+        else:
+            self.extra = tuple(name for name in required if name not in self.fields)
+    
+    @classmethod
+    def from_event(cls, event, entity_type, default_view=DETAIL_VIEW, required=()):
+        """Build the projection requested by `fields` or `view` in the query string."""
+        params = event.get('queryStringParameters') or {}
+        
+        if params.get('fields'):
+            names = list(dict.fromkeys(name.strip() for name in params['fields'].split(',') if name.strip()))
+            if not names or len(names) > MAX_FIELDS:
+                raise InvalidFields(f'fields must list between 1 and {MAX_FIELDS} attributes')
+            for name in names:
+                if not _ATTRIBUTE_NAME.match(name):
+                    raise InvalidFields(f'Invalid attribute name: {name}')
+            return cls(names, required)
+        
+        view = params.get('view') or default_view
+        if view == DETAIL_VIEW:
+            return cls(None, required)
+        if view not in VIEWS.get(entity_type, {}):
+            raise InvalidFields(f'Unknown view: {view}')
+        return cls(VIEWS[entity_type][view], required)
+    
+    def apply(self, params):
+        """Return a copy of Query/GetItem `params` with the ProjectionExpression added."""
+        if self.fields is None:
+            return params
+        names = dict(params.get('ExpressionAttributeNames') or {})
+        aliases = []
+        for index, name in enumerate(self.fields + self.extra):
+            alias = f'#f{index}'
+            names[alias] = name
+            aliases.append(alias)
+        return dict(params, ProjectionExpression=', '.join(aliases), ExpressionAttributeNames=names)
+    
+    def select(self, item):
+        """Apply the projection in memory to a whole item (e.g. one served from a cache)."""
+        if self.fields is None:
+            return item
+        return {name: item[name] for name in self.fields if name in item}
+    
+    def strip(self, items):
+        """Drop the `required` attributes that were not asked for (plain or wire items)."""
+        if self.extra:
+            for item in items:
+                for name in self.extra:
+                    item.pop(name, None)
+        return items
@@ -0,0 +1,60 @@
+"""
+API Gateway proxy response helpers.
+"""
+import json
+
+from common.serialization import dumps
+
+# Default headers for JSON responses from the catalog endpoints
+JSON_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+}
+
+# Full CORS headers for endpoints that are called with credentials
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
+    'Access-Control-Allow-Methods': 'GET,POST,PUT,DELETE,OPTIONS',
+    'Access-Control-Allow-Credentials': 'true'
+}
+
+
+def json_response(status_code, body, headers=None):
+    """
+    Build a proxy response with a JSON body.
+    The body may contain raw DynamoDB items; they are encoded in the same pass.
+    """
+    return {
+        'statusCode': status_code,
+        'headers': headers if headers is not None else JSON_HEADERS,
+        'body': dumps(body)
+    }
+
+
+def error_response(status_code, message, **extra):
+    """Build the standard `{"message": ...}` error envelope."""
+    return json_response(status_code, {'message': message, **extra})
+
+
+def no_content(headers=None):
+    """Build an empty 204 response."""
+    return {
+        'statusCode': 204,
+        'headers': headers if headers is not None else {'Access-Control-Allow-Origin': '*'}
+    }
+
+
+def parse_json_body(event):
+    """
+    Return the request body as a dict.
+    Raises ValueError if the body is not valid JSON.
+    """
+    body = event.get('body')
+    if body is None or body == '':
+        return {}
+    if isinstance(body, str):
+        body = json.loads(body)
+    if not isinstance(body, dict):
+        raise ValueError('Request body must be a JSON object')
+    return body
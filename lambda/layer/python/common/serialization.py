@@ -0,0 +1,57 @@
+"""
+JSON serialization for DynamoDB items.
+boto3 returns numbers as Decimal, sets as Python sets and binary values as
+Binary wrappers. The encoder converts them while the response body is being
+written, so items never need a dumps/loads round-trip first.
+"""
+import base64
+import json
+from decimal import Decimal
+
+from boto3.dynamodb.types import Binary
+
+
+def _encode_binary(value):
+    return base64.b64encode(bytes(value)).decode('ascii')
+
+
+class DynamoJSONEncoder(json.JSONEncoder):
+    """JSON encoder that understands the types produced by the DynamoDB resource API."""
+    
+    def default(self, o):
+        if isinstance(o, Decimal):
+            # Integral values (counters, durations) stay integers
+            if o == o.to_integral_value():
+                return int(o)
+            return float(o)
+        if isinstance(o, Binary):
+            return _encode_binary(o.value)
+        if isinstance(o, (bytes, bytearray)):
+            return _encode_binary(o)
+        if isinstance(o, (set, frozenset)):
+            # Sorted so that identical items always serialize identically
+            try:
+                return sorted(o)
+            except TypeError:
+                return list(o)
+        return super().default(o)
+
+
+class RawJSON(str):
+    """
+    Already-encoded JSON text. When used as a top-level value of the object
+    passed to dumps() it is emitted verbatim instead of being re-encoded.
+    """
+
+
+_encoder = DynamoJSONEncoder()
+
+
+def dumps(obj):
+    """Serialize `obj` (which may contain DynamoDB types) to a JSON string."""
+    if isinstance(obj, dict) and any(isinstance(value, RawJSON) for value in obj.values()):
+        return '{' + ', '.join(
+            f'{_encoder.encode(str(name))}: {value if isinstance(value, RawJSON) else _encoder.encode(value)}'
+            for name, value in obj.items()
+        ) + '}'
+    return _encoder.encode(obj)
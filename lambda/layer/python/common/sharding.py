@@ -0,0 +1,296 @@
+"""
+Write-sharded catalog listings and subscriber indexes.
+Songs, albums and artists carry an `entity_shard` key such as SONG#7, so
+inserts and listings spread over ENTITY_SHARD_COUNT partitions of
+entity-shard-index instead of one. Listings scatter a query to every shard
+in parallel and k-way merge the results on created_at. The cursor is a
+composite of per-shard positions. entity-shard-index is added to an existing
+table after the index key backfill and read once the stack sets
+SHARDED_LISTINGS (see DatabaseStack's catalog_index_stage); until then
+listings read the single partition per entity type of entity-type-index,
+as one shard.
+
+Subscriptions carry `artist_shard`, the artist ID with a shard suffix
+(e.g. <artist_id>#3), keying artist-shard-index and, while notifications
+are on, notify-artist-index. The shard count is per artist and adaptive:
+it starts at 1 and grows with the artist's subscribers, up to
+MAX_SUBSCRIBER_SHARDS. It never shrinks, so readers that query every
+shard below the current count also find subscriptions written with an
+older one. Both indexes are added to an existing table after the index key
+backfill and read once the stack sets NOTIFY_ARTIST_INDEX and
+SHARDED_SUBSCRIPTIONS (see DatabaseStack's subscriptions_index_stage);
+until then readers query the artist's single partition of artist-id-index.
+"""
+import heapq
+import math
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from common import clients, wire
+
+# Changing the shard count requires re-running the index key backfill
+ENTITY_SHARD_COUNT = 16
+
+SHARD_INDEX = 'entity-shard-index'
+
+# Table and entity-shard-index key attributes, used to build shard positions
+SHARD_INDEX_KEY = ('pk', 'sk', 'entity_shard', 'created_at')
+
+SHARDED_LISTINGS_ENV = 'SHARDED_LISTINGS'
+
+# Listing index until entity-shard-index is added, and its key attributes
+TYPE_INDEX = 'entity-type-index'
+TYPE_INDEX_KEY = ('pk', 'sk', 'entity_type', 'created_at')
+
+NOTIFY_ARTIST_INDEX_ENV = 'NOTIFY_ARTIST_INDEX'
+SHARDED_SUBSCRIPTIONS_ENV = 'SHARDED_SUBSCRIPTIONS'
+
+# Subscriptions per subscriber shard; a GSI partition takes about 1000
+# writes and 3000 reads per second
+SUBSCRIBERS_PER_SHARD = 10000
+MAX_SUBSCRIBER_SHARDS = 64
+
+# Writers may use a shard count this old; they only spread less
+SUBSCRIBER_SHARDS_CACHE_SECONDS = 300
+
+_executor = None
+_executor_lock = threading.Lock()
+_subscriber_shards = {}
+
+
+def shard_for(entity_type, entity_id):
+    """Stable shard key for an entity, e.g. shard_for('SONG', song_id) -> 'SONG#7'."""
+    return f'{entity_type}#{zlib.crc32(entity_id.encode("utf-8")) % ENTITY_SHARD_COUNT}'
+
+
+def shard_keys(entity_type):
+    """All shard keys of an entity type."""
+    return [f'{entity_type}#{index}' for index in range(ENTITY_SHARD_COUNT)]
+
+
+def sharded_listings():
+    """True once listings read entity-shard-index."""
+    return os.environ.get(SHARDED_LISTINGS_ENV) == 'true'
+
+
+def notify_artist_index():
+    """True once release audiences are read from notify-artist-index."""
+    return os.environ.get(NOTIFY_ARTIST_INDEX_ENV) == 'true'
+
+
+def sharded_subscriptions():
+    """True once an artist's subscriptions are read from artist-shard-index."""
+    return os.environ.get(SHARDED_SUBSCRIPTIONS_ENV) == 'true'
+
+
+def listing_index_key():
+    """Key attributes of the listing index, which projections must require."""
+    return SHARD_INDEX_KEY if sharded_listings() else TYPE_INDEX_KEY
+
+
+def listing_scope(name):
+    """Cursor scope of a listing; cursors do not carry over between the indexes."""
+    return name if sharded_listings() else f'{name}:{TYPE_INDEX}'
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=ENTITY_SHARD_COUNT)
+    return _executor
+
+
+class _Shard:
+    """Read position and buffered items of one shard during a merge."""
+    
+    def __init__(self, key, start_key, key_attributes):
+        self.key = key
+        self.start_key = start_key
+        self.key_attributes = key_attributes
+        self.buffer = []
+        self.position = 0
+        self.last_evaluated_key = start_key
+        self.consumed = None
+    
+    def fetch(self, query_params, limit):
+        params = dict(query_params, Limit=limit, ExpressionAttributeValues={':shard': {'S': self.key}})
+        if self.last_evaluated_key:
+            params['ExclusiveStartKey'] = self.last_evaluated_key
+        response = clients.client('dynamodb').query(**params)
+        self.buffer = response.get('Items', [])
+        self.position = 0
+        self.last_evaluated_key = response.get('LastEvaluatedKey')
+    
+    @property
+    def head(self):
+        return self.buffer[self.position] if self.position < len(self.buffer) else None
+    
+    @property
+    def exhausted(self):
+        return self.head is None and not self.last_evaluated_key
+    
+    def cursor(self):
+        """Wire-format ExclusiveStartKey to resume this shard, None to restart it."""
+        if self.consumed is not None:
+            return {name: self.consumed[name] for name in self.key_attributes}
+        return self.start_key
+
+
+class _HeapEntry:
+    """Merge heap entry for a shard, ordered by the created_at of its head item."""
+    __slots__ = ('value', 'shard', 'descending')
+    
+    def __init__(self, shard, descending):
+        self.value = shard.head['created_at']['S']
+        self.shard = shard
+        self.descending = descending
+    
+    def __lt__(self, other):
+        if self.value != other.value:
+            return (self.value > other.value) if self.descending else (self.value < other.value)
+        return self.shard.key < other.shard.key
+
+
+def query_sharded(entity_type, limit, cursor=None, scan_forward=False, projection=None):
+    """
+    List `limit` items of `entity_type` ordered by created_at (newest first
+    unless `scan_forward`), reading all shards of entity-shard-index, or
+    the entity type's partition of entity-type-index before SHARDED_LISTINGS.
+    Each shard is first queried in parallel for about its share of the page.
+    A shard whose buffer runs dry during the merge is refilled before the
+    merge continues, so the page is exact.
+    `cursor` is a composite cursor from a previous call: a dict of shard key
+    to position, where a position is a plain-valued key or None for a shard
+    that has not been read yet. Exhausted shards are left out.
+    An optional common.projection.Projection must require listing_index_key(),
+    which the merge and the cursor are built from.
+    Returns (wire_items, next_cursor); next_cursor is None on the last page.
+    """
+    if sharded_listings():
+        keys, index_name, key_attributes = shard_keys(entity_type), SHARD_INDEX, SHARD_INDEX_KEY
+    else:
+        keys, index_name, key_attributes = [entity_type], TYPE_INDEX, TYPE_INDEX_KEY
+    if cursor is None:
+        positions = {key: None for key in keys}
+    else:
+        positions = {key: position for key, position in cursor.items() if key in keys}
+    
+    query_params = {
+        'TableName': os.environ['TABLE_NAME'],
+        'IndexName': index_name,
+        'KeyConditionExpression': f'{key_attributes[2]} = :shard',
+        'ScanIndexForward': scan_forward
+    }
+    if projection is not None:
+        query_params = projection.apply(query_params)
+    
+    shards = [_Shard(key, wire.to_wire(position), key_attributes) for key, position in sorted(positions.items())]
+    if not shards:
+        return [], None
+    
+    # Scatter: over-read each shard a little so one round usually suffices
+    share = min(limit, math.ceil(limit / len(shards)) + 1)
+    list(_pool().map(lambda shard: shard.fetch(query_params, share), shards))
+    
+    # Gather: k-way merge on created_at
+    descending = not scan_forward
+    heap = [_HeapEntry(shard, descending) for shard in shards if shard.head is not None]
+    heapq.heapify(heap)
+    
+    items = []
+    while heap and len(items) < limit:
+        shard = heapq.heappop(heap).shard
+        items.append(shard.head)
+        shard.consumed = shard.head
+        shard.position += 1
+        
+        # Refill a drained shard before merging further, so its next item is considered
+        if shard.head is None and shard.last_evaluated_key and len(items) < limit:
+            shard.fetch(query_params, limit - len(items))
+        if shard.head is not None:
+            heapq.heappush(heap, _HeapEntry(shard, descending))
+    
+    next_cursor = {
+        shard.key: wire.from_wire(shard.cursor())
+        for shard in shards
+        if not shard.exhausted
+    }
+    return items, next_cursor or None
+
+
+def subscriber_shards_key(artist_id):
+    return {
+        'pk': f'ARTIST#{artist_id}',
+        'sk': 'SUBSCRIBER_SHARDS'
+    }
+
+
+def subscriber_shard_count(artist_id, consistent=False):
+    """
+    The artist's subscriber shard count. Writers may get a count cached
+    for SUBSCRIBER_SHARDS_CACHE_SECONDS; readers pass `consistent`.
+    """
+    cached = _subscriber_shards.get(artist_id)
+    if cached is not None and not consistent and cached[1] > time.monotonic():
+        return cached[0]
+    item = clients.table().get_item(Key=subscriber_shards_key(artist_id), ConsistentRead=consistent).get('Item')
+    count = int(item['shards']) if item else 1
+    _subscriber_shards[artist_id] = (count, time.monotonic() + SUBSCRIBER_SHARDS_CACHE_SECONDS)
+    return count
+
+
+def subscriber_shard(artist_id, user_id, count):
+    """
+    The artist_shard of a subscription, e.g. '<artist_id>#3'. Shard 0 is
+    the bare artist ID, which subscriptions written before sharding carry.
+    """
+    index = zlib.crc32(user_id.encode('utf-8')) % count
+    return f'{artist_id}#{index}' if index else artist_id
+
+
+def subscriber_shard_keys(artist_id, count):
+    """All artist_shard values of an artist with `count` shards."""
+    return [artist_id] + [f'{artist_id}#{index}' for index in range(1, count)]
+
+
+def subscriber_shards_for(subscribers):
+    """Shard count for `subscribers`: SUBSCRIBERS_PER_SHARD each, in powers of two."""
+    count = 1
+    while count * SUBSCRIBERS_PER_SHARD < subscribers and count < MAX_SUBSCRIBER_SHARDS:
+        count *= 2
+    return count
+
+
+def grow_subscriber_shards(artist_id, subscribers):
+    """
+    Raise the artist's shard count to fit `subscribers`. The count never
+    shrinks. Returns True if it was raised.
+    """
+    count = subscriber_shards_for(subscribers)
+    if count <= 1:
+        return False
+    try:
+        clients.table().update_item(
+            Key=subscriber_shards_key(artist_id),
+            UpdateExpression='SET shards = :shards, subscribers = :subscribers, updated_at = :now',
+            ConditionExpression='attribute_not_exists(shards) OR shards < :shards',
+            ExpressionAttributeValues={
+                ':shards': count,
+                ':subscribers': subscribers,
+                ':now': int(time.time())
+            }
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
+    _subscriber_shards.pop(artist_id, None)
+    print(f"Artist {artist_id} now has {count} subscriber shards for {subscribers} subscribers")
+    return True
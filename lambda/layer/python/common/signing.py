@@ -0,0 +1,51 @@
+"""
+HMAC signing keys kept in Secrets Manager.
+A key is read from the secret named by an environment variable and cached
+per container for SECRET_CACHE_SECONDS. The secret's AWSPREVIOUS version,
+if any, is accepted for verification too, so values signed just before a
+rotation stay valid. Without the variable (e.g. locally) keys may come
+from plain environment variables instead.
+"""
+import os
+import time
+
+from botocore.exceptions import ClientError
+
+from common import clients
+
+# Rotated keys are picked up within this time
+SECRET_CACHE_SECONDS = 3600
+
+_cached_keys = {}
+
+
+def keys(secret_arn_env, fallback_env=None):
+    """
+    The signing key first, then a previous key still accepted for
+    verification. Without `secret_arn_env` set, the keys are the values of
+    `fallback_env` and `<fallback_env>_PREVIOUS`. Empty if there is no key.
+    """
+    cached = _cached_keys.get(secret_arn_env)
+    if cached is None or cached[1] < time.monotonic():
+        secret_arn = os.environ.get(secret_arn_env)
+        if secret_arn:
+            values = [_secret_version(secret_arn, 'AWSCURRENT'), _secret_version(secret_arn, 'AWSPREVIOUS')]
+        elif fallback_env:
+            values = [os.environ.get(fallback_env), os.environ.get(f'{fallback_env}_PREVIOUS')]
+        else:
+            values = []
+        cached = _cached_keys[secret_arn_env] = (
+            [value.encode('utf-8') for value in values if value],
+            time.monotonic() + SECRET_CACHE_SECONDS
+        )
+    return cached[0]
+
+
+def _secret_version(secret_arn, stage):
+    try:
+        return clients.client('secretsmanager').get_secret_value(SecretId=secret_arn, VersionStage=stage)['SecretString']
+    except ClientError as e:
+        # There is no AWSPREVIOUS before the first rotation
+        if stage != 'AWSCURRENT' and e.response['Error']['Code'] == 'ResourceNotFoundException':
+            return None
+        raise
@@ -0,0 +1,172 @@
+"""
+Targeted refresh of API Gateway stage cache entries after catalog writes.
+The stage caches anonymous GET responses per route (see CACHE_TTLS in
+api_stack.py). After a write, the affected routes are re-requested with
+`Cache-Control: max-age=0`; API Gateway then skips its cache, calls the
+read handler and stores the fresh response. Only requests signed with
+SigV4 by a role allowed execute-api:InvalidateCache can do this; other
+clients sending the header are still answered from the cache.
+
+Refresh requests also carry REFRESH_HEADER, a short-lived token for the
+path signed with the key in the secret named by
+STAGE_CACHE_REFRESH_SECRET_ARN. Read handlers skip their own caches only
+for a valid token (bypass_requested), never for Cache-Control alone.
+
+Writers call refresh(), which hands the paths to the function named by
+STAGE_CACHE_REFRESH_FUNCTION in an asynchronous invocation, so the
+round trips through the stage stay off the write request. That function
+(cache/refresh_stage_cache.py) calls refresh_now(). Without the variable
+(e.g. locally) refresh() does nothing.
+
+List routes are refreshed for their default page only; other pages and
+parameter combinations expire with their TTL. The stage URL is read from
+the SSM parameter named by API_URL_PARAMETER.
+"""
+import hashlib
+import hmac
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+
+from common import clients, signing
+
+REQUEST_TIMEOUT_SECONDS = 3
+
+REFRESH_HEADER = 'X-Cache-Refresh'
+
+REFRESH_SECRET_ENV = 'STAGE_CACHE_REFRESH_SECRET_ARN'
+
+# Lifetime of a refresh token, longer than a refresh request takes
+REFRESH_TOKEN_SECONDS = 60
+
+_api_url = []
+_session = None
+
+
+def catalog_paths(entity_type, item):
+    """The cached routes that show `item` (a SONG, ALBUM or ARTIST item)."""
+    if entity_type == 'SONG':
+        paths = [f"/songs/{item['song_id']}", '/songs']
+        if item.get('album_id'):
+            paths.append(f"/albums/{item['album_id']}/songs")
+        if item.get('artist_id'):
+            paths.append(f"/artists/{item['artist_id']}/songs")
+        return paths
+    if entity_type == 'ALBUM':
+        paths = [f"/albums/{item['album_id']}", '/albums']
+        if item.get('artist_id'):
+            paths.append(f"/artists/{item['artist_id']}/albums")
+        return paths
+    if entity_type == 'ARTIST':
+        return [f"/artists/{item['artist_id']}", '/artists']
+    raise ValueError(f'Unknown entity type: {entity_type}')
+
+
+def bypass_requested(event):
+    """
+    True if the request is a refresh by refresh_now(), so the handler reads
+    current data: it carries an unexpired REFRESH_HEADER token for its path.
+    """
+    headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    expires, _, mac = (headers.get(REFRESH_HEADER.lower()) or '').partition('.')
+    if not expires.isdigit() or int(expires) < time.time() or not event.get('path'):
+        return False
+    try:
+        keys = signing.keys(REFRESH_SECRET_ENV)
+    except Exception as e:
+        print(f"Warning: Could not read the cache refresh key: {str(e)}")
+        return False
+    return any(hmac.compare_digest(mac, _token_mac(key, event['path'], expires)) for key in keys)
+
+
+def refresh_token(path):
+    """A REFRESH_HEADER value for `path`, or None without a refresh key."""
+    keys = signing.keys(REFRESH_SECRET_ENV)
+    if not keys:
+        return None
+    expires = str(int(time.time()) + REFRESH_TOKEN_SECONDS)
+    return f'{expires}.{_token_mac(keys[0], path, expires)}'
+
+
+def _token_mac(key, path, expires):
+    return hmac.new(key, f'{expires}:{path}'.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def refresh(paths):
+    """
+    Have `paths` refreshed in the background, without waiting for it.
+    Failures are logged; the entries then expire with their TTL.
+    """
+    function_name = os.environ.get('STAGE_CACHE_REFRESH_FUNCTION')
+    if not function_name or not paths:
+        return
+    try:
+        clients.lambda_client().invoke(
+            FunctionName=function_name,
+            InvocationType='Event',  # Asynchronous invocation
+            Payload=json.dumps({'paths': list(paths)})
+        )
+    except Exception as e:
+        print(f"Warning: Could not request cache refresh of {paths}: {str(e)}")
+
+
+def refresh_now(paths):
+    """
+    Re-request `paths` so the stage caches their current responses.
+    Failures are logged; the entries then expire with their TTL.
+    """
+    base_url = _base_url()
+    if not base_url or not paths:
+        return
+    session = _signing_session()
+    paths = ['/' + path.lstrip('/') for path in paths]
+    # Tokens are made up front, so the refresh key is read once
+    tokens = [refresh_token(path) for path in paths]
+    with ThreadPoolExecutor(max_workers=len(paths)) as pool:
+        list(pool.map(lambda path, token: _refresh(session, base_url + path.lstrip('/'), token), paths, tokens))
+
+
+def _signing_session():
+    """One session for the container; its credentials refresh themselves."""
+    global _session
+    if _session is None:
+        _session = boto3.session.Session()
+    return _session
+
+
+def _refresh(session, url, token):
+    try:
+        headers = {'Cache-Control': 'max-age=0'}
+        if token:
+            headers[REFRESH_HEADER] = token
+        request = AWSRequest(method='GET', url=url, headers=headers)
+        SigV4Auth(session.get_credentials().get_frozen_credentials(), 'execute-api', session.region_name).add_auth(request)
+        with urllib.request.urlopen(urllib.request.Request(url, headers=dict(request.headers)), timeout=REQUEST_TIMEOUT_SECONDS):
+            pass
+    except urllib.error.HTTPError as e:
+        # 4xx is expected, e.g. 404 after a delete
+        if e.code >= 500:
+            print(f"Warning: Cache refresh of {url} returned {e.code}")
+    except Exception as e:
+        print(f"Warning: Cache refresh of {url} failed: {str(e)}")
+
+
+def _base_url():
+    if not _api_url:
+        parameter = os.environ.get('API_URL_PARAMETER')
+        url = None
+        if parameter:
+            try:
+                url = clients.client('ssm').get_parameter(Name=parameter)['Parameter']['Value']
+            except Exception as e:
+                print(f"Warning: Could not read {parameter}: {str(e)}")
+                return None
+        _api_url.append(url.rstrip('/') + '/' if url else None)
+    return _api_url[0]
@@ -0,0 +1,39 @@
+"""
+Helpers for DynamoDB Streams consumers on the catalog table.
+Stream records carry wire-format images; these return plain values.
+Consumers run one invocation per shard at a time, and a failed batch is
+retried from the same first record, so the first record's eventID names
+the batch across retries and sequence numbers order records within it.
+"""
+import time
+
+from common import wire
+
+
+def old_image(record):
+    """The item before the change, as plain values (None for INSERT)."""
+    return wire.from_wire(record['dynamodb'].get('OldImage'))
+
+
+def new_image(record):
+    """The item after the change, as plain values (None for REMOVE)."""
+    return wire.from_wire(record['dynamodb'].get('NewImage'))
+
+
+def sequence_number(record):
+    """The record's position in its shard, as an int for comparisons."""
+    return int(record['dynamodb']['SequenceNumber'])
+
+
+def batch_id(records):
+    """Identifier of a batch that stays the same when Lambda retries it."""
+    return records[0]['eventID'] if records else None
+
+
+def lag_ms(records):
+    """Milliseconds since the oldest change in the batch was made."""
+    created = [record['dynamodb'].get('ApproximateCreationDateTime') for record in records]
+    created = [value for value in created if value]
+    if not created:
+        return 0
+    return max(0, int((time.time() - min(created)) * 1000))
@@ -0,0 +1,80 @@
+"""
+Fast path for list endpoints: query with the low-level DynamoDB client and
+render the wire-format AttributeValue maps straight to JSON text.
+This skips TypeDeserializer and the intermediate Decimal/set objects that the
+resource API builds for every attribute. Enabled per function with the
+RAW_ITEM_RENDERING environment variable.
+"""
+import base64
+import os
+from decimal import Decimal
+from json.encoder import encode_basestring_ascii as encode_string
+
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+
+from common.serialization import RawJSON
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+def enabled():
+    """True if the function is configured to use the raw rendering path."""
+    return os.environ.get('RAW_ITEM_RENDERING', '').lower() in ('1', 'true', 'yes')
+
+
+def to_wire(values):
+    """Serialize a dict of plain values (keys, expression values) to AttributeValues."""
+    if values is None:
+        return None
+    return {name: _serializer.serialize(value) for name, value in values.items()}
+
+
+def from_wire(values):
+    """Deserialize a dict of AttributeValues (e.g. LastEvaluatedKey) to plain values."""
+    if values is None:
+        return None
+    return {name: _deserializer.deserialize(value) for name, value in values.items()}
+
+
+def _render_binary(value):
+    return encode_string(base64.b64encode(value).decode('ascii'))
+
+
+def render_value(value):
+    """Render a single AttributeValue as JSON text."""
+    (type_code, data), = value.items()
+    if type_code == 'S':
+        return encode_string(data)
+    if type_code == 'N':
+        # DynamoDB returns normalized number strings, which are valid JSON numbers
+        return data
+    if type_code == 'BOOL':
+        return 'true' if data else 'false'
+    if type_code == 'NULL':
+        return 'null'
+    if type_code == 'M':
+        return render_item(data)
+    if type_code == 'L':
+        return '[' + ', '.join(render_value(element) for element in data) + ']'
+    if type_code == 'SS':
+        return '[' + ', '.join(encode_string(element) for element in sorted(data)) + ']'
+    if type_code == 'NS':
+        return '[' + ', '.join(sorted(data, key=Decimal)) + ']'
+    if type_code == 'B':
+        return _render_binary(data)
+    if type_code == 'BS':
+        return '[' + ', '.join(_render_binary(element) for element in sorted(data)) + ']'
+    raise ValueError(f'Unsupported AttributeValue type: {type_code}')
+
+
+def render_item(item):
+    """Render an AttributeValue map (an item or a nested M) as a JSON object."""
+    return '{' + ', '.join(
+        f'{encode_string(name)}: {render_value(value)}' for name, value in item.items()
+    ) + '}'
+
+
+def render_items(items):
+    """Render a list of wire items as a JSON array fragment for json_response."""
+    return RawJSON('[' + ', '.join(render_item(item) for item in items) + ']')
@@ -0,0 +1,193 @@
+import json
+
+from botocore.exceptions import ClientError
+
+from common import clients
+from common.sharding import shard_for, subscriber_shard, subscriber_shard_count
+
+ENTITY_TYPES = ('SONG', 'ALBUM', 'ARTIST')
+
+# Scan, key and condition of each table
+TARGETS = {
+    'catalog': {
+        'key_attributes': ('pk', 'sk'),
+        'scan_params': {
+            'ProjectionExpression': 'pk, sk, entity_type, artist_id, entity_shard, artist_songs, artist_albums',
+            'FilterExpression': (
+                'entity_type IN (:song, :album, :artist) AND ('
+                'attribute_not_exists(entity_shard) OR '
+                '(entity_type = :song AND attribute_not_exists(artist_songs)) OR '
+                '(entity_type = :album AND attribute_not_exists(artist_albums)))'
+            ),
+            'ExpressionAttributeValues': {
+                ':song': 'SONG',
+                ':album': 'ALBUM',
+                ':artist': 'ARTIST'
+            }
+        },
+        'condition': 'attribute_exists(pk)',
+        'condition_values': {},
+        'key_conditions': {},
+        'key_condition_values': {}
+    },
+    'subscriptions': {
+        'key_attributes': ('user_id', 'artist_id'),
+        'scan_params': {
+            'ProjectionExpression': 'user_id, artist_id, user_email, notification_enabled, artist_shard, notify_artist',
+            'FilterExpression': (
+                'attribute_not_exists(artist_shard) OR (attribute_exists(user_email) AND '
+                'attribute_not_exists(notify_artist) AND '
+                '(attribute_not_exists(notification_enabled) OR notification_enabled = :enabled))'
+            ),
+            'ExpressionAttributeValues': {
+                ':enabled': True
+            }
+        },
+        'condition': 'attribute_exists(user_id)',
+        'condition_values': {},
+        # Notifications may have been turned off since the scan
+        'key_conditions': {
+            'notify_artist': '(attribute_not_exists(notification_enabled) OR notification_enabled = :enabled)'
+        },
+        'key_condition_values': {':enabled': True}
+    }
+}
+
+# Stop scanning and hand over to a fresh invocation below this much time left
+CONTINUATION_MARGIN_MS = 30000
+
+def handler(event, context):
+    """
+    Backfill GSI keys that the create handlers write on catalog items created
+    before the matching index existed:
+    - entity_shard (entity-shard-index) on songs, albums and artists
+    - artist_songs (artist-songs-index) on songs
+    - artist_albums (artist-albums-index) on albums
+    and, with "table": "subscriptions", on subscriptions:
+    - artist_shard (artist-shard-index)
+    - notify_artist (notify-artist-index) where notifications are on
+    Safe to re-run: only missing keys are written and updates never
+    recreate deleted items.
+    
+    Event format (all fields optional):
+    {
+        "table": "catalog",    # or "subscriptions"
+        "total_segments": 4,   # parallel scan segments, fanned out when no segment is given
+        "segment": 0,
+        "last_key": {...},     # resume point of a previous run
+        "dry_run": false
+    }
+    
+    When the invocation runs low on time it re-invokes itself asynchronously
+    with the scan cursor, so a full table backfill needs a single call.
+    """
+    table_name = event.get('table', 'catalog')
+    target = TARGETS[table_name]
+    total_segments = int(event.get('total_segments', 1))
+    segment = event.get('segment')
+    dry_run = bool(event.get('dry_run', False))
+    
+    # Fan out one invocation per scan segment
+    if segment is None and total_segments > 1:
+        for index in range(total_segments):
+            _continue(context, {
+                'table': table_name,
+                'total_segments': total_segments,
+                'segment': index,
+                'dry_run': dry_run
+            })
+        return {'segments_started': total_segments}
+    
+    table = clients.subscriptions_table() if table_name == 'subscriptions' else clients.table()
+    scan_params = dict(target['scan_params'])
+    if total_segments > 1:
+        scan_params['Segment'] = int(segment or 0)
+        scan_params['TotalSegments'] = total_segments
+    
+    last_key = event.get('last_key')
+    scanned = updated = skipped = 0
+    
+    while True:
+        if last_key:
+            scan_params['ExclusiveStartKey'] = last_key
+        response = table.scan(**scan_params)
+        scanned += response.get('ScannedCount', 0)
+        
+        for item in response.get('Items', []):
+            missing = missing_subscription_keys(item) if table_name == 'subscriptions' else missing_keys(item)
+            if not missing or dry_run:
+                skipped += 1
+                continue
+            conditions = [target['key_conditions'][name] for name in missing if name in target['key_conditions']]
+            try:
+                table.update_item(
+                    Key={name: item[name] for name in target['key_attributes']},
+                    UpdateExpression='SET ' + ', '.join(f'{name} = :{name}' for name in missing),
+                    ConditionExpression=' AND '.join([target['condition']] + conditions),
+                    ExpressionAttributeValues={
+                        **{f':{name}': value for name, value in missing.items()},
+                        **target['condition_values'],
+                        **(target['key_condition_values'] if conditions else {})
+                    }
+                )
+                updated += 1
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                skipped += 1  # Deleted or changed since it was scanned
+        
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+        if context.get_remaining_time_in_millis() < CONTINUATION_MARGIN_MS:
+            _continue(context, {
+                'table': table_name,
+                'total_segments': total_segments,
+                'segment': segment,
+                'last_key': last_key,
+                'dry_run': dry_run
+            })
+            break
+    
+    summary = {
+        'table': table_name,
+        'segment': segment,
+        'scanned': scanned,
+        'updated': updated,
+        'skipped': skipped,
+        'last_key': last_key,
+        'dry_run': dry_run
+    }
+    print(f"Backfill progress: {json.dumps(summary, default=str)}")
+    return summary
+
+def missing_keys(item):
+    """Index keys the item should carry but does not, as {attribute: value}."""
+    entity_type = item['entity_type']
+    expected = {'entity_shard': shard_for(entity_type, item['pk'].split('#', 1)[1])}
+    if entity_type == 'SONG':
+        expected['artist_songs'] = item.get('artist_id')
+    elif entity_type == 'ALBUM':
+        expected['artist_albums'] = item.get('artist_id')
+    return {name: value for name, value in expected.items() if value and name not in item}
+
+def missing_subscription_keys(item):
+    """
+    artist_shard, and notify_artist if notifications are on, where they are
+    missing. A notify_artist written before sharding is kept as the shard.
+    """
+    shard = item.get('artist_shard') or item.get('notify_artist') or subscriber_shard(
+        item['artist_id'], item['user_id'], subscriber_shard_count(item['artist_id'])
+    )
+    expected = {'artist_shard': shard}
+    if item.get('user_email') and item.get('notification_enabled', True):
+        expected['notify_artist'] = shard
+    return {name: value for name, value in expected.items() if name not in item}
+
+def _continue(context, payload):
+    """Invoke this function again asynchronously with the given event."""
+    clients.lambda_client().invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType='Event',
+        Payload=json.dumps(payload, default=str)
+    )
@@ -1,92 +1,48 @@
 import json
-import boto3
 import uuid
 import os
 import base64
 from datetime import datetime
 
-dynamodb = boto3.resource('dynamodb')
-s3 = boto3.client('s3')
-lambda_client = boto3.client('lambda')
-
-# CORS headers that must be included in every response
-CORS_HEADERS = {
-    'Access-Control-Allow-Origin': '*',
-    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-    'Access-Control-Allow-Methods': 'GET,POST,PUT,DELETE,OPTIONS',
-    'Access-Control-Allow-Credentials': 'true'
-}
+from common import clients
+from common.auth import is_admin
+from common.cache import get_metadata_many, invalidate_metadata
+from common.dynamo import transact_write, TransactionCancelled
+from common.sharding import shard_for
+from common.responses import json_response, parse_json_body, CORS_HEADERS
+from common.stage_cache import catalog_paths, refresh
 
 def handler(event, context):
-    claims = event['requestContext']['authorizer']['claims']
-    groups = claims.get('cognito:groups', [])
-    if 'admin' not in groups:
-        return {
-            'statusCode': 403,
-            'headers': CORS_HEADERS,
-            'body': json.dumps({'error': 'Forbidden: Admin access required'})
-        }
-
+    if not is_admin(event):
+        return json_response(403, {'error': 'Forbidden: Admin access required'}, headers=CORS_HEADERS)
+    
     try:
-        if isinstance(event.get('body'), str):
-            body = json.loads(event['body'])
-        else:
-            body = event.get('body', {})
+        body = parse_json_body(event)
         
         required_fields = ['title', 'artist_id', 'duration', 'album_id']        
         if not all(field in body for field in required_fields):
-            return {
-                'statusCode': 400,
-                'headers': CORS_HEADERS,
-                'body': json.dumps({
-                    'error': 'Missing required fields',
-                    'required': required_fields
-                })
-            }
+            return json_response(400, {
+                'error': 'Missing required fields',
+                'required': required_fields
+            }, headers=CORS_HEADERS)
         
         song_id = str(uuid.uuid4())
         now = datetime.utcnow().isoformat()
         
-        table_name = os.environ.get('TABLE_NAME')
         bucket_name = os.environ.get('BUCKET_NAME')
-        table = dynamodb.Table(table_name)
-        
         album_id = body['album_id']
         artist_id = body['artist_id']
         
-        # Verify album exists
-        album_response = table.get_item(
-            Key={
-                'pk': f'ALBUM#{album_id}',
-                'sk': 'METADATA'
-            }
-        )
-        if 'Item' not in album_response:
-            return {
-                'statusCode': 404,
-                'headers': CORS_HEADERS,
-                'body': json.dumps({
-                    'error': 'Album not found'
-                })
-            }
+        # Verify album and artist exist: from the METADATA cache, or in a
+        # single round trip for the ones it does not hold
+        found = get_metadata_many([('ALBUM', album_id), ('ARTIST', artist_id)])
+        album = found[f'ALBUM#{album_id}']
+        if album is None:
+            return json_response(404, {'error': 'Album not found'}, headers=CORS_HEADERS)
         
-        # Verify artist exists
-        artist_response = table.get_item(
-            Key={
-                'pk': f'ARTIST#{artist_id}',
-                'sk': 'METADATA'
-            }
-        )
-        if 'Item' not in artist_response:
-            return {
-                'statusCode': 404,
-                'headers': CORS_HEADERS,
-                'body': json.dumps({
-                    'error': 'Artist not found'
-                })
-            }
-        
-        artist = artist_response['Item']
+        artist = found[f'ARTIST#{artist_id}']
+        if artist is None:
+            return json_response(404, {'error': 'Artist not found'}, headers=CORS_HEADERS)
         
         s3_key = None
         if 'audio_file' in body:
@@ -95,7 +51,7 @@ def handler(event, context):
                 file_extension = body.get('file_extension', 'mp3')
                 s3_key = f"songs/{song_id}/audio.{file_extension}"
                 
-                s3.put_object(
+                clients.s3().put_object(
                     Bucket=bucket_name,
                     Key=s3_key,
                     Body=audio_data,
@@ -103,7 +59,7 @@ def handler(event, context):
                     Metadata={
                         'song_id': song_id,
                         'title': body['title'],
-                        'artist': body['artist']
+                        'artist': artist['name']
                     }
                 )
                 print(f"Successfully uploaded audio file to s3://{bucket_name}/{s3_key}")
@@ -114,9 +70,11 @@ def handler(event, context):
             'pk': f'SONG#{song_id}',
             'sk': 'METADATA',
             'entity_type': 'SONG',
+            'entity_shard': shard_for('SONG', song_id),
             'song_id': song_id,
             'title': body['title'],
             'artist_id': artist_id,
+            'artist_songs': artist_id,  # Sparse key for artist-songs-index
             'artist_name': artist['name'],
             'duration': int(body['duration']),
             'album_id': album_id,
@@ -129,51 +87,52 @@ def handler(event, context):
             item['s3_key'] = s3_key
             item['audio_url'] = f"s3://{bucket_name}/{s3_key}"
         
-        table.put_item(Item=item)
-        
-        # Increment album total_songs counter
-        table.update_item(
-            Key={
-                'pk': f'ALBUM#{album_id}',
-                'sk': 'METADATA'
-            },
-            UpdateExpression='SET total_songs = if_not_exists(total_songs, :zero) + :inc, updated_at = :now',
-            ExpressionAttributeValues={
-                ':zero': 0,
-                ':inc': 1,
-                ':now': now
-            }
-        )
+        # Save the song, checking in the same transaction that the album and
+        # artist still exist (the cached copies may predate a delete). The
+        # total_songs counters are maintained from the table stream
+        # (streams/counters.py).
+        try:
+            transact_write([
+                {'Put': {'Item': item, 'ConditionExpression': 'attribute_not_exists(pk)'}},
+                {'ConditionCheck': {'Key': {'pk': f'ALBUM#{album_id}', 'sk': 'METADATA'}, 'ConditionExpression': 'attribute_exists(pk)'}},
+                {'ConditionCheck': {'Key': {'pk': f'ARTIST#{artist_id}', 'sk': 'METADATA'}, 'ConditionExpression': 'attribute_exists(pk)'}}
+            ], token=song_id)
+            invalidate_metadata('SONG', song_id)
+        except Exception as e:
+            if s3_key:
+                # Don't leave an audio file behind for a song that was not saved
+                try:
+                    clients.s3().delete_object(Bucket=bucket_name, Key=s3_key)
+                except Exception as s3_error:
+                    print(f"Warning: Failed to remove orphaned audio file: {str(s3_error)}")
+            if isinstance(e, TransactionCancelled) and e.failed(1):
+                invalidate_metadata('ALBUM', album_id)
+                return json_response(404, {'error': 'Album not found'}, headers=CORS_HEADERS)
+            if isinstance(e, TransactionCancelled) and e.failed(2):
+                invalidate_metadata('ARTIST', artist_id)
+                return json_response(404, {'error': 'Artist not found'}, headers=CORS_HEADERS)
+            raise
         
-        # Increment artist total_songs counter
-        table.update_item(
-            Key={
-                'pk': f'ARTIST#{artist_id}',
-                'sk': 'METADATA'
-            },
-            UpdateExpression='SET total_songs = if_not_exists(total_songs, :zero) + :inc, updated_at = :now',
-            ExpressionAttributeValues={
-                ':zero': 0,
-                ':inc': 1,
-                ':now': now
-            }
-        )
+        # Show the new song on the cached list routes
+        refresh(catalog_paths('SONG', item))
         
         # Trigger email notifications to subscribers (asynchronous)
         try:
             notification_payload = {
                 'event_type': 'song_created',
                 'artist_id': artist_id,
+                'content_id': song_id,
+                'created_at': now,
                 'content_title': body['title'],
                 'content_details': {
-                    'album_title': album_response['Item'].get('title', 'Unknown Album'),
+                    'album_title': album.get('title', 'Unknown Album'),
                     'genre': body.get('genre', ''),
                     'duration': body.get('duration', 0)
                 }
             }
             
             # Invoke send_notifications Lambda asynchronously
-            lambda_client.invoke(
+            clients.lambda_client().invoke(
                 FunctionName=os.environ.get('SEND_NOTIFICATIONS_FUNCTION', 'send-notifications'),
                 InvocationType='Event',  # Asynchronous invocation
                 Payload=json.dumps(notification_payload)
@@ -182,24 +141,13 @@ def handler(event, context):
         except Exception as e:
             print(f"Warning: Failed to trigger notifications: {str(e)}")
         
-        return {
-            'statusCode': 201,
-            'headers': {
-                **CORS_HEADERS,
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({
-                'message': 'Song created successfully',
-                'song': item
-            })
-        }
+        return json_response(201, {
+            'message': 'Song created successfully',
+            'song': item
+        }, headers={**CORS_HEADERS, 'Content-Type': 'application/json'})
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': CORS_HEADERS,
-            'body': json.dumps({
-                'error': 'Internal server error',
-                'message': str(e)
-            })
-        }
+        return json_response(500, {
+            'error': 'Internal server error',
+            'message': str(e)
+        }, headers=CORS_HEADERS)
@@ -1,10 +1,8 @@
-import json
-import boto3
-import os
-
-# Initialize DynamoDB
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table(os.environ['TABLE_NAME'])
+from common import conditional
+from common.cache import get_metadata
+from common.projection import Projection, InvalidFields
+from common.responses import json_response, error_response
+from common.stage_cache import bypass_requested
 
 def handler(event, context):
     """
@@ -16,76 +14,37 @@ def handler(event, context):
         song_id = event['pathParameters']['songId']
         
         if not song_id:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Song ID is required'
-                })
-            }
+            return error_response(400, 'Song ID is required')
+        
+        # Attributes selected with ?fields= or ?view=
+        try:
+            projection = Projection.from_event(event, 'SONG')
+        except InvalidFields as e:
+            return error_response(400, str(e))
         
-        # Query DynamoDB for the song
-        response = table.get_item(
-            Key={
-                'pk': f'SONG#{song_id}',
-                'sk': 'METADATA'
-            }
-        )
+        # Popular songs are served from the container's METADATA cache,
+        # unless the request refreshes the stage cache
+        item = get_metadata('SONG', song_id, refresh=bypass_requested(event))
         
-        if 'Item' not in response:
-            return {
-                'statusCode': 404,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Song not found'
-                })
-            }
+        if item is None:
+            return error_response(404, 'Song not found')
         
-        song = response['Item']
+        # Clients that already hold this version get an empty 304
+        etag = conditional.item_etag(item, projection)
+        not_modified = conditional.check(event, 'get_song', etag)
+        if not_modified:
+            return not_modified
         
-        # Convert to proper JSON format
-        song_dict = json.loads(json.dumps(song, default=str))
+        song = projection.select(item)
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Song retrieved successfully',
-                'song': song_dict
-            })
-        }
+        return json_response(200, {
+            'message': 'Song retrieved successfully',
+            'song': song
+        }, headers=conditional.cache_headers(etag))
     
     except KeyError:
-        return {
-            'statusCode': 400,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Song ID is required in path parameters'
-            })
-        }
+        return error_response(400, 'Song ID is required in path parameters')
     
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Error retrieving song',
-                'error': str(e)
-            })
-        }
+        return error_response(500, 'Error retrieving song', error=str(e))
@@ -1,83 +1,41 @@
-import json
-import boto3
-import os
-from decimal import Decimal
-
-# Initialize DynamoDB
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table(os.environ['TABLE_NAME'])
+from common import conditional, cursor, wire
+from common.cursor import InvalidCursor
+from common.pagination import parse_pagination
+from common.projection import Projection, InvalidFields
+from common.sharding import listing_index_key, listing_scope, query_sharded
+from common.responses import error_response
 
 def handler(event, context):
     """
-    Get all songs from the database using GSI.
+    Get all songs from the database using the sharded entity GSI.
     Returns a paginated list of songs.
     """
     try:
-        # Get query parameters for pagination
-        limit = 20  # Default limit
-        exclusive_start_key = None
-        
-        if event.get('queryStringParameters'):
-            params = event['queryStringParameters']
-            if params and params.get('limit'):
-                try:
-                    limit = int(params['limit'])
-                    if limit > 100:
-                        limit = 100  # Max limit of 100
-                except ValueError:
-                    pass
-            
-            if params and params.get('last_key'):
-                try:
-                    exclusive_start_key = json.loads(params['last_key'])
-                except json.JSONDecodeError:
-                    pass
-        
-        # Query using GSI to get all songs efficiently
-        query_params = {
-            'IndexName': 'entity-type-index',
-            'KeyConditionExpression': 'entity_type = :entity_type',
-            'ExpressionAttributeValues': {
-                ':entity_type': 'SONG'
-            },
-            'Limit': limit,
-            'ScanIndexForward': False  # Sort by created_at descending (newest first)
-        }
-        
-        if exclusive_start_key:
-            query_params['ExclusiveStartKey'] = exclusive_start_key
+        scope = listing_scope('songs')
+        try:
+            limit, exclusive_start_key = parse_pagination(event, scope)
+            projection = Projection.from_event(event, 'SONG', required=listing_index_key())
+        except InvalidCursor:
+            return error_response(400, 'Invalid pagination cursor')
+        except InvalidFields as e:
+            return error_response(400, str(e))
         
-        response = table.query(**query_params)
+        # Scatter-gather across the listing index shards, newest first
+        items, last_key = query_sharded('SONG', limit, exclusive_start_key, projection=projection)
+        projection.strip(items)
         
-        # Convert Decimal to float for JSON serialization
-        items = []
-        for item in response.get('Items', []):
-            item_dict = json.loads(json.dumps(item, default=str))
-            items.append(item_dict)
+        if wire.enabled():
+            # Fast path: render wire-format items without deserializing them
+            songs = wire.render_items(items)
+        else:
+            songs = [wire.from_wire(item) for item in items]
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Songs retrieved successfully',
-                'count': len(items),
-                'songs': items,
-                'last_key': response.get('LastEvaluatedKey')  # For pagination
-            })
-        }
+        return conditional.page_response(event, 'get_songs', {
+            'message': 'Songs retrieved successfully',
+            'count': len(items),
+            'songs': songs,
+            'last_key': cursor.encode(last_key, scope)  # For pagination
+        })
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Error retrieving songs',
-                'error': str(e)
-            })
-        }
+        return error_response(500, 'Error retrieving songs', error=str(e))
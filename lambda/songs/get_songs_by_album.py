@@ -1,10 +1,8 @@
-import json
-import boto3
-import os
-
-# Initialize DynamoDB
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table(os.environ['TABLE_NAME'])
+from common import clients, conditional, cursor
+from common.cursor import InvalidCursor
+from common.pagination import parse_pagination, query_page
+from common.projection import Projection, InvalidFields
+from common.responses import error_response
 
 def handler(event, context):
     """
@@ -18,36 +16,16 @@ def handler(event, context):
         album_id = event['pathParameters']['albumId']
         
         if not album_id:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'message': 'Album ID is required'
-                })
-            }
-        
-        # Get query parameters for pagination
-        limit = 20  # Default limit
-        exclusive_start_key = None
+            return error_response(400, 'Album ID is required')
         
-        if event.get('queryStringParameters'):
-            params = event['queryStringParameters']
-            if params and params.get('limit'):
-                try:
-                    limit = int(params['limit'])
-                    if limit > 100:
-                        limit = 100  # Max limit of 100
-                except ValueError:
-                    pass
-            
-            if params and params.get('last_key'):
-                try:
-                    exclusive_start_key = json.loads(params['last_key'])
-                except json.JSONDecodeError:
-                    pass
+        scope = f'album_songs:{album_id}'
+        try:
+            limit, exclusive_start_key = parse_pagination(event, scope)
+            projection = Projection.from_event(event, 'SONG')
+        except InvalidCursor:
+            return error_response(400, 'Invalid pagination cursor')
+        except InvalidFields as e:
+            return error_response(400, str(e))
         
         # Query using album-index GSI
         query_params = {
@@ -57,58 +35,23 @@ def handler(event, context):
             'ExpressionAttributeValues': {
                 ':album_id': album_id,
                 ':entity_type': 'SONG'
-            },
-            'Limit': limit
+            }
         }
         
-        if exclusive_start_key:
-            query_params['ExclusiveStartKey'] = exclusive_start_key
-        
-        response = table.query(**query_params)
+        query_params = projection.apply(query_params)
+        songs, last_key = query_page(clients.table(), query_params, limit, exclusive_start_key)
         
-        # Convert Decimal to float for JSON serialization
-        items = []
-        for item in response.get('Items', []):
-            item_dict = json.loads(json.dumps(item, default=str))
-            items.append(item_dict)
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Songs retrieved successfully',
-                'album_id': album_id,
-                'count': len(items),
-                'songs': items,
-                'last_key': response.get('LastEvaluatedKey')  # For pagination
-            })
-        }
+        return conditional.page_response(event, 'get_songs_by_album', {
+            'message': 'Songs retrieved successfully',
+            'album_id': album_id,
+            'count': len(songs),
+            'songs': songs,
+            'last_key': cursor.encode(last_key, scope)  # For pagination
+        })
     
     except KeyError:
-        return {
-            'statusCode': 400,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Album ID is required in path parameters'
-            })
-        }
+        return error_response(400, 'Album ID is required in path parameters')
     
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Error retrieving songs',
-                'error': str(e)
-            })
-        }
+        return error_response(500, 'Error retrieving songs', error=str(e))
@@ -0,0 +1,163 @@
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from common import metrics, streams
+from common.cache import invalidate_keys
+from common.dynamo import MAX_ATTEMPTS, TransactionCancelled, backoff, batch_get, transact_write
+
+# Ledger entries only need to outlive stream retention (24 hours) and retries
+LEDGER_TTL_SECONDS = 2 * 86400
+
+# Parents updated in parallel
+MAX_WORKERS = 8
+
+BATCH_GET_SIZE = 100
+
+def handler(event, context):
+    """
+    Maintain the total_songs and total_albums counters on ALBUM and ARTIST
+    items from the catalog table's stream (INSERT and REMOVE of songs and
+    albums; the event source mapping filters out everything else).
+    
+    The deltas of a batch are summed per parent, and each parent gets one
+    update. To make stream retries idempotent, each update is written in a
+    transaction with a ledger item in the parent's item collection
+    (sk COUNTED#<first eventID of the batch>) holding the last sequence
+    number applied from this batch. A retried batch starts at the same
+    record, so it finds the ledger and applies only the records after it.
+    Ledger items expire through the table's TTL.
+    """
+    records = event.get('Records', [])
+    if not records:
+        return {'parents': 0}
+    
+    batch_id = streams.batch_id(records)
+    changes = collect(records)
+    
+    ledger_keys = [ledger_key(parent_pk, batch_id) for parent_pk in changes]
+    applied = {}
+    for start in range(0, len(ledger_keys), BATCH_GET_SIZE):
+        for ledger in batch_get(ledger_keys[start:start + BATCH_GET_SIZE]):
+            applied[ledger['pk']] = int(ledger['last_seq'])
+    
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        outcomes = Counter(pool.map(
+            lambda parent_pk: apply(parent_pk, changes[parent_pk], batch_id, applied.get(parent_pk)),
+            list(changes)
+        ))
+    
+    # Cached parents hold the old counters; removed songs and albums may
+    # still be cached (e.g. those deleted by a cascade job)
+    invalidate_keys(list(changes) + removed_keys(records))
+    
+    metrics.emit(
+        {
+            'CounterRecords': len(records),
+            'CounterParentsUpdated': outcomes['updated'],
+            'CounterParentsSkipped': outcomes['duplicate'] + outcomes['unchanged'],
+            'CounterParentsMissing': outcomes['missing'],
+            'CounterStreamLag': streams.lag_ms(records)
+        },
+        dimensions={'Consumer': 'counters'},
+        units={'CounterStreamLag': 'Milliseconds'}
+    )
+    return dict(outcomes, records=len(records))
+
+def collect(records):
+    """
+    Counter deltas per parent item, as {parent pk: [(sequence number,
+    counter, delta), ...]}:
+    - song inserted/removed: total_songs +1/-1 on its album and its artist
+    - album inserted/removed: total_albums +1/-1 on its artist
+    """
+    changes = defaultdict(list)
+    for record in records:
+        if record['eventName'] == 'INSERT':
+            item, delta = streams.new_image(record), 1
+        elif record['eventName'] == 'REMOVE':
+            item, delta = streams.old_image(record), -1
+        else:
+            continue
+        if not item or item.get('sk') != 'METADATA':
+            continue
+        
+        seq = streams.sequence_number(record)
+        if item.get('entity_type') == 'SONG':
+            if item.get('album_id'):
+                changes[f"ALBUM#{item['album_id']}"].append((seq, 'total_songs', delta))
+            if item.get('artist_id'):
+                changes[f"ARTIST#{item['artist_id']}"].append((seq, 'total_songs', delta))
+        elif item.get('entity_type') == 'ALBUM':
+            if item.get('artist_id'):
+                changes[f"ARTIST#{item['artist_id']}"].append((seq, 'total_albums', delta))
+    return changes
+
+def removed_keys(records):
+    """Partition keys of the METADATA items removed in the batch."""
+    return [
+        record['dynamodb']['Keys']['pk']['S'] for record in records
+        if record['eventName'] == 'REMOVE' and record['dynamodb']['Keys']['sk']['S'] == 'METADATA'
+    ]
+
+def ledger_key(parent_pk, batch_id):
+    return {
+        'pk': parent_pk,
+        'sk': f'COUNTED#{batch_id}'
+    }
+
+def apply(parent_pk, entries, batch_id, applied_seq):
+    """
+    Add the deltas of the entries after `applied_seq` to the parent and move
+    the batch's ledger forward in one transaction. Returns 'updated',
+    'duplicate' (already applied), 'unchanged' (deltas cancel out) or
+    'missing' (parent deleted).
+    """
+    pending = [entry for entry in entries if applied_seq is None or entry[0] > applied_seq]
+    if not pending:
+        return 'duplicate'
+    
+    totals = Counter()
+    for _, counter, delta in pending:
+        totals[counter] += delta
+    totals = {counter: delta for counter, delta in totals.items() if delta}
+    if not totals:
+        return 'unchanged'
+    
+    last_seq = max(entry[0] for entry in pending)
+    key = ledger_key(parent_pk, batch_id)
+    if applied_seq is None:
+        ledger = {'Put': {
+            'Item': dict(key, last_seq=last_seq, expires_at=int(time.time()) + LEDGER_TTL_SECONDS),
+            'ConditionExpression': 'attribute_not_exists(pk)'
+        }}
+    else:
+        ledger = {'Update': {
+            'Key': key,
+            'UpdateExpression': 'SET last_seq = :last_seq',
+            'ConditionExpression': 'last_seq = :applied_seq',
+            'ExpressionAttributeValues': {
+                ':last_seq': last_seq,
+                ':applied_seq': applied_seq
+            }
+        }}
+    
+    names = sorted(totals)
+    parent_update = {'Update': {
+        'Key': {'pk': parent_pk, 'sk': 'METADATA'},
+        'UpdateExpression': 'ADD ' + ', '.join(f'{name} :{name}' for name in names),
+        'ConditionExpression': 'attribute_exists(pk)',
+        'ExpressionAttributeValues': {f':{name}': totals[name] for name in names}
+    }}
+    
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            transact_write([ledger, parent_update])
+            return 'updated'
+        except TransactionCancelled as e:
+            if e.failed(1):
+                return 'missing'
+            if 'TransactionConflict' not in e.reasons or attempt == MAX_ATTEMPTS:
+                raise
+            # A concurrent write to the parent, e.g. an admin update
+            backoff(attempt)
@@ -0,0 +1,135 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import chain
+
+from botocore.exceptions import ClientError
+
+from common import clients, discography, metrics, sharding, streams
+from common.cache import invalidate_keys
+from common.dynamo import query_all
+
+# Concurrent UpdateItem calls per rename (below clients.MAX_POOL_CONNECTIONS)
+UPDATE_WORKERS = 32
+
+def _subscriptions_query(artist_id):
+    if sharding.sharded_subscriptions():
+        return {
+            'IndexName': 'artist-shard-index',
+            'KeyConditionExpression': 'artist_shard = :shard'
+        }
+    return {
+        'IndexName': 'artist-id-index',
+        'KeyConditionExpression': 'artist_id = :artist_id'
+    }
+
+# Denormalized artist_name copies: (name, table env var, index query for an
+# artist ID, key attributes). Subscriptions are read from every subscriber
+# shard of the artist once the stack sets SHARDED_SUBSCRIPTIONS, and from
+# artist-id-index until then.
+TARGETS = (
+    ('songs', 'TABLE_NAME', partial(discography.query, 'SONG'), ('pk', 'sk')),
+    ('albums', 'TABLE_NAME', partial(discography.query, 'ALBUM'), ('pk', 'sk')),
+    ('subscriptions', 'SUBSCRIPTIONS_TABLE_NAME', _subscriptions_query, ('user_id', 'artist_id'))
+)
+
+# Only items whose copy is stale are returned and written
+_STALE = 'attribute_not_exists(artist_name) OR artist_name <> :name'
+
+def handler(event, context):
+    """
+    Propagate artist renames from the catalog table stream to the
+    artist_name copies on the artist's songs, albums and subscriptions
+    (MODIFY records of artists; the event source mapping filters out
+    everything else, and records that do not change the name are skipped).
+    
+    Each target index is paged with a filter that returns only stale
+    copies, and every page is handed to a pool of conditional UpdateItem
+    calls while the next page is read. The condition skips copies that are
+    already current or no longer belong to the artist, so a retried batch
+    only re-reads. Throughput is reported as CloudWatch metrics per target.
+    """
+    # The last rename of an artist in the batch wins
+    renames = {}
+    for record in event.get('Records', []):
+        if record['eventName'] != 'MODIFY':
+            continue
+        old, new = streams.old_image(record) or {}, streams.new_image(record) or {}
+        if new.get('sk') == 'METADATA' and new.get('name') and new.get('name') != old.get('name'):
+            renames[new['artist_id']] = new['name']
+    
+    results = []
+    for artist_id, name in renames.items():
+        for target in TARGETS:
+            results.append(propagate(artist_id, name, *target))
+    return {'renames': len(renames), 'results': results}
+
+def propagate(artist_id, name, target, table_env, index_query, key_attributes):
+    """Write `name` to every stale copy of one target. Returns the counts."""
+    table_name = os.environ[table_env]
+    index_query = index_query(artist_id)
+    query_params = dict(
+        index_query,
+        FilterExpression=f"({index_query['FilterExpression']}) AND ({_STALE})" if 'FilterExpression' in index_query else _STALE,
+        ProjectionExpression=', '.join(key_attributes),
+        ExpressionAttributeValues={**index_query.get('ExpressionAttributeValues', {}), ':artist_id': artist_id, ':name': name}
+    )
+    if ':shard' in index_query['KeyConditionExpression']:
+        shards = sharding.subscriber_shard_keys(artist_id, sharding.subscriber_shard_count(artist_id, consistent=True))
+        items = chain.from_iterable(
+            query_all(dict(query_params, ExpressionAttributeValues={':shard': shard, ':name': name}), table_name=table_name)
+            for shard in shards
+        )
+    else:
+        items = query_all(query_params, table_name=table_name)
+    update_params = {
+        'TableName': table_name,
+        'UpdateExpression': 'SET artist_name = :name',
+        'ConditionExpression': f'artist_id = :artist_id AND ({_STALE})',
+        'ExpressionAttributeValues': {':artist_id': artist_id, ':name': name}
+    }
+    started = time.monotonic()
+    
+    with ThreadPoolExecutor(max_workers=UPDATE_WORKERS) as pool:
+        outcomes = list(pool.map(
+            lambda item: _update(update_params, {attribute: item[attribute] for attribute in key_attributes}),
+            items
+        ))
+    
+    elapsed = time.monotonic() - started
+    updated_keys = [key for key in outcomes if key]
+    updated = len(updated_keys)
+    
+    # Catalog items are also cached by readers
+    if table_env == 'TABLE_NAME':
+        invalidate_keys([key['pk'] for key in updated_keys])
+    
+    counts = {
+        'target': target,
+        'updated': updated,
+        'skipped': len(outcomes) - updated,
+        'seconds': round(elapsed, 3)
+    }
+    metrics.emit(
+        {
+            'RenameItemsUpdated': updated,
+            'RenameItemsSkipped': len(outcomes) - updated,
+            'RenameDuration': int(elapsed * 1000),
+            'RenameThroughput': round(updated / elapsed, 1) if elapsed else 0
+        },
+        dimensions={'Consumer': 'renames', 'Target': target},
+        properties={'artist_id': artist_id},
+        units={'RenameDuration': 'Milliseconds', 'RenameThroughput': 'Count/Second'}
+    )
+    return counts
+
+def _update(update_params, key):
+    """Write one copy. Returns its key, or None if the condition skipped it."""
+    try:
+        clients.resource('dynamodb').meta.client.update_item(Key=key, **update_params)
+        return key
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return None
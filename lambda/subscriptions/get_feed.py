@@ -0,0 +1,46 @@
+from common import cursor, feed
+from common.cursor import InvalidCursor
+from common.auth import get_user_id
+from common.pagination import parse_pagination
+from common.responses import json_response
+
+def handler(event, context):
+    """
+    Get the new songs and albums of the artists a user follows, newest first.
+    No path parameters needed.
+    User ID is automatically extracted from JWT claims.
+    Query parameters: limit, last_key (for pagination)
+    
+    Releases pushed into the user's feed are merged with those of large
+    (and muted) artists read from the catalog (see common/feed.py). The
+    feed covers the last FEED_DAYS days, up to MAX_FEED_ENTRIES entries.
+    """
+    try:
+        # Extract user ID from JWT claims
+        user_id = get_user_id(event)
+        
+        if not user_id:
+            return json_response(400, {'error': 'Authentication required'})
+        
+        scope = f'feed:{user_id}'
+        try:
+            limit, position = parse_pagination(event, scope)
+        except InvalidCursor:
+            return json_response(400, {'error': 'Invalid pagination cursor'})
+        
+        entries, next_position = feed.page(user_id, limit, position)
+        
+        return json_response(200, {
+            'message': 'Feed retrieved successfully',
+            'user_id': user_id,
+            'count': len(entries),
+            'entries': entries,
+            'last_key': cursor.encode(next_position, scope)  # For pagination
+        })
+    
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return json_response(500, {
+            'error': 'Error retrieving feed',
+            'message': str(e)
+        })
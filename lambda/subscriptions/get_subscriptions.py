@@ -1,10 +1,8 @@
-import json
-import boto3
-import os
-
-# Initialize DynamoDB
-dynamodb = boto3.resource('dynamodb')
-subscriptions_table = dynamodb.Table(os.environ['SUBSCRIPTIONS_TABLE_NAME'])
+from common import clients, cursor
+from common.cursor import InvalidCursor
+from common.auth import get_user_id
+from common.pagination import parse_pagination
+from common.responses import json_response
 
 def handler(event, context):
     """
@@ -15,40 +13,16 @@ def handler(event, context):
     """
     try:
         # Extract user ID from JWT claims
-        claims = event.get('requestContext', {}).get('authorizer', {}).get('claims', {})
-        user_id = claims.get('sub')  # 'sub' is the user ID in Cognito tokens
+        user_id = get_user_id(event)
         
         if not user_id:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'error': 'Authentication required'
-                })
-            }
-        
-        # Get query parameters for pagination
-        limit = 20  # Default limit
-        exclusive_start_key = None
+            return json_response(400, {'error': 'Authentication required'})
         
-        if event.get('queryStringParameters'):
-            params = event['queryStringParameters']
-            if params and params.get('limit'):
-                try:
-                    limit = int(params['limit'])
-                    if limit > 100:
-                        limit = 100  # Max limit of 100
-                except ValueError:
-                    pass
-            
-            if params and params.get('last_key'):
-                try:
-                    exclusive_start_key = json.loads(params['last_key'])
-                except json.JSONDecodeError:
-                    pass
+        scope = f'subscriptions:{user_id}'
+        try:
+            limit, exclusive_start_key = parse_pagination(event, scope)
+        except InvalidCursor:
+            return json_response(400, {'error': 'Invalid pagination cursor'})
         
         # Query subscriptions by user ID
         query_params = {
@@ -62,39 +36,21 @@ def handler(event, context):
         if exclusive_start_key:
             query_params['ExclusiveStartKey'] = exclusive_start_key
         
-        response = subscriptions_table.query(**query_params)
+        response = clients.subscriptions_table().query(**query_params)
         
-        # Convert Decimal to string for JSON serialization
-        subscriptions = []
-        for item in response.get('Items', []):
-            item_dict = json.loads(json.dumps(item, default=str))
-            subscriptions.append(item_dict)
+        subscriptions = response.get('Items', [])
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Subscriptions retrieved successfully',
-                'user_id': user_id,
-                'count': len(subscriptions),
-                'subscriptions': subscriptions,
-                'last_key': response.get('LastEvaluatedKey')  # For pagination
-            })
-        }
+        return json_response(200, {
+            'message': 'Subscriptions retrieved successfully',
+            'user_id': user_id,
+            'count': len(subscriptions),
+            'subscriptions': subscriptions,
+            'last_key': cursor.encode(response.get('LastEvaluatedKey'), scope)  # For pagination
+        })
     
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': 'Error retrieving subscriptions',
-                'message': str(e)
-            })
-        }
+        return json_response(500, {
+            'error': 'Error retrieving subscriptions',
+            'message': str(e)
+        })
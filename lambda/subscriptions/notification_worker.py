@@ -0,0 +1,148 @@
+import os
+import time
+import uuid
+
+from common import digests, feed, metrics, notifications
+from common.mailer import Mailer, TokenBucket, send_rate
+from common.messaging import get_queue, message_bodies
+
+# Delay before recipients that were still throttled are tried again
+RETRY_DELAY_SECONDS = 60
+
+# Time left when no further email is started; the rest go into a follow-up chunk
+DEADLINE_MARGIN_MS = 15000
+
+# Email content of recent releases, which does not change once planned
+MAX_CACHED_RELEASES = 16
+
+_bucket = []
+_content = {}
+
+def handler(event, context):
+    """
+    Send release notifications from the notifications queue (SQS, batch size 1).
+    Message formats:
+    {"release_id": "...", "chunk_id": "...", "recipients": ["email", ...], "user_ids": ["...", ...]}
+    {"release_id": "...", "action": "plan"}
+    {"release_id": "<digest_id>", "artist_id": "...", "action": "digest"}
+    
+    A chunk is leased before sending, then marked done together with the
+    release counters, so a redelivered chunk is not sent twice. A chunk
+    goes out in one SendBulkTemplatedEmail call with the release's template
+    data and each recipient's address as replacement data. If the chunk
+    lists user_ids, the release's feed entries are pushed to those users'
+    feeds first. Recipients
+    still throttled after the mailer's retries, or not reached before the
+    timeout, go into a follow-up chunk.
+    If nothing in a chunk could be sent (e.g. SES is unavailable), the
+    message fails and SQS redelivers it, moving it to the dead-letter queue
+    after the maximum receive count. "plan" messages continue queueing a
+    release whose planner ran low on time, and "digest" messages close an
+    artist's digest into a release and start queueing it.
+    """
+    for message in message_bodies(event):
+        if message.get('action') == 'plan':
+            release = notifications.get(message['release_id'])
+            if release is None:
+                print(f"Release {message['release_id']} is missing, dropping message")
+                continue
+            notifications.plan(release, context)
+        elif message.get('action') == 'digest':
+            release = digests.close(message['artist_id'], message['release_id'])
+            if release is None:
+                print(f"Digest {message['release_id']} is missing, dropping message")
+                continue
+            notifications.plan(release, context)
+        else:
+            send_chunk(message, context)
+
+def send_chunk(message, context=None):
+    """Send one chunk of a release and record the outcome."""
+    release_id = message['release_id']
+    chunk_id = message['chunk_id']
+    owner = getattr(context, 'aws_request_id', None) or str(uuid.uuid4())
+    
+    if not notifications.claim_chunk(release_id, chunk_id, owner):
+        print(f"Chunk {chunk_id} of release {release_id} is done or in progress, dropping message")
+        return
+    
+    content = _release_content(release_id)
+    if content is None:
+        print(f"Release {release_id} is missing, dropping chunk {chunk_id}")
+        return
+    
+    # Follow-up chunks carry no user IDs: their feeds were written with the first attempt
+    feed_entries_written = 0
+    if message.get('user_ids') and content.get('feed_entries'):
+        feed_entries_written = feed.push(message['user_ids'], content['feed_entries'])
+    
+    deadline = None
+    if context is not None:
+        deadline = time.monotonic() + (context.get_remaining_time_in_millis() - DEADLINE_MARGIN_MS) / 1000
+    with Mailer(bucket=_shared_bucket(), deadline=deadline) as mailer:
+        if content.get('template'):
+            mailer.send_bulk(message['recipients'], content['template'], content['template_data'], recipient_data)
+        else:
+            # Planned before releases used templates
+            mailer.send_all(message['recipients'], content['subject'], content['html'])
+    
+    if mailer.retryable and not mailer.sent and len(mailer.retryable) == mailer.failed:
+        raise RuntimeError(f"No email of chunk {chunk_id} of release {release_id} could be sent")
+    
+    retry = mailer.retryable + mailer.unsent
+    failed = mailer.failed - len(mailer.retryable)
+    
+    if retry:
+        get_queue(notifications.QUEUE_ENV).send({
+            'release_id': release_id,
+            'chunk_id': f'{chunk_id}r',
+            'recipients': retry
+        }, delay_seconds=RETRY_DELAY_SECONDS)
+    
+    notifications.complete_chunk(
+        release_id,
+        chunk_id,
+        owner,
+        sent=mailer.sent,
+        failed=failed,
+        follow_ups=1 if retry else 0
+    )
+    
+    metrics.emit(
+        {
+            'NotificationsSent': mailer.sent,
+            'NotificationApiCalls': mailer.calls,
+            'NotificationsFailed': failed,
+            'NotificationsDeferred': len(retry),
+            'NotificationSendRetries': mailer.retries,
+            'FeedEntriesWritten': feed_entries_written
+        },
+        dimensions={'Consumer': 'notifications'},
+        properties={'release_id': release_id, 'chunk_id': chunk_id}
+    )
+
+def recipient_data(recipient):
+    """Template values that differ per recipient."""
+    return {'email': recipient}
+
+def _shared_bucket():
+    """
+    One token bucket per container. The event source runs at most
+    NOTIFICATION_WORKERS containers, which split the SES send rate.
+    """
+    if not _bucket:
+        workers = int(os.environ.get('NOTIFICATION_WORKERS', '1'))
+        _bucket.append(TokenBucket(send_rate() / workers))
+    return _bucket[0]
+
+def _release_content(release_id):
+    if release_id not in _content:
+        release = notifications.get(release_id)
+        if release is None:
+            return None
+        if len(_content) >= MAX_CACHED_RELEASES:
+            _content.clear()
+        _content[release_id] = {
+            name: release.get(name) for name in ('template', 'template_data', 'subject', 'html', 'feed_entries')
+        }
+    return _content[release_id]
@@ -1,24 +1,40 @@
 import json
-import boto3
 import os
-from datetime import datetime
+import uuid
 
-# Initialize AWS services
-dynamodb = boto3.resource('dynamodb')
-ses = boto3.client('ses')
+from common import clients, digests, feed, notifications
 
-subscriptions_table = dynamodb.Table(os.environ['SUBSCRIPTIONS_TABLE_NAME'])
-db_table = dynamodb.Table(os.environ['TABLE_NAME'])
+# SES templates registered by the stack: (environment variable, default name)
+TEMPLATES = {
+    'song_created': ('SONG_RELEASE_TEMPLATE', 'music-streaming-song-release'),
+    'album_created': ('ALBUM_RELEASE_TEMPLATE', 'music-streaming-album-release')
+}
+DEFAULT_TEMPLATE = ('RELEASE_TEMPLATE', 'music-streaming-release')
+
+FEED_CONTENT_TYPES = {
+    'song_created': 'SONG',
+    'album_created': 'ALBUM'
+}
 
 def handler(event, context):
     """
     Send email notifications to all subscribers of an artist when they release new content.
     This is triggered when a new song or album is created.
     
+    The emails are not sent here: the subscribers are queued in chunks for
+    notification_worker, and the release record tracks the progress
+    (see common/notifications.py). While digests are on
+    (NOTIFICATION_DIGEST_SECONDS), the event only joins the artist's open
+    digest, which a worker sends as one release when its window closes
+    (see common/digests.py). The release also goes into the subscribers'
+    feeds (see common/feed.py).
+    
     Event format:
     {
         "event_type": "song_created" or "album_created",
         "artist_id": "uuid",
+        "content_id": "uuid of the song or album",
+        "created_at": "its created_at",
         "content_title": "Song/Album title",
         "content_details": {...}
     }
@@ -37,7 +53,7 @@ def handler(event, context):
             }
         
         # Get artist info
-        artist_response = db_table.get_item(
+        artist_response = clients.table().get_item(
             Key={
                 'pk': f'ARTIST#{artist_id}',
                 'sk': 'METADATA'
@@ -55,96 +71,59 @@ def handler(event, context):
         artist = artist_response['Item']
         artist_name = artist.get('name', 'Unknown Artist')
         
-        # Get all subscriptions for this artist
-        subscriptions_response = subscriptions_table.query(
-            IndexName='artist-id-index',
-            KeyConditionExpression='artist_id = :artist_id',
-            ExpressionAttributeValues={
-                ':artist_id': artist_id
-            }
-        )
+        # The email is a registered SES template; only its data is built here
+        template, template_data = release_template(event_type, artist_name, content_title, event.get('content_details', {}))
+        feed_entry = release_feed_entry(event, artist_name)
         
-        subscriptions = subscriptions_response.get('Items', [])
+        # Lambda retries of this invocation keep the request ID, so they
+        # resume the same release (or digest entry) instead of starting another
+        release_id = event.get('release_id') or getattr(context, 'aws_request_id', None) or str(uuid.uuid4())
         
-        if not subscriptions:
+        # Coalesce releases of the same artist, e.g. an album and its tracks
+        window = digests.window_seconds()
+        if window:
+            digest = digests.add(artist_id, release_id, {
+                'event_type': event_type,
+                'content_title': content_title,
+                'template': template,
+                'template_data': template_data,
+                'feed_entry': feed_entry
+            }, window)
+            if digest is not None:
+                return {
+                    'statusCode': 202,
+                    'body': json.dumps({
+                        'message': 'Release added to the digest',
+                        'artist_name': artist_name,
+                        'artist_id': artist_id,
+                        'digest_id': digest['digest_id'],
+                        'releases': len(digest['events']),
+                        'window_seconds': window
+                    })
+                }
+        
+        # Queue the subscribers in chunks for the notification workers
+        release = notifications.start(release_id, artist_id, event_type, template, template_data, [feed_entry] if feed_entry else None)
+        release = notifications.plan(release, context)
+        
+        if release['status'] == notifications.COMPLETED and release['subscribers'] == 0:
             print(f"No subscriptions found for artist {artist_id}")
             return {
                 'statusCode': 200,
                 'body': json.dumps({
                     'message': 'No subscriptions to notify',
-                    'artist_id': artist_id
+                    'artist_id': artist_id,
+                    'release_id': release_id
                 })
             }
         
-        # Prepare email content
-        subject = f"New {event_type.replace('_', ' ').title()} from {artist_name}"
-        
-        if event_type == 'song_created':
-            email_body = generate_song_email(artist_name, content_title, event.get('content_details', {}))
-        elif event_type == 'album_created':
-            email_body = generate_album_email(artist_name, content_title, event.get('content_details', {}))
-        else:
-            email_body = f"Your favorite artist {artist_name} has released new content: {content_title}"
-        
-        # Send emails to all active subscribers
-        sent_count = 0
-        failed_count = 0
-        failed_emails = []
-        
-        for subscription in subscriptions:
-            # Check if notifications are enabled for this subscription
-            if not subscription.get('notification_enabled', True):
-                print(f"Notifications disabled for user {subscription['user_id']}")
-                continue
-            
-            # Get user email from the subscription record or fetch from Cognito
-            user_email = subscription.get('user_email')
-            
-            if not user_email:
-                print(f"No email found for user {subscription['user_id']}")
-                failed_count += 1
-                failed_emails.append(subscription['user_id'])
-                continue
-            
-            try:
-                # Send email via SES
-                ses.send_email(
-                    Source=os.environ.get('SES_SENDER_EMAIL', 'noreply@musicstreaming.local'),
-                    Destination={
-                        'ToAddresses': [user_email]
-                    },
-                    Message={
-                        'Subject': {
-                            'Data': subject,
-                            'Charset': 'UTF-8'
-                        },
-                        'Body': {
-                            'Html': {
-                                'Data': email_body,
-                                'Charset': 'UTF-8'
-                            }
-                        }
-                    }
-                )
-                sent_count += 1
-                print(f"Email sent to {user_email}")
-            except Exception as e:
-                print(f"Failed to send email to {user_email}: {str(e)}")
-                failed_count += 1
-                failed_emails.append(user_email)
-        
         return {
-            'statusCode': 200,
+            'statusCode': 202,
             'body': json.dumps({
-                'message': 'Notification sending completed',
-                'event_type': event_type,
-                'artist_id': artist_id,
+                'message': 'Notifications queued',
                 'artist_name': artist_name,
-                'total_subscribers': len(subscriptions),
-                'emails_sent': sent_count,
-                'emails_failed': failed_count,
-                'failed_recipients': failed_emails
-            })
+                **notifications.describe(release)
+            }, default=int)
         }
     
     except Exception as e:
@@ -158,87 +137,37 @@ def handler(event, context):
         }
 
 
-def generate_song_email(artist_name, song_title, details):
-    """Generate HTML email for new song notification"""
-    genre = details.get('genre', 'Music')
-    album_title = details.get('album_title', 'Unknown Album')
-    
-    html = f"""
-    <html>
-    <head>
-        <style>
-            body {{ font-family: Arial, sans-serif; color: #333; }}
-            .container {{ max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #ddd; border-radius: 5px; }}
-            .header {{ background-color: #6366f1; color: white; padding: 20px; text-align: center; border-radius: 5px 5px 0 0; }}
-            .content {{ padding: 20px; }}
-            .footer {{ background-color: #f3f4f6; padding: 10px; text-align: center; font-size: 12px; color: #666; }}
-            .cta-button {{ display: inline-block; background-color: #6366f1; color: white; padding: 10px 20px; text-decoration: none; border-radius: 5px; margin-top: 10px; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>🎵 New Music Release!</h1>
-            </div>
-            <div class="content">
-                <p>Hi there!</p>
-                <p><strong>{artist_name}</strong> has just released a new song that you might love:</p>
-                <h2>{song_title}</h2>
-                <p><strong>Album:</strong> {album_title}</p>
-                <p><strong>Genre:</strong> {genre}</p>
-                <p>Head over to our app to listen to this amazing new track!</p>
-                <a href="{os.environ.get('APP_URL', 'https://musicstreaming.local')}/songs" class="cta-button">Listen Now</a>
-            </div>
-            <div class="footer">
-                <p>You're receiving this email because you're subscribed to {artist_name}.</p>
-                <p><a href="{os.environ.get('APP_URL', 'https://musicstreaming.local')}/settings">Manage your notifications</a></p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-    return html
+def release_feed_entry(event, artist_name):
+    """The feed entry of the released song or album, or None for events without its ID."""
+    content_type = FEED_CONTENT_TYPES.get(event['event_type'])
+    if not content_type or not event.get('content_id') or not event.get('created_at'):
+        return None
+    return feed.entry(content_type, event['content_id'], event['content_title'], event['artist_id'], artist_name, event['created_at'])
 
 
-def generate_album_email(artist_name, album_title, details):
-    """Generate HTML email for new album notification"""
-    release_date = details.get('release_date', 'Now')
-    genre = details.get('genre', 'Music')
-    song_count = details.get('total_songs', 'Multiple')
+def release_template(event_type, artist_name, content_title, details):
+    """The SES template for a release and the data shared by all its recipients."""
+    data = {
+        'event_title': event_type.replace('_', ' ').title(),
+        'artist_name': artist_name,
+        'content_title': content_title,
+        'app_url': os.environ.get('APP_URL', 'https://musicstreaming.local')
+    }
     
-    html = f"""
-    <html>
-    <head>
-        <style>
-            body {{ font-family: Arial, sans-serif; color: #333; }}
-            .container {{ max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #ddd; border-radius: 5px; }}
-            .header {{ background-color: #6366f1; color: white; padding: 20px; text-align: center; border-radius: 5px 5px 0 0; }}
-            .content {{ padding: 20px; }}
-            .footer {{ background-color: #f3f4f6; padding: 10px; text-align: center; font-size: 12px; color: #666; }}
-            .cta-button {{ display: inline-block; background-color: #6366f1; color: white; padding: 10px 20px; text-decoration: none; border-radius: 5px; margin-top: 10px; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>💿 New Album Release!</h1>
-            </div>
-            <div class="content">
-                <p>Hi there!</p>
-                <p><strong>{artist_name}</strong> has just released a new album that you might love:</p>
-                <h2>{album_title}</h2>
-                <p><strong>Released:</strong> {release_date}</p>
-                <p><strong>Genre:</strong> {genre}</p>
-                <p><strong>Tracks:</strong> {song_count}</p>
-                <p>Explore the entire album on our platform!</p>
-                <a href="{os.environ.get('APP_URL', 'https://musicstreaming.local')}/albums" class="cta-button">Explore Album</a>
-            </div>
-            <div class="footer">
-                <p>You're receiving this email because you're subscribed to {artist_name}.</p>
-                <p><a href="{os.environ.get('APP_URL', 'https://musicstreaming.local')}/settings">Manage your notifications</a></p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-    return html
+    if event_type == 'song_created':
+        data.update({
+            'song_title': content_title,
+            'album_title': details.get('album_title', 'Unknown Album'),
+            'genre': details.get('genre', 'Music')
+        })
+    elif event_type == 'album_created':
+        data.update({
+            'album_title': content_title,
+            'release_date': details.get('release_date', 'Now'),
+            'genre': details.get('genre', 'Music'),
+            'song_count': details.get('total_songs', 'Multiple')
+        })
+    
+    variable, default_name = TEMPLATES.get(event_type, DEFAULT_TEMPLATE)
+    template = os.environ.get(variable, default_name)
+    return template, {name: str(value) for name, value in data.items()}
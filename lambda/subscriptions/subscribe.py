@@ -1,12 +1,9 @@
-import json
-import boto3
-import os
 from datetime import datetime
 
-# Initialize DynamoDB
-dynamodb = boto3.resource('dynamodb')
-subscriptions_table = dynamodb.Table(os.environ['SUBSCRIPTIONS_TABLE_NAME'])
-db_table = dynamodb.Table(os.environ['TABLE_NAME'])
+from common import clients, sharding
+from common.auth import get_claims
+from common.cache import get_metadata
+from common.responses import json_response
 
 def handler(event, context):
     """
@@ -17,46 +14,23 @@ def handler(event, context):
     """
     try:
         # Extract user ID and email from JWT claims (verified by Cognito)
-        claims = event.get('requestContext', {}).get('authorizer', {}).get('claims', {})
+        claims = get_claims(event)
         user_id = claims.get('sub')  # 'sub' is the user ID in Cognito tokens
         user_email = claims.get('email')
         
         # Get artist ID from path parameters
-        artist_id = event.get('pathParameters', {}).get('artistId')
+        artist_id = (event.get('pathParameters') or {}).get('artistId')
         
         if not user_id or not artist_id or not user_email:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'error': 'Missing artistId or authentication claims'
-                })
-            }
+            return json_response(400, {'error': 'Missing artistId or authentication claims'})
         
-        # Verify artist exists
-        artist_response = db_table.get_item(
-            Key={
-                'pk': f'ARTIST#{artist_id}',
-                'sk': 'METADATA'
-            }
-        )
+        subscriptions_table = clients.subscriptions_table()
         
-        if 'Item' not in artist_response:
-            return {
-                'statusCode': 404,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'error': 'Artist not found'
-                })
-            }
+        # Verify artist exists (popular artists come from the METADATA cache)
+        artist = get_metadata('ARTIST', artist_id)
         
-        artist = artist_response['Item']
+        if artist is None:
+            return json_response(404, {'error': 'Artist not found'})
         
         # Check if already subscribed
         subscription_response = subscriptions_table.get_item(
@@ -67,19 +41,12 @@ def handler(event, context):
         )
         
         if 'Item' in subscription_response:
-            return {
-                'statusCode': 409,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'error': 'User is already subscribed to this artist'
-                })
-            }
+            return json_response(409, {'error': 'User is already subscribed to this artist'})
         
-        # Create subscription
+        # Create subscription. Its artist_shard spreads the artist's subscriptions
+        # over the partitions of artist-shard-index and notify-artist-index.
         subscription_date = datetime.utcnow().isoformat()
+        artist_shard = sharding.subscriber_shard(artist_id, user_id, sharding.subscriber_shard_count(artist_id))
         subscriptions_table.put_item(
             Item={
                 'user_id': user_id,
@@ -87,35 +54,23 @@ def handler(event, context):
                 'artist_name': artist.get('name', ''),
                 'user_email': user_email,
                 'subscription_date': subscription_date,
-                'notification_enabled': True
+                'notification_enabled': True,
+                'artist_shard': artist_shard,
+                'notify_artist': artist_shard  # Sparse key of notify-artist-index, removed while muted
             }
         )
         
-        return {
-            'statusCode': 201,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Successfully subscribed to artist',
-                'user_id': user_id,
-                'artist_id': artist_id,
-                'artist_name': artist.get('name', ''),
-                'subscription_date': subscription_date
-            })
-        }
+        return json_response(201, {
+            'message': 'Successfully subscribed to artist',
+            'user_id': user_id,
+            'artist_id': artist_id,
+            'artist_name': artist.get('name', ''),
+            'subscription_date': subscription_date
+        })
     
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': 'Error creating subscription',
-                'message': str(e)
-            })
-        }
+        return json_response(500, {
+            'error': 'Error creating subscription',
+            'message': str(e)
+        })
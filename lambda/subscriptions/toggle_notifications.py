@@ -1,10 +1,6 @@
-import json
-import boto3
-import os
-
-# Initialize DynamoDB
-dynamodb = boto3.resource('dynamodb')
-subscriptions_table = dynamodb.Table(os.environ['SUBSCRIPTIONS_TABLE_NAME'])
+from common import clients, sharding
+from common.auth import get_user_id
+from common.responses import json_response, parse_json_body
 
 def handler(event, context):
     """
@@ -15,55 +11,26 @@ def handler(event, context):
     """
     try:
         # Extract user ID from JWT claims
-        claims = event.get('requestContext', {}).get('authorizer', {}).get('claims', {})
-        user_id = claims.get('sub')  # 'sub' is the user ID in Cognito tokens
+        user_id = get_user_id(event)
         
         # Get artist ID from path parameters
-        artist_id = event.get('pathParameters', {}).get('artistId')
+        artist_id = (event.get('pathParameters') or {}).get('artistId')
         
         if not user_id or not artist_id:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'error': 'Missing artistId or authentication claims'
-                })
-            }
+            return json_response(400, {'error': 'Missing artistId or authentication claims'})
         
         # Get notification preference from request body
         try:
-            if isinstance(event.get('body'), str):
-                body = json.loads(event['body'])
-            else:
-                body = event.get('body', {})
-        except:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'error': 'Invalid request body'
-                })
-            }
+            body = parse_json_body(event)
+        except ValueError:
+            return json_response(400, {'error': 'Invalid request body'})
         
         notification_enabled = body.get('notification_enabled')
         
         if notification_enabled is None:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'error': 'Missing notification_enabled field'
-                })
-            }
+            return json_response(400, {'error': 'Missing notification_enabled field'})
+        
+        subscriptions_table = clients.subscriptions_table()
         
         # Check if subscription exists
         subscription_response = subscriptions_table.get_item(
@@ -74,54 +41,49 @@ def handler(event, context):
         )
         
         if 'Item' not in subscription_response:
-            return {
-                'statusCode': 404,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'error': 'Subscription not found'
-                })
-            }
+            return json_response(404, {'error': 'Subscription not found'})
         
-        # Update notification preference
-        subscriptions_table.update_item(
-            Key={
-                'user_id': user_id,
-                'artist_id': artist_id
-            },
-            UpdateExpression='SET notification_enabled = :notification_enabled',
-            ExpressionAttributeValues={
-                ':notification_enabled': bool(notification_enabled)
-            }
-        )
+        # Update notification preference. notify_artist (the subscription's
+        # artist_shard) puts the subscription in the sparse notify-artist-index
+        # that release notifications read.
+        if notification_enabled and subscription_response['Item'].get('user_email'):
+            artist_shard = subscription_response['Item'].get('artist_shard') or sharding.subscriber_shard(
+                artist_id, user_id, sharding.subscriber_shard_count(artist_id)
+            )
+            subscriptions_table.update_item(
+                Key={
+                    'user_id': user_id,
+                    'artist_id': artist_id
+                },
+                UpdateExpression='SET notification_enabled = :notification_enabled, artist_shard = :artist_shard, notify_artist = :artist_shard',
+                ExpressionAttributeValues={
+                    ':notification_enabled': True,
+                    ':artist_shard': artist_shard
+                }
+            )
+        else:
+            subscriptions_table.update_item(
+                Key={
+                    'user_id': user_id,
+                    'artist_id': artist_id
+                },
+                UpdateExpression='SET notification_enabled = :notification_enabled REMOVE notify_artist',
+                ExpressionAttributeValues={
+                    ':notification_enabled': bool(notification_enabled)
+                }
+            )
         
         status = "enabled" if notification_enabled else "disabled"
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': f'Notifications {status}',
-                'user_id': user_id,
-                'artist_id': artist_id,
-                'notification_enabled': bool(notification_enabled)
-            })
-        }
+        return json_response(200, {
+            'message': f'Notifications {status}',
+            'user_id': user_id,
+            'artist_id': artist_id,
+            'notification_enabled': bool(notification_enabled)
+        })
     
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': 'Error updating notification preferences',
-                'message': str(e)
-            })
-        }
+        return json_response(500, {
+            'error': 'Error updating notification preferences',
+            'message': str(e)
+        })
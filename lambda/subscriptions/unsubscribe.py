@@ -1,10 +1,6 @@
-import json
-import boto3
-import os
-
-# Initialize DynamoDB
-dynamodb = boto3.resource('dynamodb')
-subscriptions_table = dynamodb.Table(os.environ['SUBSCRIPTIONS_TABLE_NAME'])
+from common import clients, feed
+from common.auth import get_user_id
+from common.responses import json_response
 
 def handler(event, context):
     """
@@ -14,23 +10,15 @@ def handler(event, context):
     """
     try:
         # Extract user ID from JWT claims
-        claims = event.get('requestContext', {}).get('authorizer', {}).get('claims', {})
-        user_id = claims.get('sub')  # 'sub' is the user ID in Cognito tokens
+        user_id = get_user_id(event)
         
         # Get artist ID from path parameters
-        artist_id = event.get('pathParameters', {}).get('artistId')
+        artist_id = (event.get('pathParameters') or {}).get('artistId')
         
         if not user_id or not artist_id:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'error': 'Missing artistId or authentication claims'
-                })
-            }
+            return json_response(400, {'error': 'Missing artistId or authentication claims'})
+        
+        subscriptions_table = clients.subscriptions_table()
         
         # Check if subscription exists
         subscription_response = subscriptions_table.get_item(
@@ -41,16 +29,7 @@ def handler(event, context):
         )
         
         if 'Item' not in subscription_response:
-            return {
-                'statusCode': 404,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'error': 'Subscription not found'
-                })
-            }
+            return json_response(404, {'error': 'Subscription not found'})
         
         # Delete subscription
         subscriptions_table.delete_item(
@@ -60,29 +39,21 @@ def handler(event, context):
             }
         )
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'message': 'Successfully unsubscribed from artist',
-                'user_id': user_id,
-                'artist_id': artist_id
-            })
-        }
+        # Pushed feed entries of the artist are skipped on read either way
+        try:
+            feed.remove_artist(user_id, artist_id)
+        except Exception as e:
+            print(f"Warning: Could not remove artist {artist_id} from the feed of {user_id}: {str(e)}")
+        
+        return json_response(200, {
+            'message': 'Successfully unsubscribed from artist',
+            'user_id': user_id,
+            'artist_id': artist_id
+        })
     
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': 'Error deleting subscription',
-                'message': str(e)
-            })
-        }
+        return json_response(500, {
+            'error': 'Error deleting subscription',
+            'message': str(e)
+        })
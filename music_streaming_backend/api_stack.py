@@ -1,11 +1,53 @@
 from aws_cdk import (
     Stack,
+    Duration,
     aws_apigateway as apigateway,
     aws_cognito as cognito,
     aws_lambda as lambda_,
+    aws_ssm as ssm,
 )
 from constructs import Construct
 
+# Stage cache for the anonymous catalog reads: TTL per GET route, in seconds.
+# Lists change with every write and expire quickly. Single items are
+# refreshed after writes (common/stage_cache.py) and live longer;
+# artists and albums carry counters maintained from the table stream, so
+# they expire sooner than songs.
+CACHE_TTLS = {
+    "/songs": 30,
+    "/songs/{songId}": 300,
+    "/albums": 30,
+    "/albums/{albumId}": 60,
+    "/albums/{albumId}/songs": 60,
+    "/artists": 30,
+    "/artists/{artistId}": 60,
+    "/artists/{artistId}/albums": 60,
+    "/artists/{artistId}/songs": 60
+}
+
+# Query parameters read by the catalog handlers. With the path parameters
+# they make up the cache key; other parameters and headers are ignored.
+CACHE_KEY_QUERY_PARAMETERS = ("limit", "last_key", "fields", "view")
+
+# Headers in the cache key. A conditional GET may be answered with an empty
+# 304, which must only be replayed to clients holding the same ETag.
+CACHE_KEY_HEADERS = ("If-None-Match",)
+
+# SSM parameter holding the stage URL, for the handlers that refresh cache
+# entries (the Lambda stack cannot reference the API directly)
+API_URL_PARAMETER_NAME = "/music-streaming/api-url"
+
+def cache_request_parameters(*path_parameters):
+    """Method request parameters for a cached route."""
+    parameters = {f"method.request.path.{name}": True for name in path_parameters}
+    parameters.update({f"method.request.querystring.{name}": False for name in CACHE_KEY_QUERY_PARAMETERS})
+    parameters.update({f"method.request.header.{name}": False for name in CACHE_KEY_HEADERS})
+    return parameters
+
+def cache_key_parameters(*path_parameters):
+    """Integration cache key parameters for a cached route."""
+    return list(cache_request_parameters(*path_parameters))
+
 class ApiStack(Stack):
 
     def __init__(
@@ -30,10 +72,12 @@ class ApiStack(Stack):
             delete_artist_handler: lambda_.Function,
             get_albums_by_artist_handler: lambda_.Function,
             get_songs_by_artist_handler: lambda_.Function,
+            get_job_handler: lambda_.Function,
             subscribe_handler: lambda_.Function,
             unsubscribe_handler: lambda_.Function,
             get_user_subscriptions_handler: lambda_.Function,
             toggle_notifications_handler: lambda_.Function,
+            get_feed_handler: lambda_.Function,
             login_handler: lambda_.Function,
             refresh_handler: lambda_.Function,
             register_handler: lambda_.Function,
@@ -54,10 +98,22 @@ class ApiStack(Stack):
             "MusicStreamingAPI",
             rest_api_name="Music Streaming API",
             description="REST API for music streaming CRUD operations",
+            deploy_options=apigateway.StageOptions(
+                cache_cluster_enabled=True,
+                cache_cluster_size="0.5",
+                method_options={
+                    f"{path}/GET": apigateway.MethodDeploymentOptions(
+                        caching_enabled=True,
+                        cache_ttl=Duration.seconds(ttl),
+                        cache_data_encrypted=True
+                    )
+                    for path, ttl in CACHE_TTLS.items()
+                }
+            ),
             default_cors_preflight_options=apigateway.CorsOptions(
                 allow_methods=apigateway.Cors.ALL_METHODS,
                 allow_origins=apigateway.Cors.ALL_ORIGINS,
-                allow_headers=apigateway.Cors.DEFAULT_HEADERS + ["Authorization"],
+                allow_headers=apigateway.Cors.DEFAULT_HEADERS + ["Authorization", "If-None-Match"],
                 allow_credentials=True
             )
         )
@@ -408,7 +464,8 @@ class ApiStack(Stack):
         # Songs endpoints
         self.songs_resource = self.api.root.add_resource("songs")
         
-        self.songs_resource.add_method("GET", apigateway.LambdaIntegration(get_songs_handler),
+        self.songs_resource.add_method("GET", apigateway.LambdaIntegration(get_songs_handler, cache_key_parameters=cache_key_parameters()),
+            request_parameters=cache_request_parameters(),
             method_responses=[apigateway.MethodResponse(status_code="200", response_parameters={"method.response.header.Access-Control-Allow-Origin": True})])
         self.songs_resource.add_method(
             "POST", 
@@ -509,7 +566,8 @@ class ApiStack(Stack):
         
         self.song_resource = self.songs_resource.add_resource("{songId}")
         
-        self.song_resource.add_method("GET", apigateway.LambdaIntegration(get_song_handler),
+        self.song_resource.add_method("GET", apigateway.LambdaIntegration(get_song_handler, cache_key_parameters=cache_key_parameters("songId")),
+            request_parameters=cache_request_parameters("songId"),
             method_responses=[apigateway.MethodResponse(status_code="200", response_parameters={"method.response.header.Access-Control-Allow-Origin": True})])
         
         self.song_resource.add_method("PUT", apigateway.LambdaIntegration(update_song_handler),
@@ -525,7 +583,8 @@ class ApiStack(Stack):
         # Albums endpoints
         self.albums_resource = self.api.root.add_resource("albums")
         
-        self.albums_resource.add_method("GET", apigateway.LambdaIntegration(get_albums_handler),
+        self.albums_resource.add_method("GET", apigateway.LambdaIntegration(get_albums_handler, cache_key_parameters=cache_key_parameters()),
+            request_parameters=cache_request_parameters(),
             method_responses=[apigateway.MethodResponse(status_code="200", response_parameters={"method.response.header.Access-Control-Allow-Origin": True})])
         
         self.albums_resource.add_method("POST", apigateway.LambdaIntegration(create_album_handler),
@@ -535,7 +594,8 @@ class ApiStack(Stack):
         
         self.album_resource = self.albums_resource.add_resource("{albumId}")
         
-        self.album_resource.add_method("GET", apigateway.LambdaIntegration(get_album_handler),
+        self.album_resource.add_method("GET", apigateway.LambdaIntegration(get_album_handler, cache_key_parameters=cache_key_parameters("albumId")),
+            request_parameters=cache_request_parameters("albumId"),
             method_responses=[apigateway.MethodResponse(status_code="200", response_parameters={"method.response.header.Access-Control-Allow-Origin": True})])
         
         self.album_resource.add_method("PUT", apigateway.LambdaIntegration(update_album_handler),
@@ -546,18 +606,20 @@ class ApiStack(Stack):
         self.album_resource.add_method("DELETE", apigateway.LambdaIntegration(delete_album_handler),
             authorization_type=apigateway.AuthorizationType.COGNITO,
             authorizer=self.cognito_authorizer,
-            method_responses=[apigateway.MethodResponse(status_code="204", response_parameters={"method.response.header.Access-Control-Allow-Origin": True})])
+            method_responses=[apigateway.MethodResponse(status_code="202", response_parameters={"method.response.header.Access-Control-Allow-Origin": True})])
         
         # GET /albums/{albumId}/songs - Get songs in album
         self.album_songs_resource = self.album_resource.add_resource("songs")
         
-        self.album_songs_resource.add_method("GET", apigateway.LambdaIntegration(get_songs_by_album_handler),
+        self.album_songs_resource.add_method("GET", apigateway.LambdaIntegration(get_songs_by_album_handler, cache_key_parameters=cache_key_parameters("albumId")),
+            request_parameters=cache_request_parameters("albumId"),
             method_responses=[apigateway.MethodResponse(status_code="200", response_parameters={"method.response.header.Access-Control-Allow-Origin": True})])
         
         # Artists endpoints
         self.artists_resource = self.api.root.add_resource("artists")
         
-        self.artists_resource.add_method("GET", apigateway.LambdaIntegration(get_artists_handler),
+        self.artists_resource.add_method("GET", apigateway.LambdaIntegration(get_artists_handler, cache_key_parameters=cache_key_parameters()),
+            request_parameters=cache_request_parameters(),
             method_responses=[apigateway.MethodResponse(status_code="200", response_parameters={"method.response.header.Access-Control-Allow-Origin": True})])
         
         self.artists_resource.add_method("POST", apigateway.LambdaIntegration(create_artist_handler),
@@ -567,7 +629,8 @@ class ApiStack(Stack):
         
         self.artist_resource = self.artists_resource.add_resource("{artistId}")
         
-        self.artist_resource.add_method("GET", apigateway.LambdaIntegration(get_artist_handler),
+        self.artist_resource.add_method("GET", apigateway.LambdaIntegration(get_artist_handler, cache_key_parameters=cache_key_parameters("artistId")),
+            request_parameters=cache_request_parameters("artistId"),
             method_responses=[apigateway.MethodResponse(status_code="200", response_parameters={"method.response.header.Access-Control-Allow-Origin": True})])
         
         self.artist_resource.add_method("PUT", apigateway.LambdaIntegration(update_artist_handler),
@@ -578,18 +641,31 @@ class ApiStack(Stack):
         self.artist_resource.add_method("DELETE", apigateway.LambdaIntegration(delete_artist_handler),
             authorization_type=apigateway.AuthorizationType.COGNITO,
             authorizer=self.cognito_authorizer,
-            method_responses=[apigateway.MethodResponse(status_code="204", response_parameters={"method.response.header.Access-Control-Allow-Origin": True})])
+            method_responses=[apigateway.MethodResponse(status_code="202", response_parameters={"method.response.header.Access-Control-Allow-Origin": True})])
         
         # GET /artists/{artistId}/albums - Get albums by artist
         self.artist_albums_resource = self.artist_resource.add_resource("albums")
         
-        self.artist_albums_resource.add_method("GET", apigateway.LambdaIntegration(get_albums_by_artist_handler),
+        self.artist_albums_resource.add_method("GET", apigateway.LambdaIntegration(get_albums_by_artist_handler, cache_key_parameters=cache_key_parameters("artistId")),
+            request_parameters=cache_request_parameters("artistId"),
             method_responses=[apigateway.MethodResponse(status_code="200", response_parameters={"method.response.header.Access-Control-Allow-Origin": True})])
         
         # GET /artists/{artistId}/songs - Get songs by artist
         self.artist_songs_resource = self.artist_resource.add_resource("songs")
         
-        self.artist_songs_resource.add_method("GET", apigateway.LambdaIntegration(get_songs_by_artist_handler),
+        self.artist_songs_resource.add_method("GET", apigateway.LambdaIntegration(get_songs_by_artist_handler, cache_key_parameters=cache_key_parameters("artistId")),
+            request_parameters=cache_request_parameters("artistId"),
+            method_responses=[apigateway.MethodResponse(status_code="200", response_parameters={"method.response.header.Access-Control-Allow-Origin": True})])
+        
+        # Jobs endpoints (background album and artist deletions)
+        self.jobs_resource = self.api.root.add_resource("jobs")
+        
+        # GET /jobs/{jobId} - Job status and progress
+        self.job_resource = self.jobs_resource.add_resource("{jobId}")
+        
+        self.job_resource.add_method("GET", apigateway.LambdaIntegration(get_job_handler),
+            authorization_type=apigateway.AuthorizationType.COGNITO,
+            authorizer=self.cognito_authorizer,
             method_responses=[apigateway.MethodResponse(status_code="200", response_parameters={"method.response.header.Access-Control-Allow-Origin": True})])
         
         # Subscriptions endpoints (user ID extracted from JWT)
@@ -622,4 +698,19 @@ class ApiStack(Stack):
             authorization_type=apigateway.AuthorizationType.COGNITO,
             authorizer=self.cognito_authorizer,
             method_responses=[apigateway.MethodResponse(status_code="200", response_parameters={"method.response.header.Access-Control-Allow-Origin": True})])
-
+        
+        # GET /feed - New releases of the artists the user follows (user ID extracted from JWT)
+        self.feed_resource = self.api.root.add_resource("feed")
+        
+        self.feed_resource.add_method("GET", apigateway.LambdaIntegration(get_feed_handler),
+            authorization_type=apigateway.AuthorizationType.COGNITO,
+            authorizer=self.cognito_authorizer,
+            method_responses=[apigateway.MethodResponse(status_code="200", response_parameters={"method.response.header.Access-Control-Allow-Origin": True})])
+        
+        # Stage URL for the handlers that refresh cache entries after writes
+        self.api_url_parameter = ssm.StringParameter(
+            self,
+            "ApiUrlParameter",
+            parameter_name=API_URL_PARAMETER_NAME,
+            string_value=self.api.url
+        )
@@ -4,16 +4,87 @@ from aws_cdk import (
 )
 from constructs import Construct
 
+# CloudFormation accepts one GSI change per table update, so the catalog
+# indexes are rolled out to an existing table one deploy at a time:
+#   cdk deploy -c catalog_index_stage=<stage>
+#   1  add artist-songs-index
+#   2  add artist-albums-index
+#      then run maintenance/backfill_index_keys to completion
+#   3  read the artist's songs and albums from them (SPARSE_ARTIST_INDEXES)
+#   4  add entity-shard-index (entity_shard is set by the stage 2 backfill)
+#      and read the catalog listings from it (SHARDED_LISTINGS); the table
+#      stack deploys first, so the index is active before the readers switch
+# Without the context value, the last stage is deployed (e.g. for a new table).
+CATALOG_INDEX_STAGES = 4
+SPARSE_ARTIST_INDEXES_STAGE = 3
+SHARDED_LISTINGS_STAGE = 4
+
+# The subscriptions table's indexes are rolled out the same way:
+#   cdk deploy -c subscriptions_index_stage=<stage>
+#   1  add notify-artist-index (subscribe and toggle_notifications write
+#      notify_artist and artist_shard from this stage on)
+#      then run maintenance/backfill_index_keys with {"table": "subscriptions"}
+#   2  plan release audiences from it (NOTIFY_ARTIST_INDEX); releases that
+#      are already planning finish on artist-id-index
+#   3  add artist-shard-index (artist_shard is set by the stage 1 backfill)
+#      and read an artist's subscriptions from it (SHARDED_SUBSCRIPTIONS)
+# Until then readers query artist-id-index.
+SUBSCRIPTIONS_INDEX_STAGES = 3
+NOTIFY_ARTIST_INDEX_STAGE = 2
+SHARDED_SUBSCRIPTIONS_STAGE = 3
+
+
+def catalog_index_stage(scope: Construct) -> int:
+    stage = scope.node.try_get_context("catalog_index_stage")
+    return CATALOG_INDEX_STAGES if stage is None else int(stage)
+
+
+def subscriptions_index_stage(scope: Construct) -> int:
+    stage = scope.node.try_get_context("subscriptions_index_stage")
+    return SUBSCRIPTIONS_INDEX_STAGES if stage is None else int(stage)
+
+
 class DatabaseStack(Stack):
 
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        stage = catalog_index_stage(self)
+
+        # Sparse discography indexes: artist_songs is only set on songs and
+        # artist_albums only on albums, so each partition holds one entity type
+        sparse_artist_indexes = [
+            dynamodb.GlobalSecondaryIndexPropsV2(
+                index_name="artist-songs-index",
+                partition_key=dynamodb.Attribute(name="artist_songs", type=dynamodb.AttributeType.STRING),
+                sort_key=dynamodb.Attribute(name="created_at", type=dynamodb.AttributeType.STRING)
+            ),
+            dynamodb.GlobalSecondaryIndexPropsV2(
+                index_name="artist-albums-index",
+                partition_key=dynamodb.Attribute(name="artist_albums", type=dynamodb.AttributeType.STRING),
+                sort_key=dynamodb.Attribute(name="created_at", type=dynamodb.AttributeType.STRING)
+            )
+        ][:stage]
+
+        # Catalog listings: entity_shard spreads each entity type over
+        # several partitions (SONG#0..SONG#15) so no single one runs hot
+        entity_shard_index = [
+            dynamodb.GlobalSecondaryIndexPropsV2(
+                index_name="entity-shard-index",
+                partition_key=dynamodb.Attribute(name="entity_shard", type=dynamodb.AttributeType.STRING),
+                sort_key=dynamodb.Attribute(name="created_at", type=dynamodb.AttributeType.STRING)
+            )
+        ] if stage >= SHARDED_LISTINGS_STAGE else []
+
         self.db = dynamodb.TableV2(
             self,
             id="music-streaming-db-2025",
             partition_key=dynamodb.Attribute(name="pk", type=dynamodb.AttributeType.STRING),
             sort_key=dynamodb.Attribute(name="sk", type=dynamodb.AttributeType.STRING),
+            # Finished job records and counter ledger entries expire on their own
+            time_to_live_attribute="expires_at",
+            # Stream consumers maintain counters and denormalized copies
+            dynamo_stream=dynamodb.StreamViewType.NEW_AND_OLD_IMAGES,
             global_secondary_indexes=[
                 dynamodb.GlobalSecondaryIndexPropsV2(
                     index_name="artist-index",
@@ -30,14 +101,44 @@ class DatabaseStack(Stack):
                     partition_key=dynamodb.Attribute(name="artist_id", type=dynamodb.AttributeType.STRING),
                     sort_key=dynamodb.Attribute(name="created_at", type=dynamodb.AttributeType.STRING)
                 ),
+                # Superseded by entity-shard-index: remove it in a later deploy, once
+                # every deployment is at the last stage (one index change per table update)
                 dynamodb.GlobalSecondaryIndexPropsV2(
                     index_name="entity-type-index",
                     partition_key=dynamodb.Attribute(name="entity_type", type=dynamodb.AttributeType.STRING),
                     sort_key=dynamodb.Attribute(name="created_at", type=dynamodb.AttributeType.STRING)
-                )
+                ),
+                *entity_shard_index,
+                *sparse_artist_indexes
             ]
         )
 
+        subscriptions_stage = subscriptions_index_stage(self)
+
+        # Sparse notification audience: notify_artist (the artist_shard) is only
+        # set while notifications are on, and only the address is projected
+        notify_artist_index = [
+            dynamodb.GlobalSecondaryIndexPropsV2(
+                index_name="notify-artist-index",
+                partition_key=dynamodb.Attribute(name="notify_artist", type=dynamodb.AttributeType.STRING),
+                sort_key=dynamodb.Attribute(name="subscription_date", type=dynamodb.AttributeType.STRING),
+                projection_type=dynamodb.ProjectionType.INCLUDE,
+                non_key_attributes=["user_email"]
+            )
+        ]
+
+        # Subscriptions of an artist, write-sharded by artist_shard
+        # (<artist_id>#<shard>) so that subscribe bursts spread over partitions
+        artist_shard_index = [
+            dynamodb.GlobalSecondaryIndexPropsV2(
+                index_name="artist-shard-index",
+                partition_key=dynamodb.Attribute(name="artist_shard", type=dynamodb.AttributeType.STRING),
+                sort_key=dynamodb.Attribute(name="subscription_date", type=dynamodb.AttributeType.STRING),
+                projection_type=dynamodb.ProjectionType.INCLUDE,
+                non_key_attributes=["artist_name"]
+            )
+        ] if subscriptions_stage >= SHARDED_SUBSCRIPTIONS_STAGE else []
+
         # Subscriptions table for user subscriptions to artists
         self.subscriptions_table = dynamodb.TableV2(
             self,
@@ -45,10 +146,14 @@ class DatabaseStack(Stack):
             partition_key=dynamodb.Attribute(name="user_id", type=dynamodb.AttributeType.STRING),
             sort_key=dynamodb.Attribute(name="artist_id", type=dynamodb.AttributeType.STRING),
             global_secondary_indexes=[
+                # Superseded by artist-shard-index and notify-artist-index: remove it in
+                # a later deploy, once every deployment is at the last stage
                 dynamodb.GlobalSecondaryIndexPropsV2(
                     index_name="artist-id-index",
                     partition_key=dynamodb.Attribute(name="artist_id", type=dynamodb.AttributeType.STRING),
                     sort_key=dynamodb.Attribute(name="subscription_date", type=dynamodb.AttributeType.STRING)
-                )
+                ),
+                *artist_shard_index,
+                *notify_artist_index[:subscriptions_stage]
             ]
         )
\ No newline at end of file
@@ -5,15 +5,68 @@ from aws_cdk import (
     aws_dynamodb as dynamodb,
     aws_s3 as s3,
     aws_cognito as cognito,
-    aws_iam as iam
+    aws_iam as iam,
+    aws_secretsmanager as secretsmanager,
+    aws_sqs as sqs,
+    aws_ses as ses,
+    aws_lambda_event_sources as lambda_event_sources
 )
 from constructs import Construct
 
+from music_streaming_backend.api_stack import API_URL_PARAMETER_NAME
+from music_streaming_backend.database_stack import (
+    NOTIFY_ARTIST_INDEX_STAGE,
+    SHARDED_LISTINGS_STAGE,
+    SHARDED_SUBSCRIPTIONS_STAGE,
+    SPARSE_ARTIST_INDEXES_STAGE,
+    catalog_index_stage,
+    subscriptions_index_stage
+)
+
 class LambdaStack(Stack):
 
     def __init__(self, scope: Construct, construct_id: str, db: dynamodb.TableV2, subscriptions_table: dynamodb.TableV2, music_bucket: s3.Bucket, user_pool: cognito.UserPool, user_pool_client: cognito.UserPoolClient, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
         
+        # Shared handler runtime (lazy AWS clients, response, pagination and auth helpers)
+        self.shared_layer = lambda_.LayerVersion(
+            self,
+            "SharedRuntimeLayer",
+            code=lambda_.Code.from_asset("lambda/layer"),
+            compatible_runtimes=[lambda_.Runtime.PYTHON_3_11],
+            description="Shared runtime for the music streaming handlers"
+        )
+        
+        # Signing key for the opaque pagination cursors returned by list endpoints
+        self.cursor_secret = secretsmanager.Secret(
+            self,
+            "CursorSigningSecret",
+            description="HMAC key for pagination cursors",
+            generate_secret_string=secretsmanager.SecretStringGenerator(
+                password_length=64,
+                exclude_punctuation=True
+            )
+        )
+        
+        # Background jobs (album and artist deletions). Messages that keep failing
+        # move to the dead-letter queue; the visibility timeout is six times the
+        # worker timeout, as recommended for SQS event sources.
+        self.jobs_dead_letter_queue = sqs.Queue(
+            self,
+            "JobsDeadLetterQueue",
+            retention_period=Duration.days(14)
+        )
+        
+        self.jobs_queue = sqs.Queue(
+            self,
+            "JobsQueue",
+            visibility_timeout=Duration.minutes(30),
+            dead_letter_queue=sqs.DeadLetterQueue(
+                max_receive_count=5,
+                queue=self.jobs_dead_letter_queue
+            )
+        )
+        
         # Create Song Handler
         self.create_song_handler = lambda_.Function(
             self,
@@ -21,6 +74,7 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="create.handler",
             code=lambda_.Code.from_asset("lambda/songs"),
+            layers=[self.shared_layer],
             environment={
                 "TABLE_NAME": db.table_name,
                 "BUCKET_NAME": music_bucket.bucket_name
@@ -30,6 +84,7 @@ class LambdaStack(Stack):
         db.grant_read_write_data(self.create_song_handler)
         music_bucket.grant_put(self.create_song_handler)
         music_bucket.grant_read(self.create_song_handler)
+        music_bucket.grant_delete(self.create_song_handler)
         
         # Login Handler
         self.login_handler = lambda_.Function(
@@ -91,8 +146,10 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="get_songs.handler",
             code=lambda_.Code.from_asset("lambda/songs"),
+            layers=[self.shared_layer],
             environment={
-                "TABLE_NAME": db.table_name
+                "TABLE_NAME": db.table_name,
+                "RAW_ITEM_RENDERING": "true"
             }
         )
         
@@ -105,6 +162,7 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="get_songs_by_album.handler",
             code=lambda_.Code.from_asset("lambda/songs"),
+            layers=[self.shared_layer],
             environment={
                 "TABLE_NAME": db.table_name
             }
@@ -119,6 +177,7 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="get_song.handler",
             code=lambda_.Code.from_asset("lambda/songs"),
+            layers=[self.shared_layer],
             environment={
                 "TABLE_NAME": db.table_name
             }
@@ -133,6 +192,7 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="update.handler",
             code=lambda_.Code.from_asset("lambda/songs"),
+            layers=[self.shared_layer],
             environment={
                 "TABLE_NAME": db.table_name
             }
@@ -147,6 +207,7 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="delete.handler",
             code=lambda_.Code.from_asset("lambda/songs"),
+            layers=[self.shared_layer],
             environment={
                 "TABLE_NAME": db.table_name,
                 "BUCKET_NAME": music_bucket.bucket_name
@@ -163,6 +224,7 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="create.handler",
             code=lambda_.Code.from_asset("lambda/albums"),
+            layers=[self.shared_layer],
             environment={
                 "TABLE_NAME": db.table_name,
                 "BUCKET_NAME": music_bucket.bucket_name
@@ -177,8 +239,10 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="get_albums.handler",
             code=lambda_.Code.from_asset("lambda/albums"),
+            layers=[self.shared_layer],
             environment={
-                "TABLE_NAME": db.table_name
+                "TABLE_NAME": db.table_name,
+                "RAW_ITEM_RENDERING": "true"
             }
         )
         
@@ -191,6 +255,7 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="get_album.handler",
             code=lambda_.Code.from_asset("lambda/albums"),
+            layers=[self.shared_layer],
             environment={
                 "TABLE_NAME": db.table_name
             }
@@ -205,6 +270,7 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="get_album_songs.handler",
             code=lambda_.Code.from_asset("lambda/albums"),
+            layers=[self.shared_layer],
             environment={
                 "TABLE_NAME": db.table_name
             }
@@ -219,6 +285,7 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="update.handler",
             code=lambda_.Code.from_asset("lambda/albums"),
+            layers=[self.shared_layer],
             environment={
                 "TABLE_NAME": db.table_name
             }
@@ -233,12 +300,15 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="delete.handler",
             code=lambda_.Code.from_asset("lambda/albums"),
+            layers=[self.shared_layer],
             environment={
-                "TABLE_NAME": db.table_name
+                "TABLE_NAME": db.table_name,
+                "JOBS_QUEUE_URL": self.jobs_queue.queue_url
             }
         )
         
         db.grant_read_write_data(self.delete_album_handler)
+        self.jobs_queue.grant_send_messages(self.delete_album_handler)
         
         # Create Artist Handler
         self.create_artist_handler = lambda_.Function(
@@ -247,6 +317,7 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="create.handler",
             code=lambda_.Code.from_asset("lambda/artists"),
+            layers=[self.shared_layer],
             environment={
                 "TABLE_NAME": db.table_name
             }
@@ -261,8 +332,10 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="get_artists.handler",
             code=lambda_.Code.from_asset("lambda/artists"),
+            layers=[self.shared_layer],
             environment={
-                "TABLE_NAME": db.table_name
+                "TABLE_NAME": db.table_name,
+                "RAW_ITEM_RENDERING": "true"
             }
         )
         
@@ -275,6 +348,7 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="get_artist.handler",
             code=lambda_.Code.from_asset("lambda/artists"),
+            layers=[self.shared_layer],
             environment={
                 "TABLE_NAME": db.table_name
             }
@@ -289,6 +363,7 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="update.handler",
             code=lambda_.Code.from_asset("lambda/artists"),
+            layers=[self.shared_layer],
             environment={
                 "TABLE_NAME": db.table_name
             }
@@ -303,12 +378,54 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="delete.handler",
             code=lambda_.Code.from_asset("lambda/artists"),
+            layers=[self.shared_layer],
             environment={
-                "TABLE_NAME": db.table_name
+                "TABLE_NAME": db.table_name,
+                "JOBS_QUEUE_URL": self.jobs_queue.queue_url
             }
         )
         
         db.grant_read_write_data(self.delete_artist_handler)
+        self.jobs_queue.grant_send_messages(self.delete_artist_handler)
+        
+        # Jobs Worker Handler - runs album and artist deletions in checkpointed chunks
+        self.jobs_worker_handler = lambda_.Function(
+            self,
+            "JobsWorkerHandler",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="worker.handler",
+            code=lambda_.Code.from_asset("lambda/jobs"),
+            layers=[self.shared_layer],
+            environment={
+                "TABLE_NAME": db.table_name,
+                "BUCKET_NAME": music_bucket.bucket_name,
+                "JOBS_QUEUE_URL": self.jobs_queue.queue_url
+            },
+            timeout=Duration.minutes(5),
+            memory_size=512
+        )
+        
+        db.grant_read_write_data(self.jobs_worker_handler)
+        music_bucket.grant_delete(self.jobs_worker_handler)
+        self.jobs_queue.grant_send_messages(self.jobs_worker_handler)
+        self.jobs_worker_handler.add_event_source(
+            lambda_event_sources.SqsEventSource(self.jobs_queue, batch_size=1)
+        )
+        
+        # Get Job Handler - job status and progress
+        self.get_job_handler = lambda_.Function(
+            self,
+            "GetJobHandler",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="get_job.handler",
+            code=lambda_.Code.from_asset("lambda/jobs"),
+            layers=[self.shared_layer],
+            environment={
+                "TABLE_NAME": db.table_name
+            }
+        )
+        
+        db.grant_read_data(self.get_job_handler)
         
         # Get Albums By Artist Handler
         self.get_albums_by_artist_handler = lambda_.Function(
@@ -317,8 +434,11 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="get_albums_by_artist.handler",
             code=lambda_.Code.from_asset("lambda/artists"),
+            layers=[self.shared_layer],
             environment={
-                "TABLE_NAME": db.table_name
+                "TABLE_NAME": db.table_name,
+                "PAGE_RCU_BUDGET": "50",
+                "PAGE_TIME_BUDGET_MS": "1000"
             }
         )
         
@@ -331,8 +451,11 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="get_songs_by_artist.handler",
             code=lambda_.Code.from_asset("lambda/artists"),
+            layers=[self.shared_layer],
             environment={
-                "TABLE_NAME": db.table_name
+                "TABLE_NAME": db.table_name,
+                "PAGE_RCU_BUDGET": "50",
+                "PAGE_TIME_BUDGET_MS": "1000"
             }
         )
         
@@ -345,6 +468,7 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="subscribe.handler",
             code=lambda_.Code.from_asset("lambda/subscriptions"),
+            layers=[self.shared_layer],
             environment={
                 "SUBSCRIPTIONS_TABLE_NAME": subscriptions_table.table_name,
                 "TABLE_NAME": db.table_name
@@ -361,12 +485,15 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="unsubscribe.handler",
             code=lambda_.Code.from_asset("lambda/subscriptions"),
+            layers=[self.shared_layer],
             environment={
-                "SUBSCRIPTIONS_TABLE_NAME": subscriptions_table.table_name
+                "SUBSCRIPTIONS_TABLE_NAME": subscriptions_table.table_name,
+                "TABLE_NAME": db.table_name
             }
         )
         
         subscriptions_table.grant_read_write_data(self.unsubscribe_handler)
+        db.grant_read_write_data(self.unsubscribe_handler)  # Removes the artist's feed entries
         
         # Get User Subscriptions Handler - Get all subscriptions for a user
         self.get_user_subscriptions_handler = lambda_.Function(
@@ -375,6 +502,7 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="get_subscriptions.handler",
             code=lambda_.Code.from_asset("lambda/subscriptions"),
+            layers=[self.shared_layer],
             environment={
                 "SUBSCRIPTIONS_TABLE_NAME": subscriptions_table.table_name
             }
@@ -382,6 +510,23 @@ class LambdaStack(Stack):
         
         subscriptions_table.grant_read_data(self.get_user_subscriptions_handler)
         
+        # Get Feed Handler - New releases of the artists a user follows
+        self.get_feed_handler = lambda_.Function(
+            self,
+            "GetFeedHandler",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="get_feed.handler",
+            code=lambda_.Code.from_asset("lambda/subscriptions"),
+            layers=[self.shared_layer],
+            environment={
+                "SUBSCRIPTIONS_TABLE_NAME": subscriptions_table.table_name,
+                "TABLE_NAME": db.table_name
+            }
+        )
+        
+        subscriptions_table.grant_read_data(self.get_feed_handler)
+        db.grant_read_data(self.get_feed_handler)  # Pushed feed entries and pulled artists' releases
+        
         # Toggle Notifications Handler - Toggle notifications for a subscription
         self.toggle_notifications_handler = lambda_.Function(
             self,
@@ -389,40 +534,123 @@ class LambdaStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="toggle_notifications.handler",
             code=lambda_.Code.from_asset("lambda/subscriptions"),
+            layers=[self.shared_layer],
             environment={
-                "SUBSCRIPTIONS_TABLE_NAME": subscriptions_table.table_name
+                "SUBSCRIPTIONS_TABLE_NAME": subscriptions_table.table_name,
+                "TABLE_NAME": db.table_name
             }
         )
         
         subscriptions_table.grant_read_write_data(self.toggle_notifications_handler)
+        db.grant_read_data(self.toggle_notifications_handler)  # Subscriber shard counts
+        
+        # Release notifications: the planner queues subscribers in chunks and
+        # the workers send them. Chunks that keep failing move to the
+        # dead-letter queue; the visibility timeout is six times the worker
+        # timeout, as recommended for SQS event sources.
+        self.notifications_dead_letter_queue = sqs.Queue(
+            self,
+            "NotificationsDeadLetterQueue",
+            retention_period=Duration.days(14)
+        )
         
-        # Send Notifications Handler - Send email notifications to subscribers
+        self.notifications_queue = sqs.Queue(
+            self,
+            "NotificationsQueue",
+            visibility_timeout=Duration.minutes(12),
+            dead_letter_queue=sqs.DeadLetterQueue(
+                max_receive_count=5,
+                queue=self.notifications_dead_letter_queue
+            )
+        )
+        
+        # Release email templates, registered once. The workers send them with
+        # SendBulkTemplatedEmail, filling in the release and each recipient.
+        release_templates = {
+            "SONG_RELEASE_TEMPLATE": ("music-streaming-song-release", "song_release.html"),
+            "ALBUM_RELEASE_TEMPLATE": ("music-streaming-album-release", "album_release.html"),
+            "RELEASE_TEMPLATE": ("music-streaming-release", "release.html"),
+            "DIGEST_TEMPLATE": ("music-streaming-release-digest", "release_digest.html")
+        }
+        for variable, (template_name, html_file) in release_templates.items():
+            with open(f"lambda/subscriptions/templates/{html_file}", encoding="utf-8") as html:
+                ses.CfnTemplate(
+                    self,
+                    variable.title().replace("_", ""),
+                    template=ses.CfnTemplate.TemplateProperty(
+                        template_name=template_name,
+                        subject_part="New {{event_title}} from {{artist_name}}",
+                        html_part=html.read()
+                    )
+                )
+        
+        # Send Notifications Handler - plans the fan-out of a release to its subscribers.
+        # Releases of an artist within the digest window go out as one email.
         self.send_notifications_handler = lambda_.Function(
             self,
             "SendNotificationsHandler",
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="send_notifications.handler",
             code=lambda_.Code.from_asset("lambda/subscriptions"),
+            layers=[self.shared_layer],
             environment={
                 "SUBSCRIPTIONS_TABLE_NAME": subscriptions_table.table_name,
                 "TABLE_NAME": db.table_name,
-                "SES_SENDER_EMAIL": "romanminakov@proton.me",  # Change to your verified email
-                "APP_URL": "d1wnmsdwgb6x45.cloudfront.net"
+                "NOTIFICATIONS_QUEUE_URL": self.notifications_queue.queue_url,
+                "APP_URL": "d1wnmsdwgb6x45.cloudfront.net",
+                "NOTIFICATION_DIGEST_SECONDS": "300",
+                **{variable: template_name for variable, (template_name, _) in release_templates.items()}
             },
-            timeout=Duration.seconds(60),
+            timeout=Duration.minutes(5),
             memory_size=256
         )
         
         subscriptions_table.grant_read_data(self.send_notifications_handler)
-        db.grant_read_data(self.send_notifications_handler)
+        db.grant_read_write_data(self.send_notifications_handler)
+        self.notifications_queue.grant_send_messages(self.send_notifications_handler)
+        
+        # Notification Worker Handler - sends the queued chunks. At most
+        # notification_workers run at once and split the SES send rate.
+        notification_workers = 10
+        self.notification_worker_handler = lambda_.Function(
+            self,
+            "NotificationWorkerHandler",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="notification_worker.handler",
+            code=lambda_.Code.from_asset("lambda/subscriptions"),
+            layers=[self.shared_layer],
+            environment={
+                "SUBSCRIPTIONS_TABLE_NAME": subscriptions_table.table_name,
+                "TABLE_NAME": db.table_name,
+                "NOTIFICATIONS_QUEUE_URL": self.notifications_queue.queue_url,
+                "NOTIFICATION_WORKERS": str(notification_workers),
+                "DIGEST_TEMPLATE": release_templates["DIGEST_TEMPLATE"][0],
+                "SES_SENDER_EMAIL": "romanminakov@proton.me"  # Change to your verified email
+            },
+            timeout=Duration.minutes(2),
+            memory_size=256
+        )
+        
+        subscriptions_table.grant_read_data(self.notification_worker_handler)
+        db.grant_read_write_data(self.notification_worker_handler)
+        self.notifications_queue.grant_send_messages(self.notification_worker_handler)
+        self.notification_worker_handler.add_event_source(
+            lambda_event_sources.SqsEventSource(
+                self.notifications_queue,
+                batch_size=1,
+                max_concurrency=notification_workers
+            )
+        )
         
         # Grant SES permissions to send emails
-        self.send_notifications_handler.add_to_role_policy(
+        self.notification_worker_handler.add_to_role_policy(
             iam.PolicyStatement(
                 effect=iam.Effect.ALLOW,
                 actions=[
                     "ses:SendEmail",
-                    "ses:SendRawEmail"
+                    "ses:SendRawEmail",
+                    "ses:SendBulkTemplatedEmail",
+                    "ses:GetSendQuota"
                 ],
                 resources=["*"]
             )
@@ -436,6 +664,292 @@ class LambdaStack(Stack):
         self.send_notifications_handler.grant_invoke(self.create_song_handler)
         self.send_notifications_handler.grant_invoke(self.create_album_handler)
         
+        # Backfill Index Keys Handler - one-off job that writes GSI keys (entity_shard, artist_songs,
+        # artist_albums, artist_shard, notify_artist) on items created before those indexes
+        self.backfill_index_keys_handler = lambda_.Function(
+            self,
+            "BackfillIndexKeysHandler",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="backfill_index_keys.handler",
+            code=lambda_.Code.from_asset("lambda/maintenance"),
+            layers=[self.shared_layer],
+            environment={
+                "TABLE_NAME": db.table_name,
+                "SUBSCRIPTIONS_TABLE_NAME": subscriptions_table.table_name
+            },
+            timeout=Duration.minutes(15),
+            memory_size=256
+        )
+        
+        db.grant_read_write_data(self.backfill_index_keys_handler)
+        subscriptions_table.grant_read_write_data(self.backfill_index_keys_handler)
+        
+        # The job re-invokes itself to continue or fan out scan segments. A resource
+        # policy is used because a role policy on the function ARN would be circular.
+        self.backfill_index_keys_handler.add_permission(
+            "BackfillSelfInvoke",
+            principal=iam.ArnPrincipal(self.backfill_index_keys_handler.role.role_arn),
+            action="lambda:InvokeFunction"
+        )
+        
+        # Counters Stream Handler - maintains total_songs / total_albums from the
+        # catalog table stream. Only song and album inserts and removals are delivered.
+        self.counters_stream_dead_letter_queue = sqs.Queue(
+            self,
+            "CountersStreamDeadLetterQueue",
+            retention_period=Duration.days(14)
+        )
+        
+        self.counters_stream_handler = lambda_.Function(
+            self,
+            "CountersStreamHandler",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="counters.handler",
+            code=lambda_.Code.from_asset("lambda/streams"),
+            layers=[self.shared_layer],
+            environment={
+                "TABLE_NAME": db.table_name
+            },
+            timeout=Duration.seconds(60),
+            memory_size=256
+        )
+        
+        db.grant_read_write_data(self.counters_stream_handler)
+        self.counters_stream_handler.add_event_source(
+            lambda_event_sources.DynamoEventSource(
+                db,
+                starting_position=lambda_.StartingPosition.TRIM_HORIZON,
+                batch_size=1000,
+                max_batching_window=Duration.seconds(2),
+                # Retries must restart at the same record for the ledger to
+                # recognise them, so batches are never bisected
+                bisect_batch_on_error=False,
+                retry_attempts=20,
+                on_failure=lambda_event_sources.SqsDlq(self.counters_stream_dead_letter_queue),
+                filters=[
+                    lambda_.FilterCriteria.filter({
+                        "eventName": lambda_.FilterRule.or_("INSERT", "REMOVE"),
+                        "dynamodb": {
+                            "Keys": {
+                                "pk": {"S": [{"prefix": "SONG#"}, {"prefix": "ALBUM#"}]},
+                                "sk": {"S": lambda_.FilterRule.is_equal("METADATA")}
+                            }
+                        }
+                    })
+                ]
+            )
+        )
+        
+        # Renames Stream Handler - copies a changed artist name to the artist_name
+        # attribute of their songs, albums and subscriptions
+        self.renames_stream_dead_letter_queue = sqs.Queue(
+            self,
+            "RenamesStreamDeadLetterQueue",
+            retention_period=Duration.days(14)
+        )
+        
+        self.renames_stream_handler = lambda_.Function(
+            self,
+            "RenamesStreamHandler",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="renames.handler",
+            code=lambda_.Code.from_asset("lambda/streams"),
+            layers=[self.shared_layer],
+            environment={
+                "TABLE_NAME": db.table_name,
+                "SUBSCRIPTIONS_TABLE_NAME": subscriptions_table.table_name
+            },
+            timeout=Duration.minutes(5),
+            memory_size=512
+        )
+        
+        db.grant_read_write_data(self.renames_stream_handler)
+        subscriptions_table.grant_read_write_data(self.renames_stream_handler)
+        self.renames_stream_handler.add_event_source(
+            lambda_event_sources.DynamoEventSource(
+                db,
+                starting_position=lambda_.StartingPosition.TRIM_HORIZON,
+                batch_size=100,
+                # Propagation skips current copies, so any retry is safe
+                bisect_batch_on_error=True,
+                retry_attempts=10,
+                on_failure=lambda_event_sources.SqsDlq(self.renames_stream_dead_letter_queue),
+                filters=[
+                    lambda_.FilterCriteria.filter({
+                        "eventName": lambda_.FilterRule.is_equal("MODIFY"),
+                        "dynamodb": {
+                            "Keys": {
+                                "pk": {"S": lambda_.FilterRule.begins_with("ARTIST#")},
+                                "sk": {"S": lambda_.FilterRule.is_equal("METADATA")}
+                            }
+                        }
+                    })
+                ]
+            )
+        )
+        
+        # Paginated list handlers sign and verify their cursors; the key is read
+        # from the secret at runtime (common/cursor.py), not set in the environment
+        for paginated_handler in (
+            self.get_songs_handler,
+            self.get_songs_by_album_handler,
+            self.get_albums_handler,
+            self.get_album_songs_handler,
+            self.get_artists_handler,
+            self.get_albums_by_artist_handler,
+            self.get_songs_by_artist_handler,
+            self.get_user_subscriptions_handler,
+            self.get_feed_handler
+        ):
+            paginated_handler.add_environment("CURSOR_SECRET_ARN", self.cursor_secret.secret_arn)
+            self.cursor_secret.grant_read(paginated_handler)
+        
+        # Readers of an artist's songs and albums use the sparse indexes once the
+        # rollout has backfilled them (DatabaseStack, common/discography.py)
+        if catalog_index_stage(self) >= SPARSE_ARTIST_INDEXES_STAGE:
+            for discography_reader in (
+                self.get_songs_by_artist_handler,
+                self.get_albums_by_artist_handler,
+                self.jobs_worker_handler,
+                self.renames_stream_handler
+            ):
+                discography_reader.add_environment("SPARSE_ARTIST_INDEXES", "true")
+        
+        # Catalog listings read entity-shard-index once it is added (common/sharding.py)
+        if catalog_index_stage(self) >= SHARDED_LISTINGS_STAGE:
+            for listing_reader in (
+                self.get_songs_handler,
+                self.get_albums_handler,
+                self.get_artists_handler
+            ):
+                listing_reader.add_environment("SHARDED_LISTINGS", "true")
+        
+        # Release planners read notify-artist-index once the rollout has backfilled
+        # it, and renames read artist-shard-index once it is added (DatabaseStack,
+        # common/sharding.py)
+        if subscriptions_index_stage(self) >= NOTIFY_ARTIST_INDEX_STAGE:
+            for release_planner in (
+                self.send_notifications_handler,
+                self.notification_worker_handler
+            ):
+                release_planner.add_environment("NOTIFY_ARTIST_INDEX", "true")
+        if subscriptions_index_stage(self) >= SHARDED_SUBSCRIPTIONS_STAGE:
+            self.renames_stream_handler.add_environment("SHARDED_SUBSCRIPTIONS", "true")
+        
+        # Handlers that read METADATA items through the per-container cache
+        # (common/cache.py). Other containers' writes show up within the TTL.
+        cached_readers = (
+            self.get_song_handler,
+            self.get_album_handler,
+            self.get_artist_handler,
+            self.get_album_songs_handler,
+            self.get_albums_by_artist_handler,
+            self.get_songs_by_artist_handler,
+            self.create_song_handler,
+            self.create_album_handler,
+            self.subscribe_handler
+        )
+        for cached_handler in cached_readers:
+            cached_handler.add_environment("METADATA_CACHE_MAX_ENTRIES", "2000")
+            cached_handler.add_environment("METADATA_CACHE_MAX_BYTES", str(16 * 1024 * 1024))
+            cached_handler.add_environment("METADATA_CACHE_TTL_SECONDS", "30")
+            cached_handler.add_environment("METADATA_CACHE_NEGATIVE_TTL_SECONDS", "5")
+        
+        # Optional shared cache tier behind the container caches: any single-shard
+        # Redis-protocol endpoint (cluster mode disabled) the functions can reach, e.g.
+        #   cdk deploy -c catalog_cache_url=rediss://:<password>@<host>:6379
+        # Writers and the stream consumers get it too, to invalidate what they change.
+        catalog_cache_url = self.node.try_get_context("catalog_cache_url")
+        if catalog_cache_url:
+            for cache_handler in cached_readers + (
+                self.create_artist_handler,
+                self.update_song_handler,
+                self.update_album_handler,
+                self.update_artist_handler,
+                self.delete_song_handler,
+                self.delete_album_handler,
+                self.delete_artist_handler,
+                self.jobs_worker_handler,
+                self.counters_stream_handler,
+                self.renames_stream_handler
+            ):
+                cache_handler.add_environment("CATALOG_CACHE_URL", catalog_cache_url)
+                cache_handler.add_environment("CATALOG_CACHE_TTL_SECONDS", "300")
+                cache_handler.add_environment("CATALOG_CACHE_NEGATIVE_TTL_SECONDS", "30")
+        
+        # Stage Cache Refresh Handler - refreshes the API stage cache entries affected
+        # by a catalog write (common/stage_cache.py): signed GETs with Cache-Control: max-age=0
+        # and a refresh token, which lets the read handlers skip their METADATA cache.
+        # Writers invoke it asynchronously, so the refresh is not on the write request.
+        self.refresh_stage_cache_handler = lambda_.Function(
+            self,
+            "RefreshStageCacheHandler",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="refresh_stage_cache.handler",
+            code=lambda_.Code.from_asset("lambda/cache"),
+            layers=[self.shared_layer],
+            environment={
+                "API_URL_PARAMETER": API_URL_PARAMETER_NAME
+            },
+            timeout=Duration.seconds(30),
+            # A missed refresh expires with the cache TTL
+            retry_attempts=0
+        )
+        
+        self.refresh_stage_cache_handler.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["ssm:GetParameter"],
+                resources=[
+                    self.format_arn(
+                        service="ssm",
+                        resource="parameter",
+                        resource_name=API_URL_PARAMETER_NAME.lstrip("/")
+                    )
+                ]
+            )
+        )
+        self.refresh_stage_cache_handler.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=["execute-api:InvalidateCache"],
+                resources=[self.format_arn(service="execute-api", resource="*", resource_name="*/GET/*")]
+            )
+        )
+        
+        # Signing key for the refresh tokens checked by the read handlers
+        self.stage_cache_refresh_secret = secretsmanager.Secret(
+            self,
+            "StageCacheRefreshSecret",
+            description="HMAC key for stage cache refresh tokens",
+            generate_secret_string=secretsmanager.SecretStringGenerator(
+                password_length=64,
+                exclude_punctuation=True
+            )
+        )
+        
+        for refresh_token_handler in (
+            self.refresh_stage_cache_handler,
+            self.get_song_handler,
+            self.get_album_handler,
+            self.get_artist_handler
+        ):
+            refresh_token_handler.add_environment("STAGE_CACHE_REFRESH_SECRET_ARN", self.stage_cache_refresh_secret.secret_arn)
+            self.stage_cache_refresh_secret.grant_read(refresh_token_handler)
+        
+        for writer_handler in (
+            self.create_song_handler,
+            self.update_song_handler,
+            self.delete_song_handler,
+            self.create_album_handler,
+            self.update_album_handler,
+            self.create_artist_handler,
+            self.update_artist_handler,
+            self.jobs_worker_handler
+        ):
+            writer_handler.add_environment("STAGE_CACHE_REFRESH_FUNCTION", self.refresh_stage_cache_handler.function_name)
+            self.refresh_stage_cache_handler.grant_invoke(writer_handler)
+        
         # Grant Cognito permissions to auth handlers
         user_pool.grant(self.login_handler, "cognito-idp:AdminInitiateAuth")
         user_pool.grant(self.refresh_handler, "cognito-idp:InitiateAuth")
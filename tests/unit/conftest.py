@@ -0,0 +1,84 @@
+import os
+import sys
+
+import pytest
+from moto import mock_aws
+
+# The handlers' shared code is deployed as a Lambda layer; import it from source
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'lambda', 'layer', 'python'))
+
+# Clients run against stubs, fakes or moto, never a real account
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+
+def _index(name, partition_key, sort_key='created_at'):
+    return {
+        'IndexName': name,
+        'KeySchema': [
+            {'AttributeName': partition_key, 'KeyType': 'HASH'},
+            {'AttributeName': sort_key, 'KeyType': 'RANGE'}
+        ],
+        'Projection': {'ProjectionType': 'ALL'}
+    }
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    """
+    The catalog and subscriptions tables, with the indexes of DatabaseStack,
+    in an in-memory DynamoDB. Yields the catalog Table.
+    """
+    from common import clients
+    
+    monkeypatch.setenv('TABLE_NAME', 'catalog')
+    monkeypatch.setenv('SUBSCRIPTIONS_TABLE_NAME', 'subscriptions')
+    with mock_aws():
+        # Clients built before the mock would call AWS
+        monkeypatch.setattr(clients, '_clients', {})
+        monkeypatch.setattr(clients, '_resources', {})
+        monkeypatch.setattr(clients, '_tables', {})
+        dynamodb = clients.client('dynamodb')
+        dynamodb.create_table(
+            TableName='catalog',
+            KeySchema=[{'AttributeName': 'pk', 'KeyType': 'HASH'}, {'AttributeName': 'sk', 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[
+                {'AttributeName': name, 'AttributeType': 'S'}
+                for name in ('pk', 'sk', 'album_id', 'artist_id', 'created_at', 'entity_type', 'entity_shard', 'artist_songs', 'artist_albums')
+            ],
+            GlobalSecondaryIndexes=[
+                _index('album-index', 'album_id'),
+                _index('artist-id-index', 'artist_id'),
+                _index('entity-type-index', 'entity_type'),
+                _index('entity-shard-index', 'entity_shard'),
+                _index('artist-songs-index', 'artist_songs'),
+                _index('artist-albums-index', 'artist_albums')
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        dynamodb.create_table(
+            TableName='subscriptions',
+            KeySchema=[{'AttributeName': 'user_id', 'KeyType': 'HASH'}, {'AttributeName': 'artist_id', 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[
+                {'AttributeName': name, 'AttributeType': 'S'}
+                for name in ('user_id', 'artist_id', 'artist_shard', 'notify_artist', 'subscription_date')
+            ],
+            GlobalSecondaryIndexes=[
+                _index('artist-id-index', 'artist_id', 'subscription_date'),
+                _index('artist-shard-index', 'artist_shard', 'subscription_date'),
+                _index('notify-artist-index', 'notify_artist', 'subscription_date')
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        yield clients.table()
+
+
+@pytest.fixture
+def bucket(tables, monkeypatch):
+    """The music bucket in the same in-memory account. Yields its name."""
+    from common import clients
+    
+    monkeypatch.setenv('BUCKET_NAME', 'music-bucket')
+    clients.s3().create_bucket(Bucket='music-bucket')
+    yield 'music-bucket'
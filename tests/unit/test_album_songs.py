@@ -0,0 +1,96 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+from common import cache, signing
+
+
+def _load(name, path):
+    # Handlers are deployed from their own directories, outside the layer
+    spec = importlib.util.spec_from_file_location(name, os.path.join(os.path.dirname(__file__), '..', '..', 'lambda', *path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+get_album_songs = _load('get_album_songs', ('albums', 'get_album_songs.py'))
+
+
+@pytest.fixture(autouse=True)
+def environment(monkeypatch):
+    monkeypatch.setattr(cache, '_cache', None)
+    monkeypatch.delenv('CURSOR_SECRET_ARN', raising=False)
+    monkeypatch.setenv('CURSOR_SECRET', 'cursor-key')
+    signing._cached_keys.clear()
+    yield
+    signing._cached_keys.clear()
+
+
+@pytest.fixture
+def album(tables):
+    # The album item sorts first in its album-index partition
+    tables.put_item(Item={
+        'pk': 'ALBUM#album-1', 'sk': 'METADATA', 'entity_type': 'ALBUM', 'album_id': 'album-1',
+        'title': 'Album', 'created_at': '2024-01-01T00:00:00'
+    })
+    for number in range(5):
+        tables.put_item(Item={
+            'pk': f'SONG#song-{number}', 'sk': 'METADATA', 'entity_type': 'SONG', 'album_id': 'album-1',
+            'title': f'Song {number}', 'created_at': f'2024-01-02T00:00:0{number}'
+        })
+    # A song of another album
+    tables.put_item(Item={
+        'pk': 'SONG#other', 'sk': 'METADATA', 'entity_type': 'SONG', 'album_id': 'album-2',
+        'title': 'Other', 'created_at': '2024-01-02T00:00:00'
+    })
+    return tables
+
+
+def get(album_id='album-1', **params):
+    response = get_album_songs.handler({'pathParameters': {'albumId': album_id}, 'queryStringParameters': params or None}, None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+def test_pages_are_filled_past_the_album_item(album):
+    status, body = get(limit='2')
+    assert status == 200
+    assert body['album']['title'] == 'Album'
+    assert [song['title'] for song in body['songs']] == ['Song 0', 'Song 1']
+    
+    titles = [song['title'] for song in body['songs']]
+    while body['last_key']:
+        status, body = get(limit='2', last_key=body['last_key'])
+        titles += [song['title'] for song in body['songs']]
+    assert titles == [f'Song {number}' for number in range(5)]
+
+
+def test_last_page_has_no_cursor(album):
+    status, body = get(limit='5')
+    assert body['songs_count'] == 5
+    assert body['last_key'] is None
+
+
+def test_cursor_of_another_album_is_rejected(album):
+    status, body = get(limit='2')
+    status, body = get('album-2', limit='2', last_key=body['last_key'])
+    assert status == 400
+
+
+def test_missing_album(tables):
+    status, body = get('missing')
+    assert status == 404
+
+
+def test_fields_project_the_songs(album):
+    status, body = get(limit='2', fields='title,name')
+    assert body['songs'] == [{'title': 'Song 0'}, {'title': 'Song 1'}]
+    status, body = get(limit='2', fields='title,name', last_key=body['last_key'])
+    assert body['songs'] == [{'title': 'Song 2'}, {'title': 'Song 3'}]
+
+
+def test_invalid_fields_are_a_bad_request(album):
+    status, body = get(fields='title,#pk')
+    assert status == 400
+    assert body['message'] == 'Invalid attribute name: #pk'
@@ -0,0 +1,51 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+from common import cache
+
+# Handlers are deployed from their own directories, outside the layer
+_spec = importlib.util.spec_from_file_location(
+    'create_album', os.path.join(os.path.dirname(__file__), '..', '..', 'lambda', 'albums', 'create.py')
+)
+create_album = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(create_album)
+
+ADMIN = {'authorizer': {'claims': {'cognito:groups': 'admin'}}}
+
+
+@pytest.fixture(autouse=True)
+def metadata_cache(monkeypatch):
+    monkeypatch.setattr(cache, '_cache', None)
+
+
+def create(artist_id='artist-1'):
+    body = {'title': 'Album', 'artist_id': artist_id}
+    response = create_album.handler({'body': json.dumps(body), 'requestContext': ADMIN}, None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+def albums(table):
+    return [item for item in table.scan()['Items'] if item['pk'].startswith('ALBUM#')]
+
+
+def test_create_saves_the_album(tables):
+    tables.put_item(Item={'pk': 'ARTIST#artist-1', 'sk': 'METADATA', 'entity_type': 'ARTIST', 'name': 'Artist'})
+    status, body = create()
+    assert status == 201
+    assert [album['album_id'] for album in albums(tables)] == [body['album']['album_id']]
+
+
+def test_missing_artist_returns_404(tables):
+    assert create('missing') == (404, {'message': 'Artist not found'})
+    assert albums(tables) == []
+
+
+def test_artist_deleted_after_it_was_cached_returns_404(tables):
+    tables.put_item(Item={'pk': 'ARTIST#artist-1', 'sk': 'METADATA', 'entity_type': 'ARTIST', 'name': 'Artist'})
+    cache.get_metadata('ARTIST', 'artist-1')
+    tables.delete_item(Key={'pk': 'ARTIST#artist-1', 'sk': 'METADATA'})
+    assert create() == (404, {'message': 'Artist not found'})
+    assert albums(tables) == []
@@ -0,0 +1,120 @@
+import inspect
+
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+from aws_cdk import aws_cognito as cognito, aws_lambda as lambda_
+
+from music_streaming_backend.api_stack import ApiStack, CACHE_TTLS
+
+# ApiStack only wires the handlers into routes, so stand-in functions will do
+HANDLER_ARGUMENTS = [name for name in inspect.signature(ApiStack.__init__).parameters if name.endswith('_handler')]
+
+
+def api_template():
+    app = core.App()
+    dependencies = core.Stack(app, "Dependencies")
+    handlers = {
+        name: lambda_.Function(
+            dependencies,
+            name,
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="index.handler",
+            code=lambda_.Code.from_inline("def handler(event, context):\n    pass\n")
+        )
+        for name in HANDLER_ARGUMENTS
+    }
+    user_pool = cognito.UserPool(dependencies, "UserPool")
+    stack = ApiStack(app, "api", user_pool=user_pool, **handlers)
+    return assertions.Template.from_stack(stack)
+
+
+TEMPLATE = api_template()
+
+
+def method_setting(path, ttl):
+    return {
+        # Stage method settings escape the slashes of the resource path
+        "ResourcePath": "/" + path.replace("/", "~1"),
+        "HttpMethod": "GET",
+        "CachingEnabled": True,
+        "CacheTtlInSeconds": ttl,
+        "CacheDataEncrypted": True
+    }
+
+
+def test_stage_cache_cluster_enabled():
+    TEMPLATE.has_resource_properties("AWS::ApiGateway::Stage", {
+        "CacheClusterEnabled": True,
+        "CacheClusterSize": "0.5"
+    })
+
+
+def test_per_route_ttls():
+    TEMPLATE.has_resource_properties("AWS::ApiGateway::Stage", {
+        "MethodSettings": assertions.Match.array_with([
+            assertions.Match.object_like(method_setting(path, ttl)) for path, ttl in CACHE_TTLS.items()
+        ])
+    })
+
+
+def test_only_catalog_reads_are_cached():
+    stages = TEMPLATE.find_resources("AWS::ApiGateway::Stage")
+    (stage,) = stages.values()
+    cached = [
+        setting for setting in stage["Properties"]["MethodSettings"]
+        if setting.get("CachingEnabled")
+    ]
+    assert {setting["HttpMethod"] for setting in cached} == {"GET"}
+    assert {setting["ResourcePath"][1:].replace("~1", "/") for setting in cached} == set(CACHE_TTLS)
+
+
+def test_list_cache_key_includes_pagination():
+    TEMPLATE.has_resource_properties("AWS::ApiGateway::Method", {
+        "HttpMethod": "GET",
+        "RequestParameters": assertions.Match.object_like({
+            "method.request.querystring.limit": False,
+            "method.request.querystring.last_key": False
+        }),
+        "Integration": assertions.Match.object_like({
+            "CacheKeyParameters": assertions.Match.array_with([
+                "method.request.querystring.limit",
+                "method.request.querystring.last_key"
+            ])
+        })
+    })
+
+
+def test_cache_key_includes_if_none_match():
+    TEMPLATE.has_resource_properties("AWS::ApiGateway::Method", {
+        "HttpMethod": "GET",
+        "RequestParameters": assertions.Match.object_like({
+            "method.request.path.songId": True,
+            "method.request.header.If-None-Match": False
+        }),
+        "Integration": assertions.Match.object_like({
+            "CacheKeyParameters": assertions.Match.array_with(["method.request.header.If-None-Match"])
+        })
+    })
+
+
+def test_item_cache_key_includes_path_parameter():
+    for path_parameter in ("songId", "albumId", "artistId"):
+        TEMPLATE.has_resource_properties("AWS::ApiGateway::Method", {
+            "HttpMethod": "GET",
+            "RequestParameters": assertions.Match.object_like({
+                f"method.request.path.{path_parameter}": True
+            }),
+            "Integration": assertions.Match.object_like({
+                "CacheKeyParameters": assertions.Match.array_with([
+                    f"method.request.path.{path_parameter}",
+                    "method.request.querystring.limit",
+                    "method.request.querystring.last_key"
+                ])
+            })
+        })
+
+
+def test_api_url_published_for_cache_refresh():
+    TEMPLATE.has_resource_properties("AWS::SSM::Parameter", {
+        "Name": "/music-streaming/api-url"
+    })
@@ -0,0 +1,197 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from common import cache, clients, kvstore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(cache, '_cache', None)
+    monkeypatch.setattr(cache, '_store_down_until', [0.0])
+    monkeypatch.delenv('CATALOG_CACHE_URL', raising=False)
+
+
+@pytest.fixture
+def table_reads(tables, monkeypatch):
+    """Keys of the METADATA items read from the table."""
+    reads = []
+    original = cache._read_table
+    
+    def read_table(pks):
+        reads.extend(pks)
+        return original(pks)
+    
+    monkeypatch.setattr(cache, '_read_table', read_table)
+    return reads
+
+
+def add_artist(table, artist_id, name='Artist'):
+    table.put_item(Item={'pk': f'ARTIST#{artist_id}', 'sk': 'METADATA', 'entity_type': 'ARTIST', 'name': name})
+
+
+def test_entries_expire_after_their_ttl():
+    clock = Clock()
+    lru = cache.LRUCache(ttl_seconds=30, negative_ttl_seconds=5, clock=clock)
+    lru.put('ARTIST#1', {'name': 'Artist'})
+    lru.put_missing('ARTIST#2')
+    assert lru.get('ARTIST#1') == (True, {'name': 'Artist'})
+    assert lru.get('ARTIST#2') == (True, None)
+    
+    clock.now += 5
+    assert lru.get('ARTIST#1') == (True, {'name': 'Artist'})
+    assert lru.get('ARTIST#2') == (False, None)
+    clock.now += 25
+    assert lru.get('ARTIST#1') == (False, None)
+    assert lru.stats['expirations'] == 2
+    assert len(lru) == 0 and lru.bytes == 0
+
+
+def test_least_recently_used_entries_are_evicted():
+    lru = cache.LRUCache(max_entries=2)
+    lru.put('a', 1)
+    lru.put('b', 2)
+    lru.get('a')
+    lru.put('c', 3)
+    assert [lru.get(key)[0] for key in ('a', 'b', 'c')] == [True, False, True]
+    assert lru.stats['evictions'] == 1
+
+
+def test_cache_is_bounded_by_estimated_size():
+    lru = cache.LRUCache(max_bytes=2000)
+    for number in range(10):
+        lru.put(f'key-{number}', {'text': 'x' * 300})
+    assert 0 < len(lru) < 10
+    assert lru.bytes <= 2000
+    # An entry larger than the whole cache is not stored
+    lru.put('large', 'x' * 5000)
+    assert lru.get('large') == (False, None)
+
+
+def test_invalidate_drops_an_entry():
+    lru = cache.LRUCache()
+    lru.put('a', 1)
+    lru.invalidate('a')
+    lru.invalidate('missing')
+    assert lru.get('a') == (False, None)
+    assert lru.bytes == 0
+
+
+def test_metadata_is_read_from_the_table_once(table_reads):
+    add_artist(clients.table(), 'artist-1')
+    first = cache.get_metadata('ARTIST', 'artist-1')
+    # Callers get their own copy
+    first['name'] = 'Changed'
+    assert cache.get_metadata('ARTIST', 'artist-1')['name'] == 'Artist'
+    assert table_reads == ['ARTIST#artist-1']
+
+
+def test_missing_items_are_cached_until_invalidated(table_reads):
+    assert cache.get_metadata('ARTIST', 'artist-1') is None
+    assert cache.get_metadata('ARTIST', 'artist-1') is None
+    assert table_reads == ['ARTIST#artist-1']
+    
+    add_artist(clients.table(), 'artist-1')
+    cache.invalidate_metadata('ARTIST', 'artist-1')
+    assert cache.get_metadata('ARTIST', 'artist-1')['name'] == 'Artist'
+
+
+def test_many_items_are_read_in_one_batch(table_reads):
+    for number in range(3):
+        add_artist(clients.table(), f'artist-{number}')
+    cache.get_metadata('ARTIST', 'artist-0')
+    found = cache.get_metadata_many([('ARTIST', f'artist-{number}') for number in range(4)])
+    assert [item and item['pk'] for item in found.values()] == ['ARTIST#artist-0', 'ARTIST#artist-1', 'ARTIST#artist-2', None]
+    assert table_reads == ['ARTIST#artist-0', 'ARTIST#artist-1', 'ARTIST#artist-2', 'ARTIST#artist-3']
+
+
+def test_refresh_skips_the_container_copy(table_reads):
+    add_artist(clients.table(), 'artist-1')
+    cache.get_metadata('ARTIST', 'artist-1')
+    add_artist(clients.table(), 'artist-1', name='Renamed')
+    assert cache.get_metadata('ARTIST', 'artist-1')['name'] == 'Artist'
+    assert cache.get_metadata('ARTIST', 'artist-1', refresh=True)['name'] == 'Renamed'
+
+
+@pytest.fixture
+def shared_store(monkeypatch):
+    """The in-process shared tier, with the container cache off so every read reaches it."""
+    monkeypatch.setattr(kvstore, '_stores', {})
+    monkeypatch.setenv('CATALOG_CACHE_URL', 'local://test')
+    monkeypatch.setenv('METADATA_CACHE_ENABLED', 'false')
+    return kvstore.get_store()
+
+
+def test_shared_tier_is_filled_once(table_reads, shared_store):
+    add_artist(clients.table(), 'artist-1')
+    assert cache.get_metadata('ARTIST', 'artist-1')['name'] == 'Artist'
+    assert cache.get_metadata('ARTIST', 'artist-1')['name'] == 'Artist'
+    assert table_reads == ['ARTIST#artist-1']
+    # The refill lock is released by the publish
+    assert shared_store.get_many([cache.lock_key('ARTIST#artist-1')]) == [None]
+
+
+def test_shared_tier_caches_missing_items(table_reads, shared_store):
+    assert cache.get_metadata('ARTIST', 'artist-1') is None
+    assert cache.get_metadata('ARTIST', 'artist-1') is None
+    assert table_reads == ['ARTIST#artist-1']
+    
+    add_artist(clients.table(), 'artist-1')
+    cache.invalidate_metadata('ARTIST', 'artist-1')
+    assert shared_store.get_many([cache.shared_key('ARTIST#artist-1')]) == [None]
+    assert cache.get_metadata('ARTIST', 'artist-1')['name'] == 'Artist'
+
+
+def test_concurrent_misses_read_the_table_once(table_reads, shared_store, monkeypatch):
+    add_artist(clients.table(), 'artist-1')
+    original = cache._read_table
+    
+    def slow_read_table(pks):
+        time.sleep(0.05)
+        return original(pks)
+    
+    monkeypatch.setattr(cache, '_read_table', slow_read_table)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        found = list(executor.map(lambda _: cache.get_metadata('ARTIST', 'artist-1'), range(8)))
+    assert [item['name'] for item in found] == ['Artist'] * 8
+    assert table_reads == ['ARTIST#artist-1']
+
+
+def test_invalidation_stops_a_refill_in_flight(table_reads, shared_store, monkeypatch):
+    add_artist(clients.table(), 'artist-1')
+    original = cache._read_table
+    
+    def read_table(pks):
+        items = original(pks)
+        # The item is written and invalidated after the refill read it
+        add_artist(clients.table(), 'artist-1', name='Renamed')
+        cache.invalidate_metadata('ARTIST', 'artist-1')
+        return items
+    
+    monkeypatch.setattr(cache, '_read_table', read_table)
+    assert cache.get_metadata('ARTIST', 'artist-1')['name'] == 'Artist'
+    # The outdated item was not published
+    assert shared_store.get_many([cache.shared_key('ARTIST#artist-1')]) == [None]
+
+
+def test_unavailable_shared_tier_falls_back_to_the_table(table_reads, shared_store, monkeypatch):
+    add_artist(clients.table(), 'artist-1')
+    
+    def fail(keys):
+        raise kvstore.StoreError('Connection refused')
+    
+    monkeypatch.setattr(shared_store, 'get_many', fail)
+    assert cache.get_metadata('ARTIST', 'artist-1')['name'] == 'Artist'
+    # The shared tier is skipped until it is retried
+    assert cache._shared_store() is None
+    assert cache.get_metadata('ARTIST', 'artist-1')['name'] == 'Artist'
+    assert table_reads == ['ARTIST#artist-1', 'ARTIST#artist-1']
@@ -0,0 +1,129 @@
+import pytest
+
+from common import cascade, clients, dynamo
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(dynamo, 'backoff', lambda attempt: None)
+
+
+def add_songs(table, bucket, count, album_id='album-1', artist_id='artist-1', prefix='song'):
+    with table.batch_writer() as batch:
+        for number in range(count):
+            song_id = f'{prefix}-{number:04d}'
+            song = {
+                'pk': f'SONG#{song_id}',
+                'sk': 'METADATA',
+                'entity_type': 'SONG',
+                'artist_id': artist_id,
+                'artist_songs': artist_id,
+                'created_at': f'2024-01-01T00:{number // 60 % 60:02d}:{number % 60:02d}',
+                's3_key': f'songs/{song_id}/audio.mp3'
+            }
+            if album_id:
+                song['album_id'] = album_id
+            batch.put_item(Item=song)
+    s3 = clients.s3()
+    for number in range(count):
+        s3.put_object(Bucket=bucket, Key=f'songs/{prefix}-{number:04d}/audio.mp3', Body=b'audio')
+
+
+def remaining(table):
+    return [item['pk'] for item in table.scan()['Items']]
+
+
+def objects(bucket):
+    return clients.s3().list_objects_v2(Bucket=bucket)['KeyCount']
+
+
+def spy(monkeypatch, target, method, change=None):
+    """Record the calls of a client method; `change` may rewrite the response."""
+    calls = []
+    original = getattr(target, method)
+    
+    def wrapper(**kwargs):
+        calls.append(kwargs)
+        response = original(**kwargs)
+        return change(len(calls), kwargs, response) if change else response
+    
+    monkeypatch.setattr(target, method, wrapper)
+    return calls
+
+
+def test_album_cascade_pages_and_batches(tables, bucket, monkeypatch):
+    add_songs(tables, bucket, 60)
+    add_songs(tables, bucket, 3, album_id='album-2', prefix='other')
+    client = clients.resource('dynamodb').meta.client
+    # Small index pages, so the songs are read across several of them
+    original_query = client.query
+    queries = []
+    
+    def paged_query(**kwargs):
+        queries.append(kwargs)
+        return original_query(**dict(kwargs, Limit=25))
+    
+    monkeypatch.setattr(client, 'query', paged_query)
+    writes = spy(monkeypatch, client, 'batch_write_item')
+    
+    deletion = cascade.CascadeDelete()
+    assert len(deletion.collect_album('album-1')) == 60
+    deletion.run()
+    
+    assert len(queries) == 3
+    assert sorted(len(call['RequestItems']['catalog']) for call in writes) == [10, 25, 25]
+    assert (deletion.deleted_items, deletion.deleted_objects) == (60, 60)
+    assert sorted(remaining(tables)) == ['SONG#other-0000', 'SONG#other-0001', 'SONG#other-0002']
+    assert objects(bucket) == 3
+
+
+def test_unprocessed_items_are_retried(tables, bucket, monkeypatch):
+    add_songs(tables, bucket, 30)
+    client = clients.resource('dynamodb').meta.client
+    
+    def first_call_unprocessed(number, kwargs, response):
+        if number > 1:
+            return response
+        # DynamoDB processed none of the first batch: write it back and report it
+        requests = kwargs['RequestItems']['catalog']
+        for request in requests:
+            tables.put_item(Item={**request['DeleteRequest']['Key'], 'entity_type': 'SONG'})
+        return {**response, 'UnprocessedItems': {'catalog': requests}}
+    
+    writes = spy(monkeypatch, client, 'batch_write_item', first_call_unprocessed)
+    deletion = cascade.CascadeDelete(max_workers=1)
+    deletion.collect_album('album-1')
+    deletion.run()
+    assert len(writes) == 3
+    assert remaining(tables) == []
+
+
+def test_audio_files_are_deleted_1000_per_call(tables, bucket, monkeypatch):
+    add_songs(tables, bucket, 1001)
+    deletes = spy(monkeypatch, clients.s3(), 'delete_objects')
+    deletion = cascade.CascadeDelete()
+    deletion.collect_album('album-1')
+    deletion.run()
+    assert sorted(len(call['Delete']['Objects']) for call in deletes) == [1, 1000]
+    assert (deletion.deleted_objects, deletion.failed_objects) == (1001, [])
+    assert objects(bucket) == 0
+
+
+def test_rerun_deletes_nothing_more(tables, bucket):
+    tables.put_item(Item={'pk': 'ALBUM#album-1', 'sk': 'METADATA', 'entity_type': 'ALBUM', 'album_id': 'album-1', 'artist_id': 'artist-1', 'artist_albums': 'artist-1', 'created_at': '2024-01-01T00:00:00'})
+    add_songs(tables, bucket, 5)
+    add_songs(tables, bucket, 2, album_id=None, prefix='single')
+    
+    first = cascade.CascadeDelete()
+    first.collect_artist('artist-1')
+    assert (first.count('ALBUM'), first.count('SONG')) == (1, 7)
+    # The same cascade run twice, e.g. by a redelivered job
+    first.run()
+    first.run()
+    assert remaining(tables) == []
+    assert objects(bucket) == 0
+    
+    second = cascade.CascadeDelete()
+    second.collect_artist('artist-1')
+    second.run()
+    assert (second.deleted_items, second.deleted_objects) == (0, 0)
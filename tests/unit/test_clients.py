@@ -0,0 +1,47 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from common import clients
+
+
+@pytest.fixture
+def built(monkeypatch):
+    """(service name, config) of each client built through boto3."""
+    calls = []
+    
+    def client(service_name, config=None):
+        calls.append((service_name, config))
+        return object()
+    
+    monkeypatch.setattr(clients, '_clients', {})
+    monkeypatch.setattr(clients, '_resources', {})
+    monkeypatch.setattr(clients, '_tables', {})
+    monkeypatch.setattr(clients.boto3, 'client', client)
+    return calls
+
+
+def test_clients_are_built_on_first_use(built):
+    assert built == []
+    s3 = clients.s3()
+    assert clients.s3() is s3 and clients.client('s3') is s3
+    clients.ses()
+    assert [service_name for service_name, _ in built] == ['s3', 'ses']
+    assert all(config.max_pool_connections == clients.MAX_POOL_CONNECTIONS for _, config in built)
+
+
+def test_concurrent_first_use_builds_one_client(built):
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        found = {id(client) for client in executor.map(lambda _: clients.client('sqs'), range(32))}
+    assert len(found) == 1
+    assert len(built) == 1
+
+
+def test_tables_are_cached_per_environment_variable(built, monkeypatch):
+    monkeypatch.setenv('TABLE_NAME', 'catalog')
+    monkeypatch.setenv('SUBSCRIPTIONS_TABLE_NAME', 'subscriptions')
+    assert clients.table().name == 'catalog'
+    assert clients.table() is clients.table()
+    assert clients.subscriptions_table().name == 'subscriptions'
+    # Both tables share one resource
+    assert list(clients._resources) == ['dynamodb']
@@ -0,0 +1,99 @@
+import importlib.util
+import os
+
+from common import clients, wire
+
+# Stream handlers are deployed from lambda/streams, outside the layer
+_spec = importlib.util.spec_from_file_location(
+    'counters', os.path.join(os.path.dirname(__file__), '..', '..', 'lambda', 'streams', 'counters.py')
+)
+counters = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(counters)
+
+
+def record(event_id, seq, event_name, item):
+    image = 'NewImage' if event_name == 'INSERT' else 'OldImage'
+    return {
+        'eventID': event_id,
+        'eventName': event_name,
+        'dynamodb': {
+            'Keys': wire.to_wire({'pk': item['pk'], 'sk': item['sk']}),
+            image: wire.to_wire(item),
+            'SequenceNumber': str(seq)
+        }
+    }
+
+
+def song(song_id, album_id='album-1'):
+    return {'pk': f'SONG#{song_id}', 'sk': 'METADATA', 'entity_type': 'SONG', 'album_id': album_id, 'artist_id': 'artist-1'}
+
+
+def album(album_id):
+    return {'pk': f'ALBUM#{album_id}', 'sk': 'METADATA', 'entity_type': 'ALBUM', 'artist_id': 'artist-1'}
+
+
+def add_parents(table):
+    for pk in ('ALBUM#album-1', 'ALBUM#album-2', 'ARTIST#artist-1'):
+        table.put_item(Item={'pk': pk, 'sk': 'METADATA'})
+
+
+def totals(table, pk):
+    item = table.get_item(Key={'pk': pk, 'sk': 'METADATA'}).get('Item')
+    return item and (item.get('total_songs', 0), item.get('total_albums', 0))
+
+
+def test_inserts_and_removals_update_parent_counters(tables):
+    add_parents(tables)
+    counters.handler({'Records': [
+        record('e1', 101, 'INSERT', song('s1')),
+        record('e2', 102, 'INSERT', song('s2')),
+        record('e3', 103, 'INSERT', song('s3', 'album-2')),
+        record('e4', 104, 'INSERT', album('album-2')),
+        record('e5', 105, 'REMOVE', song('s1'))
+    ]}, None)
+    assert totals(tables, 'ALBUM#album-1') == (1, 0)
+    assert totals(tables, 'ALBUM#album-2') == (1, 0)
+    assert totals(tables, 'ARTIST#artist-1') == (2, 1)
+
+
+def test_retried_batch_is_applied_once(tables):
+    add_parents(tables)
+    batch = {'Records': [record('e1', 101, 'INSERT', song('s1')), record('e2', 102, 'INSERT', song('s2'))]}
+    counters.handler(batch, None)
+    outcomes = counters.handler(batch, None)
+    assert outcomes['duplicate'] == 2
+    assert totals(tables, 'ARTIST#artist-1') == (2, 0)
+
+
+def test_retry_with_more_records_applies_only_the_new_ones(tables):
+    add_parents(tables)
+    first = [record('e1', 101, 'INSERT', song('s1')), record('e2', 102, 'INSERT', song('s2'))]
+    counters.handler({'Records': first}, None)
+    # Lambda retries from the same first record, possibly with a larger batch
+    counters.handler({'Records': first + [record('e3', 103, 'INSERT', song('s3'))]}, None)
+    assert totals(tables, 'ALBUM#album-1') == (3, 0)
+    assert totals(tables, 'ARTIST#artist-1') == (3, 0)
+    ledger = tables.get_item(Key=counters.ledger_key('ARTIST#artist-1', 'e1'))['Item']
+    assert ledger['last_seq'] == 103
+    assert 'expires_at' in ledger
+
+
+def test_changes_that_cancel_out_write_nothing(tables):
+    add_parents(tables)
+    outcomes = counters.handler({'Records': [
+        record('e1', 101, 'INSERT', song('s1')),
+        record('e2', 102, 'REMOVE', song('s1'))
+    ]}, None)
+    assert outcomes['unchanged'] == 2
+    assert not clients.table().get_item(Key=counters.ledger_key('ALBUM#album-1', 'e1')).get('Item')
+
+
+def test_deleted_parent_is_not_recreated(tables, monkeypatch):
+    # moto rolls a cancelled transaction back over concurrent ones; apply the
+    # parents one at a time so the artist's update is not undone
+    monkeypatch.setattr(counters, 'MAX_WORKERS', 1)
+    tables.put_item(Item={'pk': 'ARTIST#artist-1', 'sk': 'METADATA'})
+    outcomes = counters.handler({'Records': [record('e1', 101, 'REMOVE', song('s1'))]}, None)
+    assert outcomes['missing'] == 1
+    assert totals(tables, 'ALBUM#album-1') is None
+    assert totals(tables, 'ARTIST#artist-1') == (-1, 0)
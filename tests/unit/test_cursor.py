@@ -0,0 +1,105 @@
+import base64
+import json
+
+import pytest
+from botocore.stub import Stubber
+
+from common import clients, cursor, signing
+from common.cursor import InvalidCursor
+
+SCOPE = 'songs'
+
+SHARD_CURSOR = {
+    'SONG#3': {
+        'pk': 'SONG#0d6f3a52-3a8e-4a4e-9a43-6b7f0f1a2b3c',
+        'sk': 'METADATA',
+        'entity_shard': 'SONG#3',
+        'created_at': '2024-05-01T12:30:45.123456'
+    },
+    'SONG#9': None
+}
+
+
+@pytest.fixture(autouse=True)
+def signing_key(monkeypatch):
+    monkeypatch.delenv('CURSOR_SECRET_ARN', raising=False)
+    monkeypatch.delenv('CURSOR_SECRET_PREVIOUS', raising=False)
+    monkeypatch.setenv('CURSOR_SECRET', 'current-key')
+    signing._cached_keys.clear()
+    yield
+    signing._cached_keys.clear()
+
+
+def test_round_trip():
+    values = [
+        {'pk': 'ALBUM#1', 'sk': 'METADATA', 'album_id': 'not-a-uuid', 'track_number': 7},
+        SHARD_CURSOR,
+        {'served': 40, 'negative': -3, 'flag': True, 'other': False, 'list': ['a', None, 1]},
+        {'created_at': '2024-05-01T12:30:45', 'text': 'ünïcode'}
+    ]
+    for value in values:
+        assert cursor.decode(cursor.encode(value, SCOPE), SCOPE) == value
+
+
+def test_none_means_no_more_pages():
+    assert cursor.encode(None, SCOPE) is None
+
+
+def test_cursor_is_compact_and_url_safe():
+    token = cursor.encode(SHARD_CURSOR, SCOPE)
+    # UUIDs, timestamps, shard keys and key names are packed
+    assert len(token) < len(base64.urlsafe_b64encode(json.dumps(SHARD_CURSOR).encode('utf-8'))) / 2
+    assert set(token) <= set('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_')
+
+
+def test_cursor_is_bound_to_its_scope():
+    token = cursor.encode(SHARD_CURSOR, SCOPE)
+    with pytest.raises(InvalidCursor):
+        cursor.decode(token, 'albums')
+
+
+def test_tampered_cursor_is_rejected():
+    raw = bytearray(base64.urlsafe_b64decode(cursor.encode(SHARD_CURSOR, SCOPE) + '=='))
+    raw[3] ^= 0x01
+    token = base64.urlsafe_b64encode(bytes(raw)).rstrip(b'=').decode('ascii')
+    with pytest.raises(InvalidCursor):
+        cursor.decode(token, SCOPE)
+
+
+@pytest.mark.parametrize('token', ['', 'AA', 'not base64!', 'x' * 40])
+def test_malformed_cursor_is_rejected(token):
+    with pytest.raises(InvalidCursor):
+        cursor.decode(token, SCOPE)
+
+
+def test_previous_key_still_verifies(monkeypatch):
+    token = cursor.encode(SHARD_CURSOR, SCOPE)
+    monkeypatch.setenv('CURSOR_SECRET', 'rotated-key')
+    monkeypatch.setenv('CURSOR_SECRET_PREVIOUS', 'current-key')
+    signing._cached_keys.clear()
+    assert cursor.decode(token, SCOPE) == SHARD_CURSOR
+    assert cursor.encode(SHARD_CURSOR, SCOPE) != token
+
+
+def test_key_is_read_from_secrets_manager_once(monkeypatch):
+    monkeypatch.setenv('CURSOR_SECRET_ARN', 'arn:aws:secretsmanager:us-east-1:123456789012:secret:cursor')
+    with Stubber(clients.client('secretsmanager')) as stubber:
+        stubber.add_response(
+            'get_secret_value',
+            {'SecretString': 'secret-key'},
+            {'SecretId': 'arn:aws:secretsmanager:us-east-1:123456789012:secret:cursor', 'VersionStage': 'AWSCURRENT'}
+        )
+        stubber.add_client_error(
+            'get_secret_value',
+            'ResourceNotFoundException',
+            expected_params={'SecretId': 'arn:aws:secretsmanager:us-east-1:123456789012:secret:cursor', 'VersionStage': 'AWSPREVIOUS'}
+        )
+        token = cursor.encode(SHARD_CURSOR, SCOPE)
+        assert cursor.decode(token, SCOPE) == SHARD_CURSOR
+        stubber.assert_no_pending_responses()
+    
+    # Signed with the secret, not the CURSOR_SECRET fallback
+    monkeypatch.delenv('CURSOR_SECRET_ARN')
+    signing._cached_keys.clear()
+    with pytest.raises(InvalidCursor):
+        cursor.decode(token, SCOPE)
@@ -0,0 +1,101 @@
+import json
+
+import pytest
+
+from common import digests, notifications
+from common.messaging import get_queue
+
+ARTIST_ID = 'artist-1'
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    monkeypatch.setenv(notifications.QUEUE_ENV, 'local://test-digests')
+    queue = get_queue(notifications.QUEUE_ENV)
+    queue.messages.clear()
+    return queue
+
+
+def event(event_type, title, album_title=None):
+    template_data = {'event_title': title, 'artist_name': 'Artist', 'app_url': 'https://example.com'}
+    if album_title:
+        template_data['album_title'] = album_title
+    return {
+        'event_type': event_type,
+        'content_title': title,
+        'template': f'{event_type}-template',
+        'template_data': template_data
+    }
+
+
+def messages(queue):
+    return [json.loads(message['body']) for message in queue.messages]
+
+
+def test_first_event_opens_the_digest_and_schedules_it(tables, queue):
+    digest = digests.add(ARTIST_ID, 'event-1', event('album_created', 'Album'), window=300)
+    digests.add(ARTIST_ID, 'event-2', event('song_created', 'Track 1'), window=300)
+    assert messages(queue) == [{'release_id': digest['digest_id'], 'artist_id': ARTIST_ID, 'action': 'digest'}]
+    assert digests.get(ARTIST_ID)['event_count'] == 2
+
+
+def test_retried_event_is_added_once(tables, queue):
+    digests.add(ARTIST_ID, 'event-1', event('song_created', 'Track 1'), window=300)
+    digests.add(ARTIST_ID, 'event-2', event('song_created', 'Track 2'), window=300)
+    digests.add(ARTIST_ID, 'event-2', event('song_created', 'Track 2'), window=300)
+    assert digests.get(ARTIST_ID)['event_count'] == 2
+    # The opening event schedules its message again when retried
+    digests.add(ARTIST_ID, 'event-1', event('song_created', 'Track 1'), window=300)
+    assert len(queue.messages) == 2
+
+
+def test_full_digest_sends_events_on_their_own(tables, queue, monkeypatch):
+    monkeypatch.setattr(digests, 'MAX_EVENTS', 2)
+    digests.add(ARTIST_ID, 'event-1', event('song_created', 'Track 1'), window=300)
+    digests.add(ARTIST_ID, 'event-2', event('song_created', 'Track 2'), window=300)
+    assert digests.add(ARTIST_ID, 'event-3', event('song_created', 'Track 3'), window=300) is None
+
+
+def test_close_turns_the_digest_into_one_release(tables, queue):
+    digest = digests.add(ARTIST_ID, 'event-1', event('song_created', 'Track 1', album_title='Album'), window=300)
+    digests.add(ARTIST_ID, 'event-2', event('album_created', 'Album'), window=300)
+    release = digests.close(ARTIST_ID, digest['digest_id'])
+    assert release['event_type'] == digests.DIGEST_EVENT_TYPE
+    assert release['template_data']['release_count'] == '2'
+    assert [entry['content_title'] for entry in release['template_data']['releases']] == ['Album', 'Track 1']
+    assert digests.get(ARTIST_ID) is None
+    
+    # A redelivered message resumes the same release
+    assert digests.close(ARTIST_ID, digest['digest_id'])['release_id'] == release['release_id']
+    # Later events open the next digest
+    assert digests.add(ARTIST_ID, 'event-3', event('song_created', 'Track 2'), window=300)['digest_id'] != digest['digest_id']
+
+
+def test_single_event_keeps_its_template(tables, queue):
+    digest = digests.add(ARTIST_ID, 'event-1', event('song_created', 'Track 1'), window=300)
+    release = digests.close(ARTIST_ID, digest['digest_id'])
+    assert (release['event_type'], release['template']) == ('song_created', 'song_created-template')
+
+
+def test_close_includes_an_event_added_meanwhile(tables, queue, monkeypatch):
+    digest = digests.add(ARTIST_ID, 'event-1', event('song_created', 'Track 1'), window=300)
+    read = digests.get
+    
+    def read_then_add(artist_id):
+        current = read(artist_id)
+        if current and current['event_count'] == 1:
+            digests.add(ARTIST_ID, 'event-2', event('song_created', 'Track 2'), window=300)
+        return current
+    
+    monkeypatch.setattr(digests, 'get', read_then_add)
+    release = digests.close(ARTIST_ID, digest['digest_id'])
+    assert release['template_data']['release_count'] == '2'
+
+
+def test_long_digest_lists_the_first_releases():
+    events = [event('song_created', f'Track {number}') for number in range(30)] + [event('album_created', 'Album')]
+    event_type, _, template_data = digests.content(events)
+    assert event_type == digests.DIGEST_EVENT_TYPE
+    assert template_data['releases'][0] == {'kind': 'Album', 'content_title': 'Album'}
+    assert len(template_data['releases']) == digests.MAX_LISTED_RELEASES
+    assert template_data['more_releases'] == str(31 - digests.MAX_LISTED_RELEASES)
@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from common import clients, feed
+
+USER_ID = 'user-1'
+
+
+@pytest.fixture
+def catalog(tables):
+    feed._pull_artists.clear()
+    yield tables
+    feed._pull_artists.clear()
+
+
+def minutes_ago(minutes):
+    return (datetime.utcnow() - timedelta(minutes=minutes)).isoformat()
+
+
+def follow(*artist_ids, muted=(), user_id=USER_ID):
+    with clients.subscriptions_table().batch_writer() as batch:
+        for number, artist_id in enumerate(artist_ids):
+            batch.put_item(Item={
+                'user_id': user_id,
+                'artist_id': artist_id,
+                'notification_enabled': artist_id not in muted,
+                'subscription_date': minutes_ago(10000 - number)
+            })
+
+
+def release(table, artist_id, count, start=0, push_to=()):
+    """`count` songs of the artist, one a minute; pushed to the `push_to` users' feeds."""
+    entries = []
+    for number in range(start, start + count):
+        song_id = f'{artist_id}-song-{number}'
+        created_at = minutes_ago(1000 - number * 7 - len(artist_id))
+        table.put_item(Item={
+            'pk': f'SONG#{song_id}',
+            'sk': 'METADATA',
+            'entity_type': 'SONG',
+            'title': f'Song {number}',
+            'artist_id': artist_id,
+            'artist_name': artist_id.title(),
+            'created_at': created_at
+        })
+        entries.append(feed.entry('SONG', song_id, f'Song {number}', artist_id, artist_id.title(), created_at))
+    if push_to:
+        feed.push(list(push_to), entries)
+    return entries
+
+
+def read_all(limit, user_id=USER_ID):
+    entries, position = [], None
+    while True:
+        page, position = feed.page(user_id, limit, position)
+        assert len(page) <= limit
+        entries += page
+        if position is None:
+            return entries
+
+
+def ids(entries):
+    return [entry['content_id'] for entry in entries]
+
+
+def newest_first(entries):
+    keys = [(entry['created_at'], entry['content_id']) for entry in entries]
+    return keys == sorted(keys, reverse=True)
+
+
+def test_feed_merges_pushed_and_pulled_artists(catalog):
+    follow('small', 'large', 'muted', muted=('muted',))
+    feed.add_pull_artist('large')
+    expected = release(catalog, 'small', 6, push_to=[USER_ID])
+    expected += release(catalog, 'large', 5)
+    expected += release(catalog, 'muted', 4)
+    for limit in (1, 4, 50):
+        entries = read_all(limit)
+        assert sorted(ids(entries)) == sorted(ids(expected))
+        assert newest_first(entries)
+
+
+def test_entries_both_pushed_and_pulled_appear_once(catalog):
+    # The user muted the artist after its releases were pushed
+    follow('small', muted=('small',))
+    expected = release(catalog, 'small', 5, push_to=[USER_ID])
+    assert sorted(ids(read_all(2))) == sorted(ids(expected))
+
+
+def test_unfollowed_artists_are_dropped(catalog):
+    follow('small')
+    expected = release(catalog, 'small', 3, push_to=[USER_ID])
+    release(catalog, 'gone', 3, push_to=[USER_ID])
+    assert sorted(ids(read_all(10))) == sorted(ids(expected))
+
+
+def test_pushed_entries_of_every_followed_artist_are_kept(catalog):
+    followed = [f'artist-{number:04d}' for number in range(1005)]
+    follow(*followed)
+    # Subscriptions are read in artist_id order; these come last
+    expected = release(catalog, 'artist-1004', 3, push_to=[USER_ID])
+    assert sorted(ids(read_all(10))) == sorted(ids(expected))
+
+
+def test_feed_is_bounded(catalog, monkeypatch):
+    monkeypatch.setattr(feed, 'MAX_FEED_ENTRIES', 7)
+    follow('small')
+    release(catalog, 'small', 12, push_to=[USER_ID])
+    assert len(read_all(3)) == 7
+
+
+def test_feed_pages_past_an_unfollowed_prolific_artist(catalog):
+    follow('small', 'muted', muted=('muted',))
+    # Pushed before the user unfollowed it, newer than everything else
+    release(catalog, 'prolific', 40, start=100, push_to=[USER_ID])
+    expected = release(catalog, 'small', 5, push_to=[USER_ID])
+    expected += release(catalog, 'muted', 5)
+    for limit in (1, 3, 50):
+        entries = read_all(limit)
+        assert sorted(ids(entries)) == sorted(ids(expected))
+        assert newest_first(entries)
+
+
+def test_remove_artist_deletes_its_pushed_entries(catalog):
+    follow('small')
+    expected = release(catalog, 'small', 3, push_to=[USER_ID])
+    release(catalog, 'gone', 30, push_to=[USER_ID])
+    assert feed.remove_artist(USER_ID, 'gone') == 30
+    remaining = catalog.query(
+        KeyConditionExpression='pk = :pk',
+        ExpressionAttributeValues={':pk': f'FEED#{USER_ID}'}
+    )['Items']
+    assert sorted(item['entry']['content_id'] for item in remaining) == sorted(ids(expected))
@@ -0,0 +1,154 @@
+import re
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+from common import clients, jobs
+from common.dynamo import TransactionCancelled
+from common.messaging import get_queue
+
+OWNER = 'worker-1'
+
+
+class FakeTable:
+    """Records update_item calls and answers get_item from `items`."""
+    
+    def __init__(self):
+        self.updates = []
+        self.items = {}
+        self.fail_condition = False
+    
+    def update_item(self, **params):
+        self.updates.append(params)
+        if self.fail_condition:
+            raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': ''}}, 'UpdateItem')
+        return {'Attributes': {'updated': True}}
+    
+    def get_item(self, Key, ConsistentRead=False):
+        item = self.items.get(Key['pk'])
+        return {'Item': item} if item else {}
+
+
+@pytest.fixture
+def table(monkeypatch):
+    fake = FakeTable()
+    monkeypatch.setattr(clients, 'table', lambda: fake)
+    return fake
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    monkeypatch.setenv('JOBS_QUEUE_URL', 'local://test-jobs')
+    queue = get_queue()
+    queue.messages.clear()
+    return queue
+
+
+def clauses(params):
+    """The SET, ADD and REMOVE clauses of an update as {clause: {attribute: value}}."""
+    names = params['ExpressionAttributeNames']
+    values = params['ExpressionAttributeValues']
+    result = {}
+    for clause in re.split(r' (?=SET |ADD |REMOVE )', params['UpdateExpression']):
+        keyword, body = clause.split(' ', 1)
+        result[keyword] = {}
+        for part in body.split(', '):
+            operands = part.replace(' = ', ' ').split(' ')
+            result[keyword][names[operands[0]]] = values[operands[1]] if len(operands) > 1 else None
+    return result
+
+
+def test_new_job_starts_queued_with_zero_counters():
+    job = jobs.new_job('delete_album', 'album-1', created_by='user-1')
+    assert job['pk'] == f"JOB#{job['job_id']}"
+    assert job['status'] == jobs.QUEUED
+    assert job['seq'] == 0
+    assert all(job[counter] == 0 for counter in jobs.COUNTERS)
+    assert job['created_by'] == 'user-1'
+
+
+def test_acquire_requires_same_seq_and_free_lease(table):
+    job = jobs.new_job('delete_album', 'album-1')
+    jobs.acquire(job, OWNER, lease_seconds=60)
+    (update,) = table.updates
+    assert update['ConditionExpression'].startswith('#seq = :seq AND')
+    assert 'lease_expires < :now' in update['ConditionExpression']
+    assert update['ExpressionAttributeValues'][':seq'] == 0
+    assert update['ExpressionAttributeValues'][':owner'] == OWNER
+    sets = clauses(update)['SET']
+    assert sets['status'] == jobs.RUNNING
+    assert sets['lease_owner'] == OWNER
+    assert sets['lease_expires'] >= int(time.time()) + 59
+
+
+def test_lease_held_elsewhere_raises_stale_job(table):
+    table.fail_condition = True
+    with pytest.raises(jobs.StaleJob):
+        jobs.acquire(jobs.new_job('delete_album', 'album-1'), OWNER, lease_seconds=60)
+
+
+def test_advance_bumps_seq_and_adds_counters(table):
+    job = dict(jobs.new_job('delete_album', 'album-1'), seq=4)
+    jobs.advance(job, OWNER, counters={'items_deleted': 25}, phase='songs', checkpoint={'pk': 'SONG#1'})
+    (update,) = table.updates
+    changes = clauses(update)
+    assert changes['SET']['seq'] == 5
+    assert changes['SET']['phase'] == 'songs'
+    assert changes['ADD'] == {'items_deleted': 25}
+    assert 'REMOVE' not in changes
+    assert update['ConditionExpression'] == '#seq = :seq AND lease_owner = :owner'
+    assert update['ExpressionAttributeValues'][':seq'] == 4
+
+
+def test_advance_keeps_at_most_max_errors(table):
+    job = dict(jobs.new_job('delete_album', 'album-1'), errors=['e'] * (jobs.MAX_ERRORS - 2))
+    jobs.advance(job, OWNER, errors=['a', 'b', 'c', 'd'])
+    changes = clauses(table.updates[0])
+    assert changes['SET']['errors'] == ['e'] * (jobs.MAX_ERRORS - 2) + ['a', 'b']
+    assert changes['ADD']['error_count'] == 4
+
+
+def test_finishing_releases_the_lease_and_expires_the_job(table):
+    jobs.advance(jobs.new_job('delete_album', 'album-1'), OWNER, status=jobs.SUCCEEDED, checkpoint=None)
+    changes = clauses(table.updates[0])
+    assert changes['SET']['finished_at'] == changes['SET']['updated_at']
+    assert changes['SET']['expires_at'] > time.time() + (jobs.JOB_TTL_DAYS - 1) * 86400
+    assert set(changes['REMOVE']) == {'lease_owner', 'lease_expires'}
+
+
+def test_stale_advance_raises(table):
+    table.fail_condition = True
+    with pytest.raises(jobs.StaleJob):
+        jobs.advance(jobs.new_job('delete_album', 'album-1'), OWNER, counters={'items_deleted': 1})
+
+
+def test_start_deletion_queues_the_job(table, queue, monkeypatch):
+    transactions = []
+    monkeypatch.setattr(jobs, 'transact_write', lambda actions, token=None: transactions.append((actions, token)))
+    job = jobs.start_deletion('delete_album', {'pk': 'ALBUM#1', 'sk': 'METADATA'}, '1')
+    ((put, marker), token), = transactions
+    assert put['Put']['Item'] is job
+    assert marker['Update']['ExpressionAttributeValues'] == {':job_id': job['job_id']}
+    assert token == job['job_id']
+    assert [message['body'] for message in queue.messages] == [f'{{"job_id": "{job["job_id"]}"}}']
+
+
+def cancelled_by_marker(actions, token=None):
+    raise TransactionCancelled(['None', 'ConditionalCheckFailed'])
+
+
+@pytest.mark.parametrize('status, resent', [(jobs.RUNNING, 0), (jobs.QUEUED, 1)])
+def test_repeated_deletion_returns_the_job_under_way(table, queue, monkeypatch, status, resent):
+    monkeypatch.setattr(jobs, 'transact_write', cancelled_by_marker)
+    table.items['ALBUM#1'] = {'pk': 'ALBUM#1', 'sk': 'METADATA', 'deletion_job': 'job-1'}
+    table.items['JOB#job-1'] = {'pk': 'JOB#job-1', 'sk': 'METADATA', 'job_id': 'job-1', 'status': status}
+    job = jobs.start_deletion('delete_album', {'pk': 'ALBUM#1', 'sk': 'METADATA'}, '1')
+    assert job['job_id'] == 'job-1'
+    assert len(queue.messages) == resent
+
+
+def test_deletion_of_missing_target_returns_none(table, queue, monkeypatch):
+    monkeypatch.setattr(jobs, 'transact_write', cancelled_by_marker)
+    assert jobs.start_deletion('delete_album', {'pk': 'ALBUM#1', 'sk': 'METADATA'}, '1') is None
+    assert not queue.messages
@@ -0,0 +1,182 @@
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+from common import mailer
+from common.mailer import Mailer, TokenBucket
+
+
+class FakeClock:
+    """A clock that only moves when the bucket sleeps."""
+    
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+    
+    def __call__(self):
+        return self.now
+    
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def client_error(code, status=400):
+    return ClientError({'Error': {'Code': code, 'Message': code}, 'ResponseMetadata': {'HTTPStatusCode': status}}, 'SendEmail')
+
+
+class FakeSes:
+    """SendEmail that raises the scripted error of each address, one per call, then succeeds."""
+    
+    def __init__(self, errors=None):
+        self.errors = {recipient: list(codes) for recipient, codes in (errors or {}).items()}
+        self.sent = []
+    
+    def send_email(self, Source, Destination, Message):
+        (recipient,) = Destination['ToAddresses']
+        if self.errors.get(recipient):
+            raise self.errors[recipient].pop(0)
+        self.sent.append(recipient)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(mailer, '_backoff', lambda attempt: None)
+
+
+def test_bucket_allows_a_burst_of_its_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(10, capacity=5, clock=clock, sleep=clock.sleep)
+    for _ in range(5):
+        bucket.acquire()
+    assert clock.sleeps == []
+
+
+def test_bucket_keeps_to_the_rate_after_the_burst():
+    clock = FakeClock()
+    bucket = TokenBucket(10, capacity=5, clock=clock, sleep=clock.sleep)
+    for _ in range(25):
+        bucket.acquire()
+    # 5 from the burst, then 20 at 10 per second
+    assert clock.now - 100.0 == pytest.approx(2.0)
+
+
+def test_bucket_paces_requests_larger_than_its_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(10, capacity=10, clock=clock, sleep=clock.sleep)
+    bucket.acquire(50)
+    bucket.acquire(50)
+    assert clock.now - 100.0 == pytest.approx(9.0)
+
+
+def test_bucket_refills_while_idle_up_to_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(10, capacity=5, clock=clock, sleep=clock.sleep)
+    bucket.acquire(5)
+    clock.now += 60
+    bucket.acquire(5)
+    assert clock.sleeps == []
+    bucket.acquire(1)
+    assert clock.sleeps == [pytest.approx(0.1)]
+
+
+def test_send_all_retries_throttling():
+    ses = FakeSes({'a@example.com': [client_error('Throttling'), client_error('ServiceUnavailable', 503)]})
+    with Mailer(source='noreply@example.com', rate=1000, ses=ses) as sender:
+        sender.send_all(['a@example.com', 'b@example.com'], 'Subject', '<p>Hi</p>')
+    assert sorted(ses.sent) == ['a@example.com', 'b@example.com']
+    assert (sender.sent, sender.failed, sender.retries, sender.calls) == (2, 0, 2, 4)
+
+
+def test_rejected_address_fails_without_retry():
+    ses = FakeSes({'bad@example.com': [client_error('MessageRejected')]})
+    with Mailer(source='noreply@example.com', rate=1000, ses=ses) as sender:
+        sender.send_all(['bad@example.com'], 'Subject', '<p>Hi</p>')
+    assert (sender.sent, sender.failed, sender.retries) == (0, 1, 0)
+    assert sender.failed_recipients == ['bad@example.com']
+    assert sender.retryable == []
+
+
+def test_still_throttled_recipient_is_kept_for_later():
+    ses = FakeSes({'a@example.com': [client_error('Throttling')] * 3})
+    with Mailer(source='noreply@example.com', rate=1000, ses=ses, max_attempts=3) as sender:
+        sender.send_all(['a@example.com'], 'Subject', '<p>Hi</p>')
+    assert (sender.sent, sender.failed, sender.retries) == (0, 1, 2)
+    assert sender.retryable == ['a@example.com']
+
+
+def test_nothing_is_sent_past_the_deadline():
+    ses = FakeSes()
+    with Mailer(source='noreply@example.com', rate=1000, ses=ses, deadline=0) as sender:
+        sender.send_all(['a@example.com', 'b@example.com'], 'Subject', '<p>Hi</p>')
+    assert ses.sent == []
+    assert sorted(sender.unsent) == ['a@example.com', 'b@example.com']
+
+
+class FakeBulkSes:
+    """SendBulkTemplatedEmail answering each address with its scripted statuses, one per call, then Success."""
+    
+    def __init__(self, statuses=None, errors=()):
+        self.statuses = {recipient: list(values) for recipient, values in (statuses or {}).items()}
+        self.errors = list(errors)
+        self.calls = []
+    
+    def send_bulk_templated_email(self, Source, Template, DefaultTemplateData, Destinations):
+        recipients = [destination['Destination']['ToAddresses'][0] for destination in Destinations]
+        self.calls.append((recipients, Destinations))
+        if self.errors:
+            raise self.errors.pop(0)
+        return {'Status': [
+            {'Status': self.statuses[recipient].pop(0) if self.statuses.get(recipient) else 'Success'}
+            for recipient in recipients
+        ]}
+
+
+def addresses(count):
+    return [f'user-{number}@example.com' for number in range(count)]
+
+
+def test_bulk_send_batches_destinations():
+    ses = FakeBulkSes()
+    with Mailer(source='noreply@example.com', rate=1000, ses=ses) as sender:
+        sender.send_bulk(addresses(120), 'song_release', {'title': 'Song'}, lambda recipient: {'email': recipient})
+    assert sorted(len(recipients) for recipients, _ in ses.calls) == [20, 50, 50]
+    assert (sender.sent, sender.failed, sender.calls) == (120, 0, 3)
+    _, destinations = ses.calls[0]
+    assert json.loads(destinations[0]['ReplacementTemplateData']) == {'email': destinations[0]['Destination']['ToAddresses'][0]}
+
+
+def test_bulk_send_retries_only_failed_destinations():
+    ses = FakeBulkSes({'user-1@example.com': ['AccountThrottled'], 'user-2@example.com': ['MessageRejected']})
+    with Mailer(source='noreply@example.com', rate=1000, ses=ses) as sender:
+        sender.send_bulk(addresses(4), 'song_release', {'title': 'Song'})
+    assert [recipients for recipients, _ in ses.calls] == [addresses(4), ['user-1@example.com']]
+    assert (sender.sent, sender.failed, sender.retries) == (3, 1, 1)
+    assert sender.failed_recipients == ['user-2@example.com']
+    assert sender.retryable == []
+
+
+def test_bulk_send_retries_a_throttled_call():
+    ses = FakeBulkSes(errors=[client_error('Throttling')])
+    with Mailer(source='noreply@example.com', rate=1000, ses=ses) as sender:
+        sender.send_bulk(addresses(3), 'song_release', {'title': 'Song'})
+    assert len(ses.calls) == 2
+    assert (sender.sent, sender.failed, sender.retries) == (3, 0, 1)
+
+
+def test_bulk_destinations_failing_every_attempt_are_kept_for_later():
+    ses = FakeBulkSes({'user-0@example.com': ['TransientFailure'] * 3})
+    with Mailer(source='noreply@example.com', rate=1000, ses=ses, max_attempts=3) as sender:
+        sender.send_bulk(addresses(2), 'song_release', {'title': 'Song'})
+    assert (sender.sent, sender.failed) == (1, 1)
+    assert sender.retryable == ['user-0@example.com']
+
+
+def test_bulk_send_takes_a_token_per_destination():
+    clock = FakeClock()
+    bucket = TokenBucket(10, capacity=10, clock=clock, sleep=clock.sleep)
+    with Mailer(source='noreply@example.com', ses=FakeBulkSes(), bucket=bucket, max_workers=1) as sender:
+        sender.send_bulk(addresses(60), 'song_release', {'title': 'Song'})
+    # 10 from the burst, then 50 at 10 per second
+    assert clock.now - 100.0 == pytest.approx(5.0)
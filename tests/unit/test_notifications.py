@@ -0,0 +1,163 @@
+import json
+
+import pytest
+
+from common import clients, notifications, sharding
+from common.messaging import get_queue
+
+ARTIST_ID = 'artist-1'
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    monkeypatch.setenv(notifications.QUEUE_ENV, 'local://test-notifications')
+    queue = get_queue(notifications.QUEUE_ENV)
+    queue.messages.clear()
+    return queue
+
+
+def subscribe(count, muted=0):
+    with clients.subscriptions_table().batch_writer() as batch:
+        for number in range(count + muted):
+            subscription = {
+                'user_id': f'user-{number:04d}',
+                'artist_id': ARTIST_ID,
+                'user_email': f'user-{number:04d}@example.com',
+                'subscription_date': f'2024-01-01T00:00:{number % 60:02d}',
+                'artist_shard': ARTIST_ID,
+                'notification_enabled': number < count
+            }
+            if number < count:
+                # Only subscriptions with notifications on are in the sparse index
+                subscription['notify_artist'] = ARTIST_ID
+            batch.put_item(Item=subscription)
+
+
+def start_release(release_id='release-1'):
+    return notifications.start(release_id, ARTIST_ID, 'new_song', 'song_release', {'title': 'Song'})
+
+
+def queued_chunks(queue):
+    return [json.loads(message['body']) for message in queue.messages]
+
+
+def test_plan_queues_every_subscriber_once_in_chunks(tables, queue):
+    subscribe(120, muted=5)
+    release = notifications.plan(start_release())
+    chunks = queued_chunks(queue)
+    assert [len(chunk['recipients']) for chunk in chunks] == [50, 50, 20]
+    assert len({recipient for chunk in chunks for recipient in chunk['recipients']}) == 120
+    assert release['status'] == notifications.SENDING
+    assert (release['subscribers'], release['chunks_planned']) == (120, 3)
+
+
+def test_restarted_release_resumes_the_existing_one(tables, queue):
+    subscribe(10)
+    notifications.plan(start_release())
+    release = start_release()
+    assert release['status'] == notifications.SENDING
+    # Planning it again queues nothing more
+    notifications.plan(release)
+    assert len(queue.messages) == 1
+
+
+def test_chunk_is_leased_to_one_worker(tables, monkeypatch):
+    assert notifications.claim_chunk('release-1', '0-0', 'worker-1')
+    assert not notifications.claim_chunk('release-1', '0-0', 'worker-2')
+    
+    # The lease expires, e.g. after the first worker timed out
+    now = notifications.time.time()
+    monkeypatch.setattr(notifications.time, 'time', lambda: now + notifications.CHUNK_LEASE_SECONDS + 1)
+    assert notifications.claim_chunk('release-1', '0-0', 'worker-2')
+
+
+def test_worker_that_lost_its_lease_records_nothing(tables, queue, monkeypatch):
+    subscribe(10)
+    notifications.plan(start_release())
+    notifications.claim_chunk('release-1', '0-0', 'worker-1')
+    now = notifications.time.time()
+    monkeypatch.setattr(notifications.time, 'time', lambda: now + notifications.CHUNK_LEASE_SECONDS + 1)
+    notifications.claim_chunk('release-1', '0-0', 'worker-2')
+    
+    assert notifications.complete_chunk('release-1', '0-0', 'worker-1', sent=10) is None
+    release = notifications.complete_chunk('release-1', '0-0', 'worker-2', sent=9, failed=1)
+    assert (release['chunks_done'], release['emails_sent'], release['emails_failed']) == (1, 9, 1)
+
+
+def test_release_completes_when_every_chunk_is_done(tables, queue):
+    subscribe(60)
+    notifications.plan(start_release())
+    chunk_ids = [chunk['chunk_id'] for chunk in queued_chunks(queue)]
+    for chunk_id in chunk_ids:
+        assert notifications.claim_chunk('release-1', chunk_id, 'worker-1')
+    release = notifications.complete_chunk('release-1', chunk_ids[0], 'worker-1', sent=50)
+    assert release['status'] == notifications.SENDING
+    release = notifications.complete_chunk('release-1', chunk_ids[1], 'worker-1', sent=10)
+    assert release['status'] == notifications.COMPLETED
+    assert release['emails_sent'] == 60
+
+
+def test_done_chunk_is_not_sent_again(tables, queue, monkeypatch):
+    subscribe(10)
+    notifications.plan(start_release())
+    notifications.claim_chunk('release-1', '0-0', 'worker-1')
+    notifications.complete_chunk('release-1', '0-0', 'worker-1', sent=10)
+    now = notifications.time.time()
+    monkeypatch.setattr(notifications.time, 'time', lambda: now + notifications.CHUNK_LEASE_SECONDS + 1)
+    assert not notifications.claim_chunk('release-1', '0-0', 'worker-2')
+
+
+def test_plan_reads_every_subscriber_shard(tables, queue, monkeypatch):
+    monkeypatch.setenv(sharding.NOTIFY_ARTIST_INDEX_ENV, 'true')
+    tables.put_item(Item={**sharding.subscriber_shards_key(ARTIST_ID), 'shards': 4})
+    with clients.subscriptions_table().batch_writer() as batch:
+        for number in range(130):
+            shard = sharding.subscriber_shard(ARTIST_ID, f'user-{number:04d}', 4)
+            batch.put_item(Item={
+                'user_id': f'user-{number:04d}',
+                'artist_id': ARTIST_ID,
+                'user_email': f'user-{number:04d}@example.com',
+                'subscription_date': '2024-01-01T00:00:00',
+                'artist_shard': shard,
+                'notify_artist': shard
+            })
+    release = notifications.plan(start_release())
+    recipients = [recipient for chunk in queued_chunks(queue) for recipient in chunk['recipients']]
+    assert len(recipients) == len(set(recipients)) == 130
+    assert release['subscribers'] == 130
+
+
+def test_plan_reads_artist_id_index_until_notify_artist_index_is_backfilled(tables, queue):
+    # Subscriptions created before notify_artist, one of them muted
+    with clients.subscriptions_table().batch_writer() as batch:
+        for number, enabled in enumerate((True, None, False)):
+            subscription = {
+                'user_id': f'user-{number}',
+                'artist_id': ARTIST_ID,
+                'user_email': f'user-{number}@example.com',
+                'subscription_date': '2024-01-01T00:00:00'
+            }
+            if enabled is not None:
+                subscription['notification_enabled'] = enabled
+            batch.put_item(Item=subscription)
+    notifications.plan(start_release())
+    recipients = [recipient for chunk in queued_chunks(queue) for recipient in chunk['recipients']]
+    assert sorted(recipients) == ['user-0@example.com', 'user-1@example.com']
+
+
+def test_release_keeps_reading_the_index_it_was_pinned_to(tables, queue, monkeypatch):
+    subscribe(10)
+    
+    class Context:
+        def get_remaining_time_in_millis(self):
+            return 0
+    
+    # Pinned on artist-id-index, then handed over to the queue
+    release = notifications.plan(start_release(), Context())
+    assert release['notify_index'] is False
+    queue.messages.clear()
+    
+    monkeypatch.setenv(sharding.NOTIFY_ARTIST_INDEX_ENV, 'true')
+    release = notifications.plan(notifications.get(release['release_id']))
+    assert release['subscribers'] == 10
+    assert len(queued_chunks(queue)) == 1
@@ -0,0 +1,93 @@
+import pytest
+
+from common import pagination
+from common.pagination import ReadBudget, parse_pagination, query_page
+
+
+class FakeTable:
+    """
+    Serves a partition of items the way Query does: Limit caps the items
+    evaluated, and the filter (items with `keep` set) is applied after it.
+    """
+    
+    def __init__(self, keep):
+        self.items = [{'pk': f'SONG#{number:03}', 'sk': 'METADATA', 'keep': keep(number)} for number in range(200)]
+        self.requests = []
+    
+    def query(self, **params):
+        self.requests.append(params)
+        start = 0
+        if 'ExclusiveStartKey' in params:
+            start = next(index for index, item in enumerate(self.items) if item['pk'] == params['ExclusiveStartKey']['pk']) + 1
+        evaluated = self.items[start:start + params['Limit']]
+        response = {'Items': [dict(item) for item in evaluated if item['keep']], 'ScannedCount': len(evaluated)}
+        if start + len(evaluated) < len(self.items):
+            response['LastEvaluatedKey'] = {'pk': evaluated[-1]['pk'], 'sk': 'METADATA'}
+        if params.get('ReturnConsumedCapacity') == 'TOTAL':
+            response['ConsumedCapacity'] = {'CapacityUnits': len(evaluated) / 2}
+        return response
+
+
+def numbers(items):
+    return [int(item['pk'][5:]) for item in items]
+
+
+def test_pages_are_filled_with_exact_cursors():
+    table = FakeTable(keep=lambda number: number % 4 == 0)
+    items, last_key = query_page(table, {}, 5)
+    assert numbers(items) == [0, 4, 8, 12, 16]
+    # Each request asked only for the items still missing
+    assert [request['Limit'] for request in table.requests] == [5, 3, 3, 2, 1, 1, 1, 1]
+    assert last_key == {'pk': 'SONG#016', 'sk': 'METADATA'}
+    
+    items, _ = query_page(table, {}, 2, last_key)
+    assert numbers(items) == [20, 24]
+
+
+def test_selectivity_sizes_requests_and_the_cursor_is_rebuilt():
+    table = FakeTable(keep=lambda number: number % 10 == 0 or 30 <= number < 40)
+    items, last_key = query_page(table, {}, 5, key_attributes=('pk', 'sk'))
+    assert numbers(items) == [0, 10, 20, 30, 31]
+    # 1 of 5 kept: the next request evaluates 5x the 4 items still missing, then 3 of 25 kept
+    assert [request['Limit'] for request in table.requests] == [5, 20, 17]
+    # The last response held items past the page; resume after the last one kept
+    assert last_key == {'pk': 'SONG#031', 'sk': 'METADATA'}
+    
+    items, _ = query_page(table, {}, 1, last_key, key_attributes=('pk', 'sk'))
+    assert numbers(items) == [32]
+
+
+def test_requests_are_capped_when_nothing_matches():
+    table = FakeTable(keep=lambda number: False)
+    items, last_key = query_page(table, {}, 20, key_attributes=('pk', 'sk'))
+    assert items == [] and last_key is None
+    assert max(request['Limit'] for request in table.requests) <= pagination.MAX_EVALUATED_PER_QUERY
+
+
+def test_budget_stops_a_sparse_page_early():
+    table = FakeTable(keep=lambda number: number % 50 == 0)
+    budget = ReadBudget(capacity_units=5)
+    items, last_key = query_page(table, {}, 3, budget=budget)
+    assert budget.stopped_by == 'capacity'
+    assert budget.consumed_capacity >= 5 and budget.queries == len(table.requests)
+    assert numbers(items) == [0]
+    # The page can be continued from where the budget ran out
+    assert last_key is not None
+    items, _ = query_page(table, {}, 1, last_key)
+    assert numbers(items) == [50]
+
+
+def test_report_page_records_why_the_page_ended(monkeypatch):
+    emitted = []
+    monkeypatch.setattr(pagination.metrics, 'emit', lambda values, **options: emitted.append((values, options)))
+    budget = ReadBudget()
+    query_page(FakeTable(keep=lambda number: True), {}, 4, budget=budget)
+    pagination.report_page('get_songs_by_artist', 8, [{}] * 4, None, budget)
+    values, options = emitted[0]
+    assert values['PageFillPercent'] == 50.0 and values['QueriesPerPage'] == 1
+    assert options['properties'] == {'requested': 8, 'stopped_by': 'end'}
+
+
+@pytest.mark.parametrize('limit, expected', [('5', 5), ('0', 1), ('500', 100), ('many', 20), (None, 20)])
+def test_limit_is_clamped(limit, expected):
+    assert parse_pagination({'queryStringParameters': {'limit': limit}}, 'songs') == (expected, None)
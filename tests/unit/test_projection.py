@@ -0,0 +1,60 @@
+import pytest
+
+from common.projection import MAX_FIELDS, InvalidFields, Projection
+
+
+def event(**params):
+    return {'queryStringParameters': params or None}
+
+
+def test_fields_become_aliased_projection():
+    projection = Projection.from_event(event(fields='title, name,title,duration'), 'SONG')
+    assert projection.fields == ('title', 'name', 'duration')
+    params = projection.apply({
+        'KeyConditionExpression': '#pk = :pk',
+        'ExpressionAttributeNames': {'#pk': 'pk'}
+    })
+    # Reserved words such as `name` are safe behind the aliases
+    assert params['ProjectionExpression'] == '#f0, #f1, #f2'
+    assert params['ExpressionAttributeNames'] == {'#pk': 'pk', '#f0': 'title', '#f1': 'name', '#f2': 'duration'}
+
+
+def test_apply_leaves_the_query_untouched():
+    query = {'ExpressionAttributeNames': {'#pk': 'pk'}}
+    Projection(['title']).apply(query)
+    assert query == {'ExpressionAttributeNames': {'#pk': 'pk'}}
+    assert Projection().apply(query) is query
+
+
+def test_required_attributes_are_read_and_stripped():
+    projection = Projection(['title'], required=('pk', 'sk', 'title'))
+    assert projection.apply({})['ExpressionAttributeNames'] == {'#f0': 'title', '#f1': 'pk', '#f2': 'sk'}
+    assert projection.strip([{'title': 'Song', 'pk': 'SONG#1', 'sk': 'METADATA'}]) == [{'title': 'Song'}]
+    # Whole items keep their keys
+    assert Projection(None, required=('pk',)).strip([{'pk': 'SONG#1'}]) == [{'pk': 'SONG#1'}]
+
+
+def test_views():
+    assert Projection.from_event(event(), 'SONG').fields is None
+    assert Projection.from_event(event(), 'SONG', default_view='list').fields == Projection.from_event(event(view='list'), 'SONG').fields
+    assert 'artist_name' in Projection.from_event(event(view='list'), 'ALBUM').fields
+    assert Projection.from_event(event(view='detail'), 'ARTIST', default_view='list').fields is None
+
+
+def test_select_projects_cached_items():
+    item = {'title': 'Song', 'duration': 180, 'genre': 'Rock'}
+    assert Projection(['title', 'missing']).select(item) == {'title': 'Song'}
+    assert Projection().select(item) is item
+
+
+@pytest.mark.parametrize('params', [
+    {'fields': 'title,#pk'},
+    {'fields': 'title, a.b'},
+    {'fields': 'x' * 65},
+    {'fields': ' , ,'},
+    {'fields': ','.join(f'field_{number}' for number in range(MAX_FIELDS + 1))},
+    {'view': 'summary'}
+])
+def test_invalid_fields_are_rejected(params):
+    with pytest.raises(InvalidFields):
+        Projection.from_event(event(**params), 'SONG')
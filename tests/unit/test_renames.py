@@ -0,0 +1,116 @@
+import importlib.util
+import os
+
+import pytest
+
+from common import clients, sharding, wire
+
+# Stream handlers are deployed from lambda/streams, outside the layer
+_spec = importlib.util.spec_from_file_location(
+    'renames', os.path.join(os.path.dirname(__file__), '..', '..', 'lambda', 'streams', 'renames.py')
+)
+renames = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(renames)
+
+ARTIST_ID = 'artist-1'
+
+
+@pytest.fixture(autouse=True)
+def shard_counts():
+    sharding._subscriber_shards.clear()
+    yield
+    sharding._subscriber_shards.clear()
+
+
+def rename(old_name, new_name, event_id='event-1', sk='METADATA'):
+    artist = {'pk': f'ARTIST#{ARTIST_ID}', 'sk': sk, 'entity_type': 'ARTIST', 'artist_id': ARTIST_ID}
+    return {
+        'eventID': event_id,
+        'eventName': 'MODIFY',
+        'dynamodb': {
+            'Keys': wire.to_wire({'pk': artist['pk'], 'sk': sk}),
+            'OldImage': wire.to_wire({**artist, 'name': old_name}),
+            'NewImage': wire.to_wire({**artist, 'name': new_name}),
+            'SequenceNumber': '1'
+        }
+    }
+
+
+def add_catalog(table, songs=3, albums=2, current=()):
+    """The artist's songs and albums; those in `current` already carry the new name."""
+    for entity_type, count in (('SONG', songs), ('ALBUM', albums)):
+        for number in range(count):
+            pk = f'{entity_type}#{entity_type.lower()}-{number}'
+            table.put_item(Item={
+                'pk': pk,
+                'sk': 'METADATA',
+                'entity_type': entity_type,
+                'artist_id': ARTIST_ID,
+                'artist_name': 'New' if pk in current else 'Old',
+                'created_at': f'2024-01-01T00:00:0{number}'
+            })
+
+
+def subscribe(count, shards=1):
+    if shards > 1:
+        clients.table().put_item(Item={**sharding.subscriber_shards_key(ARTIST_ID), 'shards': shards})
+    with clients.subscriptions_table().batch_writer() as batch:
+        for number in range(count):
+            user_id = f'user-{number:03d}'
+            batch.put_item(Item={
+                'user_id': user_id,
+                'artist_id': ARTIST_ID,
+                'artist_name': 'Old',
+                'artist_shard': sharding.subscriber_shard(ARTIST_ID, user_id, shards),
+                'subscription_date': '2024-01-01T00:00:00'
+            })
+
+
+def updated(result):
+    return {counts['target']: counts['updated'] for counts in result['results']}
+
+
+def artist_names(table):
+    return {item['artist_name'] for item in table.scan()['Items'] if 'artist_name' in item}
+
+
+def test_only_stale_copies_are_rewritten(tables):
+    add_catalog(tables, current=('SONG#song-0',))
+    subscribe(5)
+    result = renames.handler({'Records': [rename('Old', 'New')]}, None)
+    assert result['renames'] == 1
+    assert updated(result) == {'songs': 2, 'albums': 2, 'subscriptions': 5}
+    assert artist_names(tables) == artist_names(clients.subscriptions_table()) == {'New'}
+
+
+def test_retried_batch_writes_nothing(tables):
+    add_catalog(tables)
+    subscribe(5)
+    event = {'Records': [rename('Old', 'New')]}
+    renames.handler(event, None)
+    result = renames.handler(event, None)
+    assert updated(result) == {'songs': 0, 'albums': 0, 'subscriptions': 0}
+
+
+def test_last_rename_in_a_batch_wins(tables):
+    add_catalog(tables)
+    result = renames.handler({'Records': [rename('Old', 'Interim'), rename('Interim', 'New', 'event-2')]}, None)
+    assert result['renames'] == 1
+    assert artist_names(tables) == {'New'}
+
+
+def test_records_without_a_rename_are_skipped(tables):
+    add_catalog(tables)
+    records = [rename('Old', 'Old'), rename('Old', 'New', sk='SUBSCRIBER_SHARDS')]
+    assert renames.handler({'Records': records}, None) == {'renames': 0, 'results': []}
+    assert artist_names(tables) == {'Old'}
+
+
+@pytest.mark.parametrize('sharded', [False, True])
+def test_subscriptions_on_every_subscriber_shard_are_updated(tables, monkeypatch, sharded):
+    if sharded:
+        monkeypatch.setenv(sharding.SHARDED_SUBSCRIPTIONS_ENV, 'true')
+    subscribe(120, shards=8)
+    result = renames.handler({'Records': [rename('Old', 'New')]}, None)
+    assert updated(result)['subscriptions'] == 120
+    assert artist_names(clients.subscriptions_table()) == {'New'}
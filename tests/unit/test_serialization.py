@@ -0,0 +1,40 @@
+import json
+from decimal import Decimal
+
+from boto3.dynamodb.types import Binary
+
+from common.serialization import RawJSON, dumps
+
+
+def test_decimals_keep_integers_integral():
+    body = json.loads(dumps({'duration': Decimal('180'), 'rating': Decimal('4.5'), 'plays': Decimal('1E+3')}))
+    assert body == {'duration': 180, 'rating': 4.5, 'plays': 1000}
+    assert isinstance(body['duration'], int) and isinstance(body['plays'], int)
+
+
+def test_nested_values_are_encoded():
+    item = {
+        'tags': {'rock', 'indie'},
+        'counts': {Decimal('2'), Decimal('1')},
+        'cover': Binary(b'\x89PNG'),
+        'raw': b'abc',
+        'tracks': [{'number': Decimal('1')}]
+    }
+    assert json.loads(dumps(item)) == {
+        'tags': ['indie', 'rock'],
+        'counts': [1, 2],
+        'cover': 'iVBORw==',
+        'raw': 'YWJj',
+        'tracks': [{'number': 1}]
+    }
+
+
+def test_sets_serialize_identically_whatever_their_order():
+    assert dumps({'tags': {'b', 'a', 'c'}}) == dumps({'tags': {'c', 'a', 'b'}})
+
+
+def test_raw_json_is_emitted_verbatim():
+    text = dumps({'count': Decimal('2'), 'items': RawJSON('[{"a": 1}]')})
+    assert text == '{"count": 2, "items": [{"a": 1}]}'
+    # Nested, it is only a string
+    assert json.loads(dumps({'body': {'items': RawJSON('[]')}})) == {'body': {'items': '[]'}}
@@ -0,0 +1,179 @@
+import threading
+
+import pytest
+
+from common import clients, cursor, sharding, signing
+from common.projection import Projection
+
+SONG_COUNT = 137
+
+
+class FakeIndexClient:
+    """Low-level client serving Query on one GSI from wire-format items."""
+    
+    def __init__(self, items):
+        self.items = items
+        self.queries = []
+        self.lock = threading.Lock()
+    
+    def query(self, IndexName, KeyConditionExpression, ExpressionAttributeValues, Limit, ScanIndexForward,
+              ExclusiveStartKey=None, **params):
+        with self.lock:
+            self.queries.append(IndexName)
+        attribute = KeyConditionExpression.split(' ', 1)[0]
+        value = ExpressionAttributeValues[':shard']['S']
+        matching = sorted(
+            (item for item in self.items if item.get(attribute, {}).get('S') == value),
+            key=lambda item: (item['created_at']['S'], item['pk']['S']),
+            reverse=not ScanIndexForward
+        )
+        start = 0
+        if ExclusiveStartKey:
+            start = next(position for position, item in enumerate(matching) if item['pk'] == ExclusiveStartKey['pk']) + 1
+        page = matching[start:start + Limit]
+        response = {'Items': page}
+        if start + Limit < len(matching):
+            last = page[-1]
+            response['LastEvaluatedKey'] = {name: last[name] for name in ('pk', 'sk', attribute, 'created_at')}
+        return response
+
+
+def song(number):
+    song_id = f'song-{number}'
+    return {
+        'pk': {'S': f'SONG#{song_id}'},
+        'sk': {'S': 'METADATA'},
+        'entity_type': {'S': 'SONG'},
+        'entity_shard': {'S': sharding.shard_for('SONG', song_id)},
+        'title': {'S': f'Song {number}'},
+        # A few songs share a created_at, as concurrent inserts would
+        'created_at': {'S': f'2024-01-01T00:{number // 2:04d}'}
+    }
+
+
+@pytest.fixture
+def index(monkeypatch):
+    monkeypatch.setenv('TABLE_NAME', 'catalog')
+    monkeypatch.setenv('SHARDED_LISTINGS', 'true')
+    fake = FakeIndexClient([song(number) for number in range(SONG_COUNT)] + [
+        # Other entity types share the index
+        {'pk': {'S': 'ALBUM#1'}, 'sk': {'S': 'METADATA'}, 'entity_type': {'S': 'ALBUM'},
+         'entity_shard': {'S': 'ALBUM#1'}, 'created_at': {'S': '2024-01-01T00:0001'}}
+    ])
+    monkeypatch.setattr(clients, 'client', lambda service_name: fake)
+    return fake
+
+
+@pytest.fixture(autouse=True)
+def cursor_key(monkeypatch):
+    monkeypatch.delenv('CURSOR_SECRET_ARN', raising=False)
+    monkeypatch.setenv('CURSOR_SECRET', 'test-key')
+    signing._cached_keys.clear()
+
+
+def list_all(limit, scan_forward=False):
+    pages, position = [], None
+    while True:
+        items, position = sharding.query_sharded('SONG', limit, position, scan_forward=scan_forward)
+        pages.append(items)
+        if position is None:
+            return pages
+        # Cursors go through the client as opaque tokens
+        position = cursor.decode(cursor.encode(position, 'songs'), 'songs')
+
+
+def test_shard_for_is_stable_and_in_range():
+    assert sharding.shard_for('SONG', 'abc') == sharding.shard_for('SONG', 'abc')
+    assert sharding.shard_keys('SONG') == [f'SONG#{index}' for index in range(sharding.ENTITY_SHARD_COUNT)]
+    shards = {sharding.shard_for('SONG', f'song-{number}') for number in range(SONG_COUNT)}
+    assert shards <= set(sharding.shard_keys('SONG'))
+    assert len(shards) == sharding.ENTITY_SHARD_COUNT
+
+
+@pytest.mark.parametrize('limit', [1, 7, 20, 100, 500])
+def test_pages_cover_every_item_once_in_global_order(index, limit):
+    pages = list_all(limit)
+    items = [item for page in pages for item in page]
+    assert all(len(page) == limit for page in pages[:-1])
+    assert sorted(item['pk']['S'] for item in items) == sorted(f'SONG#song-{number}' for number in range(SONG_COUNT))
+    created = [item['created_at']['S'] for item in items]
+    assert created == sorted(created, reverse=True)
+    assert set(index.queries) == {'entity-shard-index'}
+
+
+def test_scan_forward_lists_oldest_first(index):
+    items = [item for page in list_all(30, scan_forward=True) for item in page]
+    created = [item['created_at']['S'] for item in items]
+    assert len(items) == SONG_COUNT
+    assert created == sorted(created)
+
+
+def test_page_costs_about_one_query_per_shard(index):
+    items, position = sharding.query_sharded('SONG', 20)
+    assert len(items) == 20
+    assert len(index.queries) <= sharding.ENTITY_SHARD_COUNT + 2
+    # Shards are resumed from their positions; untouched ones restart
+    assert set(position) <= set(sharding.shard_keys('SONG'))
+
+
+def test_cursor_of_another_entity_type_is_ignored(index):
+    items, _ = sharding.query_sharded('SONG', 5, {'ALBUM#1': None})
+    assert items == []
+
+
+def test_projection_must_include_the_index_key(index):
+    projection = Projection.from_event({'queryStringParameters': {'fields': 'title'}}, 'SONG', required=sharding.listing_index_key())
+    items, position = sharding.query_sharded('SONG', 10, projection=projection)
+    assert len(items) == 10
+    assert all(set(shard_position) == set(sharding.SHARD_INDEX_KEY) for shard_position in position.values() if shard_position)
+
+
+def test_entity_type_index_until_sharded_listings(index, monkeypatch):
+    monkeypatch.delenv('SHARDED_LISTINGS')
+    pages = list_all(25)
+    items = [item for page in pages for item in page]
+    assert len(items) == SONG_COUNT
+    created = [item['created_at']['S'] for item in items]
+    assert created == sorted(created, reverse=True)
+    assert set(index.queries) == {'entity-type-index'}
+    assert sharding.listing_index_key() == sharding.TYPE_INDEX_KEY
+    assert sharding.listing_scope('songs') != 'songs'
+
+
+@pytest.fixture
+def subscriber_shards():
+    sharding._subscriber_shards.clear()
+    yield
+    sharding._subscriber_shards.clear()
+
+
+def test_subscriber_shard_zero_is_the_bare_artist_id():
+    shards = {sharding.subscriber_shard('artist-1', f'user-{number}', 8) for number in range(200)}
+    assert shards == set(sharding.subscriber_shard_keys('artist-1', 8))
+    assert 'artist-1' in shards
+    assert sharding.subscriber_shard('artist-1', 'user-1', 1) == 'artist-1'
+
+
+def test_shard_count_grows_in_powers_of_two_up_to_the_cap():
+    per_shard = sharding.SUBSCRIBERS_PER_SHARD
+    assert sharding.subscriber_shards_for(per_shard) == 1
+    assert sharding.subscriber_shards_for(per_shard + 1) == 2
+    assert sharding.subscriber_shards_for(5 * per_shard) == 8
+    assert sharding.subscriber_shards_for(10 ** 9) == sharding.MAX_SUBSCRIBER_SHARDS
+
+
+def test_shard_count_never_shrinks(tables, subscriber_shards):
+    per_shard = sharding.SUBSCRIBERS_PER_SHARD
+    assert sharding.subscriber_shard_count('artist-1') == 1
+    assert not sharding.grow_subscriber_shards('artist-1', per_shard)
+    assert sharding.grow_subscriber_shards('artist-1', 3 * per_shard)
+    assert sharding.subscriber_shard_count('artist-1') == 4
+    assert not sharding.grow_subscriber_shards('artist-1', 2 * per_shard)
+    assert sharding.subscriber_shard_count('artist-1', consistent=True) == 4
+
+
+def test_writers_may_use_a_cached_shard_count(tables, subscriber_shards):
+    assert sharding.subscriber_shard_count('artist-1') == 1
+    tables.put_item(Item={**sharding.subscriber_shards_key('artist-1'), 'shards': 4})
+    assert sharding.subscriber_shard_count('artist-1') == 1
+    assert sharding.subscriber_shard_count('artist-1', consistent=True) == 4
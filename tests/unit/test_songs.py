@@ -0,0 +1,92 @@
+import base64
+import importlib.util
+import json
+import os
+
+import pytest
+
+from common import cache, clients
+
+
+def _load(name, path):
+    # Handlers are deployed from their own directories, outside the layer
+    spec = importlib.util.spec_from_file_location(name, os.path.join(os.path.dirname(__file__), '..', '..', 'lambda', *path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+create_song = _load('create_song', ('songs', 'create.py'))
+delete_song = _load('delete_song', ('songs', 'delete.py'))
+
+ADMIN = {'authorizer': {'claims': {'cognito:groups': 'admin'}}}
+
+
+@pytest.fixture(autouse=True)
+def metadata_cache(monkeypatch):
+    monkeypatch.setattr(cache, '_cache', None)
+
+
+@pytest.fixture
+def catalog(tables, bucket):
+    tables.put_item(Item={'pk': 'ARTIST#artist-1', 'sk': 'METADATA', 'entity_type': 'ARTIST', 'name': 'Artist'})
+    tables.put_item(Item={'pk': 'ALBUM#album-1', 'sk': 'METADATA', 'entity_type': 'ALBUM', 'title': 'Album', 'artist_id': 'artist-1'})
+    return tables
+
+
+def create(**fields):
+    body = {'title': 'Song', 'artist_id': 'artist-1', 'album_id': 'album-1', 'duration': 180, **fields}
+    response = create_song.handler({'body': json.dumps(body), 'requestContext': ADMIN}, None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+def delete(song_id):
+    return delete_song.handler({'pathParameters': {'songId': song_id}, 'requestContext': ADMIN}, None)
+
+
+def audio_keys(bucket):
+    return [item['Key'] for item in clients.s3().list_objects_v2(Bucket=bucket).get('Contents', [])]
+
+
+def songs(table):
+    return [item for item in table.scan()['Items'] if item['pk'].startswith('SONG#')]
+
+
+def test_create_saves_the_song_and_its_audio(catalog, bucket):
+    status, body = create(audio_file=base64.b64encode(b'audio').decode())
+    assert status == 201
+    song = catalog.get_item(Key={'pk': f"SONG#{body['song']['song_id']}", 'sk': 'METADATA'})['Item']
+    assert song['artist_name'] == 'Artist'
+    assert audio_keys(bucket) == [song['s3_key']]
+
+
+@pytest.mark.parametrize('field, message', [('album_id', 'Album not found'), ('artist_id', 'Artist not found')])
+def test_create_with_a_missing_parent_returns_404(catalog, field, message):
+    status, body = create(**{field: 'missing'})
+    assert (status, body['error']) == (404, message)
+    assert songs(catalog) == []
+
+
+def test_parent_deleted_after_it_was_cached_returns_404_and_removes_the_audio(catalog, bucket):
+    # The album is still in this container's cache when it is deleted
+    cache.get_metadata('ALBUM', 'album-1')
+    catalog.delete_item(Key={'pk': 'ALBUM#album-1', 'sk': 'METADATA'})
+    status, body = create(audio_file=base64.b64encode(b'audio').decode())
+    assert (status, body['error']) == (404, 'Album not found')
+    assert songs(catalog) == []
+    assert audio_keys(bucket) == []
+    # The stale copy is dropped, so the next request fails before uploading
+    assert cache.get_metadata('ALBUM', 'album-1') is None
+
+
+def test_delete_removes_the_song_and_its_audio(catalog, bucket):
+    _, body = create(audio_file=base64.b64encode(b'audio').decode())
+    assert delete(body['song']['song_id'])['statusCode'] == 204
+    assert songs(catalog) == []
+    assert audio_keys(bucket) == []
+
+
+def test_delete_of_a_missing_song_returns_404(catalog):
+    response = delete('missing')
+    assert response['statusCode'] == 404
+    assert json.loads(response['body'])['message'] == 'Song not found'
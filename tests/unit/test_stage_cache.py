@@ -0,0 +1,49 @@
+import pytest
+
+from common import signing, stage_cache
+
+PATH = '/songs/song-1'
+
+
+@pytest.fixture(autouse=True)
+def refresh_key(monkeypatch):
+    monkeypatch.setattr(signing, 'keys', lambda secret_arn_env, fallback_env=None: [b'refresh-key'])
+
+
+def request(path=PATH, **headers):
+    return {'path': path, 'headers': headers}
+
+
+def test_cache_control_alone_does_not_bypass():
+    assert not stage_cache.bypass_requested(request(**{'Cache-Control': 'no-cache'}))
+    assert not stage_cache.bypass_requested(request(**{'cache-control': 'max-age=0'}))
+    assert not stage_cache.bypass_requested({'path': PATH})
+
+
+def test_refresh_token_bypasses_for_its_path_only():
+    token = stage_cache.refresh_token(PATH)
+    assert stage_cache.bypass_requested(request(**{'x-cache-refresh': token}))
+    assert not stage_cache.bypass_requested(request('/songs/song-2', **{'X-Cache-Refresh': token}))
+
+
+def test_expired_or_forged_token_is_rejected(monkeypatch):
+    token = stage_cache.refresh_token(PATH)
+    expires, _, mac = token.partition('.')
+    # A later expiry invalidates the MAC
+    assert not stage_cache.bypass_requested(request(**{'X-Cache-Refresh': f'{int(expires) + 3600}.{mac}'}))
+    assert not stage_cache.bypass_requested(request(**{'X-Cache-Refresh': 'not-a-token'}))
+    
+    now = stage_cache.time.time()
+    monkeypatch.setattr(stage_cache.time, 'time', lambda: now + stage_cache.REFRESH_TOKEN_SECONDS + 1)
+    assert not stage_cache.bypass_requested(request(**{'X-Cache-Refresh': token}))
+
+
+def test_token_of_another_key_is_rejected(monkeypatch):
+    token = stage_cache.refresh_token(PATH)
+    monkeypatch.setattr(signing, 'keys', lambda secret_arn_env, fallback_env=None: [b'other-key'])
+    assert not stage_cache.bypass_requested(request(**{'X-Cache-Refresh': token}))
+
+
+def test_no_token_without_a_refresh_key(monkeypatch):
+    monkeypatch.setattr(signing, 'keys', lambda secret_arn_env, fallback_env=None: [])
+    assert stage_cache.refresh_token(PATH) is None
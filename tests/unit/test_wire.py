@@ -0,0 +1,50 @@
+import json
+from decimal import Decimal
+
+import pytest
+from boto3.dynamodb.types import Binary
+
+from common import wire
+from common.serialization import dumps
+
+ITEM = {
+    'pk': 'SONG#1',
+    'title': 'Café "Live"',
+    'duration': Decimal('180'),
+    'rating': Decimal('4.5'),
+    'explicit': False,
+    'lyrics': None,
+    'tags': {'rock', 'indie'},
+    'plays': {Decimal('10'), Decimal('9'), Decimal('1.5')},
+    'cover': Binary(b'\x89PNG'),
+    'credits': [{'role': 'producer', 'share': Decimal('0.25')}, 'mixing']
+}
+
+
+def test_rendering_matches_the_resource_path():
+    wire_item = wire.to_wire(ITEM)
+    assert json.loads(wire.render_items([wire_item, wire_item])) == [json.loads(dumps(ITEM))] * 2
+
+
+def test_rendered_items_are_embedded_verbatim():
+    items = wire.render_items([wire.to_wire({'title': 'Song'})])
+    assert dumps({'songs': items, 'count': 1}) == '{"songs": [{"title": "Song"}], "count": 1}'
+    assert wire.render_items([]) == '[]'
+
+
+def test_sets_are_rendered_in_a_stable_order():
+    rendered = wire.render_value({'NS': ['10', '9', '1.5']})
+    assert rendered == '[1.5, 9, 10]'
+    assert wire.render_value({'SS': ['b', 'a']}) == '["a", "b"]'
+    assert wire.render_value({'BS': [b'b', b'a']}) == '["YQ==", "Yg=="]'
+
+
+def test_keys_round_trip():
+    key = {'pk': 'SONG#1', 'sk': 'METADATA', 'created_at': '2024-01-01T00:00:00'}
+    assert wire.from_wire(wire.to_wire(key)) == key
+    assert wire.to_wire(None) is None and wire.from_wire(None) is None
+
+
+def test_unknown_types_are_rejected():
+    with pytest.raises(ValueError):
+        wire.render_value({'X': 'value'})